@@ -11,7 +11,10 @@
 # Packages
 import numpy as np
 from Game_bitboard import Game
-import random
+from Rollout_bitboard import BatchRollout
+from search_control import run_search
+from rng import RandomStreams
+import config
 # ============================================================================ #
 
 
@@ -45,9 +48,23 @@ class Node:
 # A class representing a mcts
 class MCTS:
     # ---------------------------------------------------------------------------- #
-    # Constructs a tree
-    def __init__(self):
+    # Constructs a tree. With rollouts_per_leaf > 1 a leaf is evaluated by the mean result of many playouts,
+    # and with rollout_all_children all the children of the expanded leaf are rolled out in one batch.
+    # Both use the vectorized playouts of Rollout_bitboard.py. Defaults are read from config.
+    # rng : RandomStreams of the rollouts and tie breaks (see rng.py), new streams from the OS by default
+    def __init__(self, rollouts_per_leaf=None, rollout_all_children=None, rng=None):
         self.root = None
+        if rng is None:
+            rng = RandomStreams()
+        self.rng = rng
+
+        if rollouts_per_leaf is None:
+            rollouts_per_leaf = config.rollouts_per_leaf
+        if rollout_all_children is None:
+            rollout_all_children = config.rollout_all_children
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.rollout_all_children = rollout_all_children
+        self.batch_rollout = BatchRollout(rng.np)
 
     # ---------------------------------------------------------------------------- #
     # Builds a node from the state and adds it to the tree
@@ -69,7 +86,7 @@ class MCTS:
                 values = np.empty(len(current.children))
                 values[:] = np.asarray([evaluator(node, c_uct) for node in current.children])
                 posmax = np.where(values == np.max(values))[0]
-                imax= posmax[int(random.random() * len(posmax))]
+                imax= posmax[int(self.rng.py.random() * len(posmax))]
                 # Moves the current to the next
                 current = current.children[imax]
 
@@ -101,24 +118,24 @@ class MCTS:
                 if usecounter:
                     can_win, where_win, can_lose, where_lose = gameloc.iscritical()
                     if can_win:
-                        move = where_win[int(random.random() * len(where_win))]
+                        move = where_win[int(self.rng.py.random() * len(where_win))]
                         gameloc.takestep(move)
                         allowedmoves = gameloc.allowed_moves()
                         gameover,_ = gameloc.gameover()
 
                     elif can_lose:
-                        imax = where_lose[int(random.random() * len(where_lose))]
+                        imax = where_lose[int(self.rng.py.random() * len(where_lose))]
                         gameloc.takestep(imax)
                         allowedmoves = gameloc.allowed_moves()
                         gameover,_ = gameloc.gameover()
 
                     else:
-                        randommove = allowedmoves[int(random.random() * len(allowedmoves))]
+                        randommove = allowedmoves[int(self.rng.py.random() * len(allowedmoves))]
                         gameloc.takestep(randommove)
                         allowedmoves = gameloc.allowed_moves()
                         gameover,_ = gameloc.gameover()
                 else:
-                    randommove = allowedmoves[int(random.random() * len(allowedmoves))]
+                    randommove = allowedmoves[int(self.rng.py.random() * len(allowedmoves))]
                     gameloc.takestep(randommove)
                     allowedmoves = gameloc.allowed_moves()
                     gameover, _ = gameloc.gameover()
@@ -127,6 +144,18 @@ class MCTS:
 
         return winner
 
+    # ---------------------------------------------------------------------------- #
+    # Makes self.rollouts_per_leaf vectorized rollouts from each of the given nodes at once
+    # and returns, for each node, the average winner (between -1 and 1)
+    def batch_rollout_policy(self, nodes, usecounter):
+        k = self.rollouts_per_leaf
+        yellow = np.repeat(np.array([node.state[0] for node in nodes], dtype=np.uint64), k)
+        red = np.repeat(np.array([node.state[1] for node in nodes], dtype=np.uint64), k)
+        player_turn = np.repeat(np.array([node.state[2] for node in nodes], dtype=np.int64), k)
+
+        winners = self.batch_rollout.play(yellow, red, player_turn, usecounter)
+        return winners.reshape(len(nodes), k).mean(axis=1)
+
     # ---------------------------------------------------------------------------- #
     # Back propagates values after simulations
     def regular_back_prop(self, child, result, whoplayatleaf):
@@ -194,15 +223,34 @@ class MCTS:
             whoplay_at_leaf = int(leaf.state[2])
             self.expand_all(leaf)
 
-            #rollout only once, and only one of the child
-            index = random.randint(0, len(leaf.children) - 1)
-            child = leaf.children[index]
-            result = self.default_rollout_policy(child, usecounter)
+            if self.rollout_all_children:
+                #rollout every child in the same batch, and update each of them and their ancestors
+                results = self.batch_rollout_policy(leaf.children, usecounter)
+                for child, result in zip(leaf.children, results):
+                    self.regular_back_prop(child, result, whoplay_at_leaf)
+
+            else:
+                #rollout only one of the child
+                index = self.rng.py.randint(0, len(leaf.children) - 1)
+                child = leaf.children[index]
+                if self.rollouts_per_leaf > 1:
+                    result = self.batch_rollout_policy([child], usecounter)[0]
+                else:
+                    result = self.default_rollout_policy(child, usecounter)
 
-            #update newly added child and its ancestors
-            self.regular_back_prop(child, result, whoplay_at_leaf)
+                #update newly added child and its ancestors
+                self.regular_back_prop(child, result, whoplay_at_leaf)
 
         else:
             self.back_prop_terminal(leaf)
 
-# ============================================================================ #
\ No newline at end of file
+    # ---------------------------------------------------------------------------- #
+    # anytime search from node : stops after max_sims sims or max_time seconds, or earlier when the move
+    # is forced or decided (see search_control.py). Returns a SearchReport with sims done and stop reason
+    def search(self, node, evaluator, c_uct, usecounter, max_sims=None, max_time=None, stop_on_forced=True):
+        # a sim rolling out all the children of a leaf adds up to L visits below one child of the root
+        visits_per_sim = config.L if self.rollout_all_children else 1
+        return run_search(lambda: self.simulate(node, evaluator, c_uct, usecounter), node, max_sims, max_time,
+                          visits_per_sim, stop_on_forced, self.rng.np)
+
+# ============================================================================ #
@@ -11,8 +11,13 @@
 # Packages
 import numpy as np
 from Game_bitboard import Game
-import random
+from search_control import run_search
+from search_stats import SearchStats
+from rng import RandomStreams
+import tracing
+import time
 import config
+from numpy_net import as_numpy
 # ============================================================================ #
 
 # =============================== CLASS: NODE ================================ #
@@ -47,11 +52,19 @@ class Node:
 class MCTS_NN:
 
     # ---------------------------------------------------------------------------- #
-    def __init__(self, player, use_dirichlet):
+    # stats : SearchStats filled by the sims, a new one if config.search_stats, else None (no instrumentation)
+    # rng : RandomStreams of the tie breaks and dirichlet noise (see rng.py), new streams from the OS by default
+    def __init__(self, player, use_dirichlet, stats=None, rng=None):
         self.root = None
         self.player=player
         self.use_dirichlet = use_dirichlet
         self.usecounter= config.use_counter_in_mcts_nn
+        if stats is None and config.search_stats:
+            stats = SearchStats()
+        self.stats = stats
+        if rng is None:
+            rng = RandomStreams()
+        self.rng = rng
 
     # ---------------------------------------------------------------------------- #
     def createNode(self, state, move=None, parent=None):
@@ -67,8 +80,6 @@ class MCTS_NN:
     # ---------------------------------------------------------------------------- #
     def selection(self, node, cpuct):
 
-        random.seed()
-
         # if the provided node is already a leaf (it shall happen only at the first sim)
         if node.isLeaf():
             return node, node.isterminal()
@@ -92,7 +103,7 @@ class MCTS_NN:
                     if len(where_max) == 1:
                         current = current.children[where_max[0]]
                     else:
-                        imax = where_max[int(random.random() * len(where_max))]
+                        imax = where_max[int(self.rng.py.random() * len(where_max))]
                         current = current.children[imax]
 
 
@@ -111,7 +122,6 @@ class MCTS_NN:
     def eval_leaf(self, leaf):
 
         self.player.eval()
-        np.random.seed()
 
         if leaf.isterminal() == 0:
 
@@ -119,9 +129,10 @@ class MCTS_NN:
             flat = game.state_flattener(leaf.state)
 
             #NN call
-            reward, P = self.player.forward(flat)
-            proba_children = P.detach().numpy()[0]
-            NN_q_value = reward.detach().numpy()[0][0]
+            with tracing.detail_span('forward', 'nn'):
+                reward, P = self.player.forward(flat)
+            proba_children = as_numpy(P)[0]
+            NN_q_value = as_numpy(reward)[0][0]
 
 
             if self.use_dirichlet and leaf.parent is None :
@@ -130,7 +141,7 @@ class MCTS_NN:
                 epsilon = config.epsilon_dir
 
                 dirichlet_input = [alpha for _ in range(config.L)]
-                dirichlet_list = np.random.dirichlet(dirichlet_input)
+                dirichlet_list = self.rng.np.dirichlet(dirichlet_input)
                 proba_children = (1 - epsilon) * probs + epsilon * dirichlet_list
 
             leaf.W = leaf.W  - NN_q_value
@@ -189,14 +200,65 @@ class MCTS_NN:
     # ---------------------------------------------------------------------------- #
     def simulate(self, node, cpuct):
 
+        if self.stats is not None:
+            return self.simulate_instrumented(node, cpuct)
+
+        leaf, isleafterminal = self.selection(node, cpuct)
+
+        if isleafterminal == 0:
+            self.expand_all(leaf)
+
+        self.eval_leaf(leaf)
+
+        self.backFill(leaf)
+
+    # ---------------------------------------------------------------------------- #
+    # same sim, timing each phase into self.stats
+    def simulate_instrumented(self, node, cpuct):
+        stats = self.stats
+        clock = time.perf_counter
+
+        t0 = clock()
         leaf, isleafterminal = self.selection(node, cpuct)
+        t1 = clock()
+        stats.add_time('selection', t1 - t0)
 
         if isleafterminal == 0:
             self.expand_all(leaf)
+            t0 = clock()
+            stats.add_time('expand', t0 - t1)
+            stats.nodes_created += len(leaf.children)
+            t1 = t0
 
         self.eval_leaf(leaf)
+        t0 = clock()
+        stats.add_time('eval', t0 - t1)
+        if isleafterminal == 0:
+            # one state per forward pass, unless the player batches the leaves of several searches
+            # (inference.BatchedEvaluator and its clients give the size of the batch)
+            stats.record_batch(getattr(self.player, 'last_batch_size', None) or 1)
+        else:
+            stats.terminal_leaves += 1
 
         self.backFill(leaf)
+        stats.add_time('backfill', clock() - t0)
+
+        depth = 0
+        current = leaf
+        while current is not node:
+            current = current.parent
+            depth += 1
+        stats.sims += 1
+        stats.depth_total += depth
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+
+    # ---------------------------------------------------------------------------- #
+    # anytime search from node : stops after max_sims sims or max_time seconds, or earlier when the move
+    # is forced or decided (see search_control.py). Returns a SearchReport with sims done and stop reason
+    def search(self, node, cpuct, max_sims=None, max_time=None, stop_on_forced=True):
+        return run_search(lambda: self.simulate(node, cpuct), node, max_sims, max_time,
+                          stop_on_forced=stop_on_forced, rng=self.rng.np)
 
     # ---------------------------------------------------------------------------- #
 
@@ -207,7 +269,7 @@ class MCTS_NN:
         can_win, wherewin, can_lose, wherelose = game.iscritical()
 
         if can_win:
-            i_win = wherewin[int(random.random() * len(wherewin))]
+            i_win = wherewin[int(self.rng.py.random() * len(wherewin))]
             # get actual pos in children of child with this column index
             for child in current.children:
                 child_col=game.convert_move_to_col_index(child.move)
@@ -215,7 +277,7 @@ class MCTS_NN:
                     current = child
 
         elif can_lose:
-            i_counter_lose = wherelose[int(random.random() * len(wherelose))]
+            i_counter_lose = wherelose[int(self.rng.py.random() * len(wherelose))]
             for child in current.children:
                 child_col=game.convert_move_to_col_index(child.move)
                 if child_col == i_counter_lose:
@@ -232,7 +294,7 @@ class MCTS_NN:
             if len(where_max) == 1:
                 current = current.children[where_max[0]]
             else:
-                imax = where_max[int(random.random() * len(where_max))]
+                imax = where_max[int(self.rng.py.random() * len(where_max))]
                 current = current.children[imax]
 
         return current
@@ -10,8 +10,9 @@
 # Packages
 import numpy as np
 from Game3D import Game3D
-import random
+from rng import RandomStreams
 import config3d
+from numpy_net import as_numpy
 # ============================================================================ #
 
 # =============================== CLASS: NODE3D ================================ #
@@ -43,11 +44,13 @@ class Node3D:
 class MCTS_NN3D:
 
     # ---------------------------------------------------------------------------- #
-    def __init__(self, player, use_dirichlet):
+    def __init__(self, player, use_dirichlet, rng=None):
         self.root = None
         self.player = player
         self.use_dirichlet = use_dirichlet
         self.usecounter = config3d.use_counter_in_mcts_nn
+        # random streams of the tie breaks and dirichlet noise (see rng.py)
+        self.rng = RandomStreams() if rng is None else rng
 
     # ---------------------------------------------------------------------------- #
     def createNode(self, game_state, move=None, parent=None):
@@ -57,14 +60,12 @@ class MCTS_NN3D:
     # ---------------------------------------------------------------------------- #
     def PUCT(self, child, cpuct):
         """PUCT formula for 3D Connect 4"""
-        move_index = self.game_state.get_move_index(child.move[0], child.move[1])
+        move_index = child.parent.game_state.get_move_index(child.move[0], child.move[1])
         return child.Q + cpuct * child.parent.proba_children[move_index] * np.sqrt(child.parent.N) / (1 + child.N)
 
     # ---------------------------------------------------------------------------- #
     def selection(self, node, cpuct):
         """Selection phase of MCTS for 3D"""
-        random.seed()
-
         # if the provided node is already a leaf
         if node.isLeaf():
             return node, node.isterminal()
@@ -87,7 +88,7 @@ class MCTS_NN3D:
                     if len(where_max) == 1:
                         current = current.children[where_max[0]]
                     else:
-                        imax = where_max[int(random.random() * len(where_max))]
+                        imax = where_max[int(self.rng.py.random() * len(where_max))]
                         current = current.children[imax]
 
         return current, current.isterminal()
@@ -168,14 +169,14 @@ class MCTS_NN3D:
             policy = self.add_dirichlet_noise(policy, node.game_state.allowed_moves())
         
         # Store policy probabilities
-        node.proba_children = policy.detach().numpy().flatten()
+        node.proba_children = as_numpy(policy).flatten()
         
         return q_value.item()
 
     # ---------------------------------------------------------------------------- #
     def add_dirichlet_noise(self, policy, allowed_moves):
         """Add Dirichlet noise to policy for exploration"""
-        noise = np.random.dirichlet([config3d.alpha_dir] * len(allowed_moves))
+        noise = self.rng.np.dirichlet([config3d.alpha_dir] * len(allowed_moves))
         
         # Create mask for allowed moves
         mask = np.zeros(config3d.OUTPUT_SIZE)
@@ -184,7 +185,7 @@ class MCTS_NN3D:
             mask[move_index] = 1
         
         # Apply noise only to allowed moves
-        policy_np = policy.detach().numpy().flatten()
+        policy_np = as_numpy(policy).flatten()
         noise_full = np.zeros(config3d.OUTPUT_SIZE)
         
         allowed_indices = [Game3D().get_move_index(move[0], move[1]) for move in allowed_moves]
@@ -199,7 +200,7 @@ class MCTS_NN3D:
         if np.sum(policy_np) > 0:
             policy_np = policy_np / np.sum(policy_np)
         
-        return torch.FloatTensor(policy_np).unsqueeze(0)
+        return policy_np[None, :].astype(np.float32)
 
     # ---------------------------------------------------------------------------- #
     def backpropagation(self, node, reward):
@@ -245,6 +246,18 @@ class MCTS_NN3D:
         # Backpropagate
         self.backpropagation(leaf, reward)
 
+    # ---------------------------------------------------------------------------- #
+    def simulate(self, node, cpuct):
+        """One MCTS simulation from node, keeping the statistics already in its subtree"""
+        self.root = node
+        
+        # Initialize root as in run_simulations
+        if node.isLeaf() and not node.isterminal():
+            self.evaluation(node)
+            self.expansion(node)
+        
+        self.simulation(cpuct)
+
     # ---------------------------------------------------------------------------- #
     def run_simulations(self, game_state, num_simulations, cpuct):
         """Run multiple MCTS simulations"""
@@ -291,6 +304,3 @@ class MCTS_NN3D:
         return probs
 
 # ============================================================================ #
-
-# Import torch here to avoid circular dependency issues
-import torch
\ No newline at end of file
@@ -0,0 +1,165 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             MCTS_parallel.py
+# Description:      Root parallel MCTS : independent trees searched in parallel
+#                   from the same root, whose root statistics are merged
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import numpy as np
+from MCTS_NN import MCTS_NN
+from Game_bitboard import Game
+from multiprocessing import Process, Queue
+import config
+import threads
+import os
+import threading
+import time
+# ============================================================================ #
+
+# Each worker process keeps its own copy of the NN and builds its own tree from the root it is given.
+# With Dirichlet noise at the root (and MCTS_NN picking its random numbers independently in each process)
+# the trees explore differently. Root children visit counts and cumulated rewards are then summed over
+# the trees, per column, and the move is the column with the most visits.
+
+
+# ---------------------------------------------------------------------------- #
+# runs sims from node until sim_number sims are done or time_budget (in seconds) has elapsed.
+# At least one of the two must be given. Returns the number of sims done
+def run_sims(tree, node, cpuct, sim_number=None, time_budget=None):
+    sims = 0
+    deadline = None if time_budget is None else time.time() + time_budget
+
+    while sim_number is None or sims < sim_number:
+        tree.simulate(node, cpuct)
+        sims += 1
+        if deadline is not None and time.time() >= deadline:
+            break
+
+    return sims
+
+
+# ---------------------------------------------------------------------------- #
+# returns {column: [N, W]} for the children of the root
+def root_statistics(rootnode):
+    game = Game()
+    stats = {}
+    for child in rootnode.children:
+        stats[game.convert_move_to_col_index(child.move)] = [child.N, child.W]
+    return stats
+
+
+# ---------------------------------------------------------------------------- #
+# sums the root statistics of several trees, and picks the most visited column
+def merge_root_statistics(all_stats):
+    merged = {}
+    for stats in all_stats:
+        for col, (N, W) in stats.items():
+            if col not in merged:
+                merged[col] = [0, 0]
+            merged[col][0] += N
+            merged[col][1] += W
+
+    cols = sorted(merged)
+    visits = [merged[col][0] for col in cols]
+    q_values = [merged[col][1] / merged[col][0] if merged[col][0] > 0 else 0 for col in cols]
+
+    values = np.asarray(visits)
+    imax = np.random.choice(np.where(values == np.max(values))[0])
+
+    return {'col': cols[imax], 'cols': cols, 'visits': visits, 'q_values': q_values}
+
+
+# ---------------------------------------------------------------------------- #
+# worker process : waits for a root state, searches it, sends back the root statistics
+def root_parallel_worker(player, use_dirichlet, task_queue, result_queue):
+    threads.use('self_play')
+    player.eval()
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        state, sim_number, time_budget, cpuct = task
+        tree = MCTS_NN(player, use_dirichlet)
+        rootnode = tree.createNode(state)
+        sims = run_sims(tree, rootnode, cpuct, sim_number, time_budget)
+        result_queue.put((root_statistics(rootnode), sims))
+
+
+# =============================== CLASS: RootParallelMCTS ================================ #
+
+class RootParallelMCTS:
+    # ---------------------------------------------------------------------------- #
+    # workers = None uses config.root_parallel_workers. If it is None too, all cores but one are used.
+    # With a single worker the search runs in the calling process.
+    # Dirichlet noise at the root is what makes the trees differ : by default it is used only with several workers
+    def __init__(self, player, workers=None, use_dirichlet=None):
+        if workers is None:
+            workers = config.root_parallel_workers
+        if workers is None:
+            workers = max(1, (os.cpu_count() or 1) - 1)
+        if use_dirichlet is None:
+            use_dirichlet = workers > 1
+
+        self.player = player
+        self.workers = workers
+        self.use_dirichlet = use_dirichlet
+        self.procs = []
+        # the queues are shared by all the workers : one search at a time
+        self.lock = threading.Lock()
+
+        if self.workers > 1:
+            self.task_queue = Queue()
+            self.result_queue = Queue()
+            for _ in range(self.workers):
+                proc = Process(target=root_parallel_worker,
+                               args=(player, use_dirichlet, self.task_queue, self.result_queue,))
+                proc.daemon = True
+                proc.start()
+                self.procs.append(proc)
+
+    # ---------------------------------------------------------------------------- #
+    # searches the state with every tree, each one running sim_number sims and/or for time_budget seconds.
+    # Returns the merged statistics : chosen column, and for every legal column its visits and Q-value
+    def search(self, state, sim_number=None, time_budget=None, cpuct=config.CPUCT):
+        if sim_number is None and time_budget is None:
+            sim_number = config.SIM_NUMBER
+
+        if self.workers <= 1:
+            tree = MCTS_NN(self.player, self.use_dirichlet)
+            rootnode = tree.createNode(state)
+            sims = run_sims(tree, rootnode, cpuct, sim_number, time_budget)
+            result = merge_root_statistics([root_statistics(rootnode)])
+            result['sims'] = sims
+            return result
+
+        all_stats = []
+        sims = 0
+        with self.lock:
+            for _ in range(self.workers):
+                self.task_queue.put((state, sim_number, time_budget, cpuct))
+
+            for _ in range(self.workers):
+                stats, worker_sims = self.result_queue.get()
+                all_stats.append(stats)
+                sims += worker_sims
+
+        result = merge_root_statistics(all_stats)
+        result['sims'] = sims
+        return result
+
+    # ---------------------------------------------------------------------------- #
+    def close(self):
+        for _ in self.procs:
+            self.task_queue.put(None)
+        for proc in self.procs:
+            proc.join()
+        self.procs = []
+
+# ============================================================================ #
@@ -9,25 +9,46 @@
 
 # ================================= PREAMBLE ================================= #
 # Packages
+import argparse
 import time
 import numpy as np
 import config
 import main_functions
-import random
+from model_reload import save_model_atomic
+import tracing
+import profiling
+import rng
+import checkpoint
+import threads
+import quantize
+from inference import int8_path
 import copy
 import torch.utils
 from torchsummary import summary
 
 # =================================== MAIN ==================================== #
 
-def launch():
+# resume : None for a new run, otherwise the path of a run checkpoint, or True for the last one of
+# config.run_checkpoint_dir (see checkpoint.py)
+def launch(resume=None):
+
+    # --------------------------------------------------------------------- #
+    # timeline of the run (see tracing.py), written to config.trace_dir/trace.json after each iteration
+    if config.trace:
+        tracing.start(config.trace_dir, detail=config.trace_nn)
+    # profiles of the workers (see profiling.py), merged after each self-play
+    if config.profile_workers:
+        profiling.clear_profiles()
+    # the workers are forked from this process : it keeps the self-play budget outside of the training (see threads.py)
+    threads.use('self_play')
 
     # --------------------------------------------------------------------- #
     # init data generated by self play
     dataseen = np.zeros((3*config.L * config.H + config.L + 1))
 
     # --------------------------------------------------------------------- #
-    # Init Neural Net
+    # Init Neural Net (weights fixed by config.seed in the deterministic mode)
+    rng.seed_globals(0)
     best_player_so_far = main_functions.load_or_create_neural_net()
 
     # --------------------------------------------------------------------- #
@@ -35,6 +56,27 @@ def launch():
     elos=[0]
     improved = 0
     total_improved = 0
+    getbreak = 0
+    # state of the optimizer, carried from one training to the next (momentum) with config.carry_optimizer_state
+    optimizer_state = None
+
+    # --------------------------------------------------------------------- #
+    # resumed run : everything above comes from the checkpoint, and the self-play data too when the
+    # checkpoint was written in the middle of an iteration
+    i = 0
+    resumed_data = None
+    if resume:
+        state = checkpoint.load_checkpoint(None if resume is True else resume)
+        best_player_so_far.load_state_dict(state['model'])
+        best_player_so_far.eval()
+        elos, total_improved, getbreak = state['elos'], state['total_improved'], state['getbreak']
+        optimizer_state, dataseen = state['optimizer'], state['dataseen']
+        if state['stage'] == checkpoint.SELF_PLAY:
+            i = state['iteration']
+            resumed_data = state['use_this_data'], state['prev_data_seen']
+        else:
+            i = state['iteration'] + 1
+        print('resuming the run at iteration', i, 'after', total_improved, 'improvements')
 
     # --------------------------------------------------------------------- #
     # print summary. For some reasons I don't understand it may produce bugs depending on the machine used.
@@ -55,7 +97,7 @@ def launch():
     # in the readme file
 
     showinit=1
-    if showinit:
+    if showinit and not resume:
         print('init is')
         _ = main_functions.printstates(best_player_so_far)
         elos = main_functions.geteloratings(elos, best_player_so_far, 1 , total_improved)
@@ -64,29 +106,44 @@ def launch():
     # --------------------------------------------------------------------- #
     # Main loop
 
-    i=0
-
     while i < config.max_iterations:
+        iteration_start = tracing.now_us()
+        saving = config.run_checkpoint_every and i % config.run_checkpoint_every == 0
 
-        random.seed()
-        np.random.seed()
+        # global generators of the iteration, fixed by config.seed in the deterministic mode (see rng.py)
+        # (a resumed iteration goes on with the generators of its checkpoint)
+        if resumed_data is None:
+            rng.seed_globals(i)
 
         # Number of simulations for self play increases as the NN gets better, until = 350 ( ~ 7^3). I think it is a good idea (?) though it does slow down the entire process.
         sim_number = config.SIM_NUMBER + i
         if sim_number > 350:
             sim_number = 350
 
-        # generate data from self play
-        use_this_data, prev_data_seen = main_functions.generate_self_play_data(best_player_so_far, sim_number, dataseen, i)
+        # generate data from self play (unless the checkpoint of a resumed iteration has it)
+        if resumed_data is not None:
+            use_this_data, prev_data_seen = resumed_data
+            resumed_data = None
+        else:
+            with tracing.span('self-play', 'main', sim_number=sim_number):
+                use_this_data, prev_data_seen = main_functions.generate_self_play_data(best_player_so_far, sim_number, dataseen, i)
+            if saving:
+                checkpoint.save_checkpoint(
+                    {'model': best_player_so_far.state_dict(), 'optimizer': optimizer_state, 'elos': elos,
+                     'total_improved': total_improved, 'getbreak': getbreak, 'dataseen': dataseen,
+                     'use_this_data': use_this_data, 'prev_data_seen': prev_data_seen}, i, checkpoint.SELF_PLAY)
 
         # deepcopy last best_model
         previous_best = copy.deepcopy(best_player_so_far)
+        previous_optimizer_state = optimizer_state
 
         #neural net training by experience replay :
         print('')
         print('--- Improving model ---')
 
-        main_functions.improve_model_resnet(best_player_so_far, use_this_data, total_improved)
+        with tracing.span('training', 'main', samples=use_this_data.shape[0]), threads.phase('training'):
+            optimizer_state = main_functions.improve_model_resnet(best_player_so_far, use_this_data, total_improved,
+                                                                  optimizer_state)
         best_player_so_far.eval()
 
         # Check wether the model has improved
@@ -95,9 +152,10 @@ def launch():
         time.sleep(0.01)
 
         use_dirichlet = False
-        winp1, winp2, draws, ratio = main_functions.play_v1_against_v2\
-            (best_player_so_far, previous_best, config.tournamentloop, config.CPUS, config.sim_number_tournaments, config.CPUCT,
-             config.tau_pv, config.tau_zero_eval_new_nn, use_dirichlet)
+        with tracing.span('gating', 'main'):
+            winp1, winp2, draws, ratio = main_functions.play_v1_against_v2\
+                (best_player_so_far, previous_best, config.tournamentloop, config.CPUS, config.sim_number_tournaments, config.CPUCT,
+                 config.tau_pv, config.tau_zero_eval_new_nn, use_dirichlet, rng.stage_seed(i, rng.GATING))
         time.sleep(0.01)
         #print('FYI, first player won by', int(1000*ratio)/10, '%' )
 
@@ -114,11 +172,15 @@ def launch():
                   '% in', config.CPUS*config.tournamentloop, 'games')
             print('')
 
-            # it becomes the new best model
+            # it becomes the new best model (atomic save : serving processes may reload it at any time)
             if config.net=='densenet':
-                torch.save(best_player_so_far.state_dict(), './best_model_densenet.pth')
+                save_model_atomic(best_player_so_far, './best_model_densenet.pth')
             if config.net=='resnet':
-                torch.save(best_player_so_far.state_dict(), './best_model_resnet.pth')
+                save_model_atomic(best_player_so_far, './best_model_resnet.pth')
+                # and its int8 version for serving, calibrated on this self play data (see quantize.py)
+                if config.serve_int8:
+                    int8 = quantize.quantize(best_player_so_far, quantize.calibration_flats(use_this_data))
+                    quantize.save_quantized(int8, int8_path('./best_model_resnet.pth'))
 
             # this data was good data since it improved the NN : so we stack it to the previous data of self play
             if config.useprevdata:
@@ -137,6 +199,7 @@ def launch():
             print('model has not improved enough, score is only', 100*(winp1 + draws / 2) / (winp1 + winp2 + draws), '%' )
             best_player_so_far = previous_best
             best_player_so_far.eval()
+            optimizer_state = previous_optimizer_state
 
             #in particular, dont save this data
             if config.useprevdata :
@@ -145,7 +208,18 @@ def launch():
 
 
         #finally, print statistics about the learning, and ELO ratings, we make games against NN and pure MCTS
-        elos = main_functions.geteloratings(elos, best_player_so_far, improved, total_improved)
+        with tracing.span('elo checkpoint', 'main'):
+            elos = main_functions.geteloratings(elos, best_player_so_far, improved, total_improved,
+                                                rng.stage_seed(i, rng.ELO))
+
+        tracing.complete('iteration', 'main', iteration_start, iteration=i, improved=improved)
+        if saving:
+            checkpoint.save_checkpoint(
+                {'model': best_player_so_far.state_dict(), 'optimizer': optimizer_state, 'elos': elos,
+                 'total_improved': total_improved, 'getbreak': getbreak, 'dataseen': dataseen}, i, checkpoint.END)
+        if config.trace:
+            tracing.flush()
+            tracing.merge()
 
         #that makes the program quit when the model is good enough
         if getbreak == 1 and elos[-1] > 1800:
@@ -159,4 +233,8 @@ def launch():
 
 
 if __name__ == '__main__':
-    launch()
+    parser = argparse.ArgumentParser(description='AlphaZero training loop')
+    parser.add_argument('--resume', nargs='?', const=True, default=None, metavar='CHECKPOINT',
+                        help='resume a run from a checkpoint (default: the last one of config.run_checkpoint_dir)')
+    args = parser.parse_args()
+    launch(args.resume)
@@ -23,6 +23,8 @@ import torch.utils.data
 import numpy as np
 import config
 import random
+import tracing
+import precision
 
 # ================================= CLASS : basic ResNet Block ================================= #
 
@@ -69,7 +71,6 @@ class ResNet(nn.Module):
         self.convsize=config.convsize
         super(ResNet, self).__init__()
 
-        torch.set_num_threads(1)
 
         #as a start : the three features are mapped into a conv with 4*4 kernel
         self.ksize = (4, 4)
@@ -154,7 +155,7 @@ class ResNet(nn.Module):
         x1 = self.policy_entrance(x)
         x1 = self.bnpolicy(x1)
         x1 = self.relu_pol(x1)
-        x1 = x1.view(-1, config.polfilters*30)
+        x1 = x1.reshape(-1, config.polfilters*30)
 
         if config.usehiddenpol:
             x1 = self.hidden_dense_pol(x1)
@@ -168,7 +169,7 @@ class ResNet(nn.Module):
         x2 = self.value_entrance(x)
         x2 = self.bnvalue(x2)
         x2 = self.relu_val(x2)
-        x2 = x2.view(-1, 30*config.valfilters)
+        x2 = x2.reshape(-1, 30*config.valfilters)
         x2 = self.hidden_dense_value(x2)
         x2 = self.relu_hidden_val(x2)
         x2 = self.fcval(x2)
@@ -187,28 +188,37 @@ def resnet18(pretrained=False, model_root=None, **kwargs):
 
 class ResNet_Training:
     # -----------------------------------------------------------------#
-    def __init__(self, net, batch_size, n_epoch, learning_rate, train_set, test_set, num_worker):
+    # train_set : array of rows (flat state, pi, z) as made by self play. It is converted once to float32 tensors
+    # (on the GPU with config.use_cuda), minibatches are then drawn by index from a permutation per epoch.
+    # test_set and num_worker are not used (kept for the callers)
+    # optimizer_state : state_dict of the optimizer of a previous training (momentum), see Main.py
+    def __init__(self, net, batch_size, n_epoch, learning_rate, train_set, test_set, num_worker, optimizer_state=None):
         self.net = net
         self.batch_size = batch_size
         self.n_epochs = n_epoch
         self.learning_rate = learning_rate
         self.num_worker = num_worker
-        torch.set_num_threads(1)
+        self.optimizer_state = optimizer_state
+        self.optimizer = None
 
         if config.use_cuda:
             self.net = self.net.cuda()
 
-        self.train_set = train_set
-        self.test_set = test_set
-
-        self.train_loader = torch.utils.data.DataLoader(self.train_set, batch_size=self.batch_size, shuffle=True
-                                                        , num_workers=self.num_worker, drop_last=True)
-        self.test_loader = torch.utils.data.DataLoader(self.test_set, batch_size=64, shuffle=True
-                                                       , num_workers=self.num_worker)
-        self.valid_loader = torch.utils.data.DataLoader(self.train_set, batch_size=128, shuffle=True
-                                                        , num_workers=self.num_worker)
+        self.inputs, self.probas, self.reward = self.to_tensors(train_set)
         self.net.train()
 
+    # -----------------------------------------------------------------#
+    # contiguous float32 tensors of the inputs (n, 3, H, L), policies (n, L) and rewards (n, 1)
+    def to_tensors(self, train_set):
+        sboard = config.L * config.H
+        data = torch.as_tensor(np.asarray(train_set), dtype=torch.float32)
+        inputs = data[:, 0:3*sboard].reshape(-1, 3, config.H, config.L).contiguous()
+        probas = data[:, 3*sboard:3*sboard + self.net.output_dim].contiguous()
+        reward = data[:, -1:].contiguous()
+        if config.use_cuda:
+            inputs, probas, reward = inputs.cuda(), probas.cuda(), reward.cuda()
+        return inputs, probas, reward
+
     # -----------------------------------------------------------------#
     # Losses
     def Loss_value(self):
@@ -240,9 +250,18 @@ class ResNet_Training:
 
     def trainNet(self):
 
-        n_batches = len(self.train_loader)
+        n_samples = self.inputs.shape[0]
+        n_batches = n_samples // self.batch_size
         print(n_batches, 'batches')
         optimizer = self.Optimizer()
+        if self.optimizer_state is not None and config.carry_optimizer_state:
+            optimizer.load_state_dict(self.optimizer_state)
+            # with the learning rate of this training (annealing)
+            for group in optimizer.param_groups:
+                group['lr'] = self.learning_rate
+        self.optimizer = optimizer
+        loss_value = self.Loss_value()
+        loss_policy = self.Loss_policy_bce()
 
         # Loop for n_epochs
         for epoch in range(self.n_epochs):
@@ -250,41 +269,33 @@ class ResNet_Training:
             running_loss = 0.0
             print_every = n_batches // 2
             start_time = time.time()
-            total_train_loss = 0
+            epoch_time = time.time()
+            epoch_start = tracing.now_us()
 
-            for i, data in enumerate(self.train_loader, 0):
+            # shuffled minibatches, the last incomplete one is dropped
+            permutation = torch.randperm(n_samples, device=self.inputs.device)
 
-                sboard = config.L * config.H
-                preinputs = data[:, 0:3*sboard]
-                inputs = preinputs.view(self.batch_size, 3, config.H, config.L)
-                probas = data[:, 3*sboard:3*sboard + self.net.output_dim]
+            for i in range(n_batches):
 
-                reward = data[:, -1]
-                probas = probas.float()
-                reward = reward.float()
-                reward = reward.view(self.batch_size, 1)
+                index = permutation[i * self.batch_size:(i + 1) * self.batch_size]
+                inputs, probas, reward = self.inputs[index], self.probas[index], self.reward[index]
 
-                if config.use_cuda:
-                    inputs, probas, reward = inputs.cuda(), probas.cuda(), reward.cuda()
+                with tracing.span('train step', 'training', epoch=epoch, step=i):
+                    # Set the parameter gradients to zero
+                    optimizer.zero_grad()
 
-                inputs = Variable(inputs.float())
-                probas, reward = Variable(probas), Variable(reward)
+                    # Forward pass (autocast with config.train_precision, see precision.py), backward pass, optimize
+                    with precision.autocast():
+                        vh, ph = self.net(inputs)
+                    loss = loss_value(vh.float(), reward) + loss_policy(ph.float(), probas)
 
-                # Set the parameter gradients to zero
-                optimizer.zero_grad()
-
-                # Forward pass, backward pass, optimize
-                vh, ph = self.net(inputs)
-                loss = 0
-                loss += self.Loss_value()(vh, reward)
-                loss += self.Loss_policy_bce()(ph, probas)
-
-                loss.backward()
-                optimizer.step()
+                    loss.backward()
+                    optimizer.step()
 
                 # Print statistics
-                running_loss += loss.data.item()
-                total_train_loss += loss.data.item()
+                loss = loss.item()
+                running_loss += loss
+                tracing.counter('train loss', loss=loss)
 
                 if (i + 1) % (print_every + 1) == 0:
                     print("Epoch {}, {:d}% \t train_loss: {:.2f} took: {:.2f}s".format(
@@ -294,6 +305,11 @@ class ResNet_Training:
                     running_loss = 0.0
                     start_time = time.time()
 
+            samples_per_sec = n_batches * self.batch_size / max(time.time() - epoch_time, 1e-9)
+            print("Epoch {} : {:.0f} samples/sec".format(epoch + 1, samples_per_sec))
+            tracing.complete('epoch', 'training', epoch_start, epoch=epoch, batches=n_batches,
+                             samples_per_sec=samples_per_sec)
+
         # send back the model to cpu for next self play games using forward in parallel cpu
         self.net.cpu()
 
@@ -304,7 +320,6 @@ class DenseNet(nn.Module):
     def __init__(self):
 
         self.input_dim = 3*42
-        torch.set_num_threads(1)
         self.hiddensize = 1024
         random.seed()
 
@@ -343,7 +358,6 @@ class DenseNet_Training:
         self.n_epochs = n_epoch
         self.learning_rate = learning_rate
         self.num_worker = num_worker
-        torch.set_num_threads(1)
         random.seed()
         self.optim = optim
         self.train_set = train_set
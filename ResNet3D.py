@@ -68,7 +68,6 @@ class ResNet3D(nn.Module):
         self.convsize = config3d.convsize
         super(ResNet3D, self).__init__()
 
-        torch.set_num_threads(1)
 
         # For 3D Connect 4, we have 3 channels (player1, player2, current_player) 
         # each representing a 4x4 layer projection of the 3D board
@@ -229,7 +228,6 @@ class ResNet3D_Training:
         self.n_epochs = n_epoch
         self.learning_rate = learning_rate
         self.num_worker = num_worker
-        torch.set_num_threads(1)
 
         if config3d.use_cuda:
             self.net = self.net.cuda()
@@ -0,0 +1,120 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             Rollout_bitboard.py
+# Description:      Vectorized random rollouts over arrays of uint64 bitboards
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import numpy as np
+# ============================================================================ #
+
+# Same 64 bit encoding as Game_bitboard.py (8 bits per column, 6 used, bit 0 is the bottom row).
+# Instead of playing one game at a time with python ints, a batch of B games is stored as three arrays:
+# yellow (B,) uint64, red (B,) uint64 and player_turn (B,) int, plus the height of each column (B, 7).
+# Every random playout of the batch advances by one move per iteration of the main loop, so the cost of
+# the python interpreter is paid once per ply instead of once per ply and per game.
+
+H = 6
+L = 7
+COLUMN_MASK = np.uint64(2 ** H - 1)
+COLUMN_SHIFTS = np.arange(L, dtype=np.uint64) * np.uint64(8)
+ONE = np.uint64(1)
+
+
+# ---------------------------------------------------------------------------- #
+# vectorized version of Game.checkwin : returns a boolean array, True where the board has 4 in a row
+def checkwin_batch(boards):
+    win = np.zeros(np.shape(boards), dtype=bool)
+    for shift in (8, 1, 9, 7): # horizontal, vertical, diagonal /, diagonal \
+        pairs = boards & (boards >> np.uint64(shift))
+        win |= (pairs & (pairs >> np.uint64(2 * shift))) != 0
+    return win
+
+
+# ---------------------------------------------------------------------------- #
+# number of tokens in each column, shape (B, 7)
+def column_heights(fullboards):
+    heights = np.zeros(np.shape(fullboards) + (L,), dtype=np.int64)
+    for col in range(L):
+        column = (fullboards >> COLUMN_SHIFTS[col]) & COLUMN_MASK
+        for row in range(H):
+            heights[..., col] += ((column >> np.uint64(row)) & ONE).astype(np.int64)
+    return heights
+
+
+# =============================== CLASS: BatchRollout ================================ #
+
+class BatchRollout:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, rng=None):
+        if rng is None:
+            rng = np.random.default_rng()
+        self.rng = rng
+
+    # ---------------------------------------------------------------------------- #
+    # pick one column per game. Random among legal columns, or if usecounter, random among winning columns,
+    # else among columns that counter an immediate lose, else among legal columns (same rule as MCTS.py)
+    def pick_columns(self, own, opponent, heights, usecounter):
+        legal = heights < H
+        keys = self.rng.random(heights.shape)
+
+        if usecounter:
+            # bit that would be set by playing in each column (garbage for full columns, masked by legal)
+            candidates = ONE << (COLUMN_SHIFTS[None, :] + heights.astype(np.uint64))
+            wins = checkwin_batch(own[:, None] | candidates) & legal
+            blocks = checkwin_batch(opponent[:, None] | candidates) & legal
+            keys += 4 * wins + 2 * blocks
+
+        keys[~legal] = -1
+        return np.argmax(keys, axis=1)
+
+    # ---------------------------------------------------------------------------- #
+    # plays random games until the end from the given states (arrays or scalars, broadcast together)
+    # and returns the winner of each game : 1 yellow, -1 red, 0 draw
+    def play(self, yellow, red, player_turn, usecounter=False):
+        yellow, red, player_turn = np.broadcast_arrays(np.asarray(yellow, dtype=np.uint64),
+                                                       np.asarray(red, dtype=np.uint64),
+                                                       np.asarray(player_turn, dtype=np.int64))
+        yellow = np.array(yellow, ndmin=1)
+        red = np.array(red, ndmin=1)
+        player_turn = np.array(player_turn, ndmin=1)
+
+        heights = column_heights(yellow | red)
+        moves_played = heights.sum(axis=1)
+
+        winner = np.zeros(yellow.shape[0], dtype=np.int64)
+        yellow_won = checkwin_batch(yellow)
+        red_won = checkwin_batch(red)
+        winner[yellow_won] = 1
+        winner[red_won] = -1
+        active = np.nonzero(~(yellow_won | red_won) & (moves_played < H * L))[0]
+
+        while active.size > 0:
+            is_yellow = player_turn[active] == 1
+            own = np.where(is_yellow, yellow[active], red[active])
+            opponent = np.where(is_yellow, red[active], yellow[active])
+            local_heights = heights[active]
+
+            cols = self.pick_columns(own, opponent, local_heights, usecounter)
+            rows = local_heights[np.arange(active.size), cols]
+            move = ONE << (COLUMN_SHIFTS[cols] + rows.astype(np.uint64))
+
+            own |= move
+            yellow[active] = np.where(is_yellow, own, yellow[active])
+            red[active] = np.where(is_yellow, red[active], own)
+            heights[active, cols] += 1
+            moves_played[active] += 1
+            player_turn[active] = -player_turn[active]
+
+            # only the player who just moved can have won
+            won = checkwin_batch(own)
+            winner[active[won]] = np.where(is_yellow[won], 1, -1)
+            active = active[~won & (moves_played[active] < H * L)]
+
+        return winner
+
+# =============================== END CLASS: BatchRollout ================================ #
@@ -0,0 +1,131 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             admission.py
+# Description:      Admission control for the move server : sims per request are cut
+#                   when the server is overloaded, and requests rejected past a hard limit
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import math
+import threading
+import config
+# ============================================================================ #
+
+
+# =============================== CLASS: Overloaded ================================ #
+# raised by AdmissionController.admit when the request is rejected
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        Exception.__init__(self, 'server overloaded, retry after {} s'.format(retry_after))
+        self.retry_after = retry_after
+
+# ============================================================================ #
+
+
+# =============================== CLASS: Ticket ================================ #
+# an admitted request : sims is the budget granted (0 means the move is taken from the NN policy alone)
+class Ticket:
+    def __init__(self, controller, sims):
+        self.controller = controller
+        self.sims = sims
+
+    def release(self, latency=None, sims=None):
+        self.controller.release(self, latency, sims)
+
+# ============================================================================ #
+
+
+# =============================== CLASS: AdmissionController ================================ #
+# The load is measured by the requests in flight (being searched) and by the recent cost of one sim
+# (EWMA of latency / sims). The pressure is the largest of
+#   in flight / soft_in_flight              (queue depth)
+#   cost per sim * sims / target_latency     (latency the budget asked would take now)
+# and a request asking for sims (max_sims by default) gets sims / pressure when the pressure is above 1.
+# Budgets below min_sims become policy only moves (0 sims). Past max_in_flight requests are rejected
+# with a retry hint.
+class AdmissionController:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, max_sims, min_sims=None, soft_in_flight=None, max_in_flight=None,
+                 target_latency=None, ewma=None):
+        self.max_sims = max_sims
+        self.min_sims = config.admission_min_sims if min_sims is None else min_sims
+        self.soft_in_flight = config.admission_soft_in_flight if soft_in_flight is None else soft_in_flight
+        self.max_in_flight = config.admission_max_in_flight if max_in_flight is None else max_in_flight
+        self.target_latency = config.admission_target_latency if target_latency is None else target_latency
+        self.ewma = config.admission_ewma if ewma is None else ewma
+
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.sim_cost = None # EWMA of seconds per sim
+        self.latency = None # EWMA of seconds per request
+
+        # statistics
+        self.admitted = 0
+        self.degraded = 0
+        self.policy_only = 0
+        self.rejected = 0
+
+    # ---------------------------------------------------------------------------- #
+    # caller holds the lock
+    def pressure(self, sims=None):
+        if sims is None:
+            sims = self.max_sims
+        pressure = self.in_flight / self.soft_in_flight
+        if self.sim_cost is not None:
+            pressure = max(pressure, self.sim_cost * sims / self.target_latency)
+        return pressure
+
+    # ---------------------------------------------------------------------------- #
+    # returns a Ticket, to be released with the latency of the request, or raises Overloaded
+    def admit(self, sims=None):
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                latency = self.target_latency if self.latency is None else self.latency
+                raise Overloaded(max(1, math.ceil(latency * self.in_flight / self.soft_in_flight)))
+
+            self.in_flight += 1
+            self.admitted += 1
+            if sims is None:
+                sims = self.max_sims
+            if sims == 0:
+                return Ticket(self, 0)
+
+            pressure = self.pressure(sims)
+            if pressure > 1:
+                sims = int(sims / pressure)
+                self.degraded += 1
+            if sims < self.min_sims:
+                sims = 0
+                self.policy_only += 1
+            return Ticket(self, sims)
+
+    # ---------------------------------------------------------------------------- #
+    # latency None for a failed request, which does not tell the cost of a sim. sims is the number of sims
+    # actually run (the search can stop before its budget), ticket.sims by default
+    def release(self, ticket, latency=None, sims=None):
+        with self.lock:
+            self.in_flight -= 1
+            if latency is None:
+                return
+            # the NN evaluation of the root counts as one sim
+            if sims is None:
+                sims = ticket.sims
+            cost = latency / (sims + 1)
+            if self.sim_cost is None:
+                self.sim_cost, self.latency = cost, latency
+            else:
+                self.sim_cost += self.ewma * (cost - self.sim_cost)
+                self.latency += self.ewma * (latency - self.latency)
+
+    # ---------------------------------------------------------------------------- #
+    def summary(self):
+        with self.lock:
+            return {'inFlight': self.in_flight, 'pressure': self.pressure(), 'admitted': self.admitted,
+                    'degraded': self.degraded, 'policyOnly': self.policy_only, 'rejected': self.rejected}
+
+# ============================================================================ #
@@ -5,8 +5,7 @@ AI vs AI battle with automatic visualization - no user input required
 
 from MCTS_NN import MCTS_NN
 from Game_bitboard import Game
-from ResNet import resnet18
-import torch
+import numpy_net
 import numpy as np
 import time
 import os
@@ -123,10 +122,8 @@ class Connect4AutoBattle:
         print("="*50)
         print("Loading neural network...", end="", flush=True)
         
-        # Load model
-        model = resnet18()
-        model.load_state_dict(torch.load('./best_model_resnet.pth'))
-        model.eval()
+        # Load model (its NumPy export, see numpy_net.py)
+        model = numpy_net.load_player('./best_model_resnet.pth')
         print(" ✓")
         
         print(f"Battle settings: {sim_number} MCTS simulations, {delay}s delay")
@@ -163,8 +160,7 @@ class Connect4AutoBattle:
             
             # Get evaluation
             flat_state = game.state_flattener(game.state)
-            with torch.no_grad():
-                value, policy = model.forward(flat_state)
+            value, policy = model.forward(flat_state)
             
             eval_from_yellow = value.item() * game.player_turn * -1
             eval_desc, eval_val = self.evaluate_position(value.item(), game.player_turn)
@@ -203,7 +199,7 @@ class Connect4AutoBattle:
             # Display top moves
             print("\n🎯 Top move candidates:")
             sorted_indices = np.argsort(visits)[::-1]
-            policy_np = policy.numpy()[0]
+            policy_np = policy[0]
             
             for i, idx in enumerate(sorted_indices[:3]):
                 col = moves[idx]
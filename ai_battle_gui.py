@@ -11,7 +11,7 @@ import queue
 
 from MCTS_NN import MCTS_NN
 from Game_bitboard import Game
-from ResNet import resnet18
+from inference import load_model, model_file
 import torch
 import numpy as np
 
@@ -173,9 +173,8 @@ class Connect4GUI:
             self.status_label.config(text="Loading neural network...")
             self.root.update()
             
-            self.model = resnet18()
-            self.model.load_state_dict(torch.load('./best_model_resnet.pth'))
-            self.model.eval()
+            # the int8 model with config.serve_int8 (see quantize.py)
+            self.model = load_model(model_file('./best_model_resnet.pth'))
             
             self.status_label.config(text="Model loaded successfully!")
         except Exception as e:
@@ -5,12 +5,12 @@ AI vs AI battle with live visualization
 
 from MCTS_NN import MCTS_NN
 from Game_bitboard import Game
-from ResNet import resnet18
-import torch
+import numpy_net
 import numpy as np
 import time
 import os
 import sys
+import config
 
 class Connect4UI:
     """Terminal-based UI for Connect 4"""
@@ -179,9 +179,8 @@ def run_ai_battle_with_ui(auto_play=False, delay=2.0):
     ui.draw_header()
     print("Loading neural network... ", end="", flush=True)
     
-    model = resnet18()
-    model.load_state_dict(torch.load('./best_model_resnet.pth'))
-    model.eval()
+    # NumPy export of the model (see numpy_net.py)
+    model = numpy_net.load_player('./best_model_resnet.pth')
     print("✓")
     
     # Game setup
@@ -209,8 +208,7 @@ def run_ai_battle_with_ui(auto_play=False, delay=2.0):
         
         # Get initial evaluation
         flat_state = game.state_flattener(game.state)
-        with torch.no_grad():
-            value, policy = model.forward(flat_state)
+        value, policy = model.forward(flat_state)
         
         eval_from_yellow = value.item() * game.player_turn * -1
         
@@ -223,15 +221,9 @@ def run_ai_battle_with_ui(auto_play=False, delay=2.0):
         # Show thinking animation
         print(f"\n  {ui.draw_thinking_animation()} {player} is thinking...", end="", flush=True)
         
-        # Run MCTS
-        start_time = time.time()
-        for i in range(sim_number):
-            tree.simulate(currentnode, cpuct=1)
-            if i % 10 == 0:
-                ui.thinking_dots += 1
-                print(f"\r  {ui.draw_thinking_animation()} {player} is thinking{'.' * (i//10 + 1)}", end="", flush=True)
-        
-        think_time = time.time() - start_time
+        # Run MCTS (stops early if the move is forced or decided)
+        report = tree.search(currentnode, cpuct=1, max_sims=sim_number, max_time=config.move_time_budget)
+        think_time = report.elapsed
         
         # Analyze moves
         visits = []
@@ -248,13 +240,13 @@ def run_ai_battle_with_ui(auto_play=False, delay=2.0):
         print("\r" + " " * 50 + "\r", end="")
         
         # Display move analysis
-        ui.draw_move_analysis(moves, visits, q_values, policy.numpy()[0])
+        ui.draw_move_analysis(moves, visits, q_values, policy[0])
         
         # Make best move
-        best_idx = np.argmax(visits)
+        best_idx = currentnode.children.index(report.best_child)
         best_col = moves[best_idx]
         
-        print(f"\n  ➤ {player} chooses column {best_col}!")
+        print(f"\n  ➤ {player} chooses column {best_col}! ({report.sims} sims, stop: {report.stop_reason})")
         
         # Update game
         currentnode = currentnode.children[best_idx]
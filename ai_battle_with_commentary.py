@@ -5,8 +5,7 @@ AI vs AI battle with detailed commentary and visualization
 
 from MCTS_NN import MCTS_NN
 from Game_bitboard import Game
-from ResNet import resnet18
-import torch
+import numpy_net
 import numpy as np
 import time
 import os
@@ -129,10 +128,8 @@ def ai_vs_ai_battle_commentary():
     print(f"{ColoredBoard.YELLOW}Yellow ●{ColoredBoard.RESET} vs {ColoredBoard.RED}Red ●{ColoredBoard.RESET}")
     print("\nLoading neural network...", end="", flush=True)
     
-    # Load model
-    model = resnet18()
-    model.load_state_dict(torch.load('./best_model_resnet.pth'))
-    model.eval()
+    # Load model (its NumPy export, see numpy_net.py)
+    model = numpy_net.load_player('./best_model_resnet.pth')
     print(" Done!")
     
     # Game setup
@@ -167,14 +164,13 @@ def ai_vs_ai_battle_commentary():
         
         # Get initial evaluation before search
         flat_state = game.state_flattener(game.state)
-        with torch.no_grad():
-            value, policy = model.forward(flat_state)
+        value, policy = model.forward(flat_state)
         
         eval_desc, eval_score = evaluate_position(value.item(), game.player_turn)
         print(f"\nPosition evaluation: {eval_desc} ({eval_score})")
         
         # Check for critical moves
-        critical_info = analyze_critical_moves(game, policy.numpy()[0])
+        critical_info = analyze_critical_moves(game, policy[0])
         if critical_info:
             print("\n⚠️  Critical position:")
             for info in critical_info:
@@ -210,7 +206,7 @@ def ai_vs_ai_battle_commentary():
         print("Col │ Visits │ Win % │ Policy %")
         print("────┼────────┼───────┼─────────")
         
-        policy_np = policy.numpy()[0]
+        policy_np = policy[0]
         for idx in sorted_indices[:5]:  # Top 5 moves
             col = moves[idx]
             visit = visits[idx]
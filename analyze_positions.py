@@ -0,0 +1,126 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             analyze_positions.py
+# Description:      Bulk analysis of positions read as JSON lines : NN value and
+#                   policy (batched forward passes) or short MCTS_NN searches
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# One position per input line, {"moves": "4453"} (columns 1 to 7 as on connect4.gamesolver.org) or
+# {"yellow": int, "red": int, "turn": 1 or -1}, with an optional "id". One result per output line, in order :
+#
+#   python analyze_positions.py positions.jsonl -o results.jsonl
+#   python analyze_positions.py positions.jsonl --sims 100 --workers 4 > results.jsonl
+
+import argparse
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+import torch
+import config
+from inference import load_model, BatchedEvaluator
+from positions import analyze_records
+
+# model of a pool worker, and the evaluator batching the leaves of its searches
+worker_model = None
+worker_evaluator = None
+
+
+# ---------------------------------------------------------------------------- #
+def init_worker(model_path, threads):
+    global worker_model, worker_evaluator
+    torch.set_num_threads(threads)
+    worker_model = load_model(model_path)
+    worker_evaluator = BatchedEvaluator(worker_model)
+
+
+# ---------------------------------------------------------------------------- #
+# lines -> results, a line that is not valid JSON gets an error result
+def analyze_lines(lines, sim_number):
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError
+        except ValueError:
+            record = {'error': 'invalid JSON line'}
+        records.append(record)
+
+    valid = [i for i, record in enumerate(records) if 'error' not in record]
+    results = [dict(record) for record in records]
+    for i, result in zip(valid, analyze_records(worker_model, [records[i] for i in valid], sim_number,
+                                                worker_evaluator)):
+        results[i] = result
+    return results
+
+
+def analyze_chunk(args):
+    return analyze_lines(*args)
+
+
+# ---------------------------------------------------------------------------- #
+# chunks of `size` non empty lines, with the sim number for the workers
+def read_chunks(file, size, sim_number):
+    chunk = []
+    for line in file:
+        if line.strip():
+            chunk.append(line)
+        if len(chunk) == size:
+            yield chunk, sim_number
+            chunk = []
+    if chunk:
+        yield chunk, sim_number
+
+
+# ---------------------------------------------------------------------------- #
+def launch(input_file, output_file, model_path, sim_number, batch, workers):
+    global worker_model, worker_evaluator
+    start = time.time()
+    count = 0
+    errors = 0
+    chunks = read_chunks(input_file, batch, sim_number)
+
+    if workers == 1:
+        worker_model = load_model(model_path)
+        worker_evaluator = BatchedEvaluator(worker_model)
+        results = map(analyze_chunk, chunks)
+    else:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        pool = Pool(workers, initializer=init_worker, initargs=(model_path, threads))
+        results = pool.imap(analyze_chunk, chunks)
+
+    for chunk_results in results:
+        for result in chunk_results:
+            output_file.write(json.dumps(result) + '\n')
+            count += 1
+            errors += 'error' in result
+        output_file.flush()
+
+    if workers != 1:
+        pool.close()
+        pool.join()
+
+    elapsed = time.time() - start
+    print('analyzed', count, 'positions (', errors, 'errors ) in', round(elapsed, 2), 's :',
+          round(count / max(elapsed, 1e-9), 1), 'positions/sec', file=sys.stderr)
+    return count, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='NN or short search analysis of positions given as JSON lines')
+    parser.add_argument('input', nargs='?', default='-', help='JSONL file of positions (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='JSONL file of results (default: stdout)')
+    parser.add_argument('--model', default='./best_model_resnet.pth')
+    parser.add_argument('--sims', type=int, default=0, help='MCTS sims per position, 0 for the NN alone')
+    parser.add_argument('--batch', type=int, default=config.inference_max_batch * 4,
+                        help='positions per forward pass / per task of a worker')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    args = parser.parse_args()
+
+    input_file = sys.stdin if args.input == '-' else open(args.input)
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w')
+    launch(input_file, output_file, args.model, args.sims, args.batch, args.workers)
@@ -1,109 +1,426 @@
+"""
+Move server for the web UI (connect4-3d-ui/src/services/api.ts)
+
+Each /ai-move request runs its own MCTS_NN search in a server thread. The NN leaf
+evaluations of all concurrent requests go through one BatchedEvaluator per process,
+so that they are run together as batched forward passes.
+
+A request may carry a sessionId : the server then keeps the search tree of the game
+and the next request of the session starts from the subtree of the moves played
+(sessions are per server process, use --workers 1 or sticky routing to reuse them).
+
+The sims of a move are granted by an AdmissionController : they are cut when the server
+is overloaded, down to a move from the NN policy alone, and past a hard limit requests
+get a 503 with Retry-After. The budget granted is returned as simBudget.
+
+The checkpoint is watched : a new best model is loaded and warmed up in the background
+and used by the requests that start after the swap. GET /health reports its version.
+
+With config.search_stats, GET /metrics also gives the per-phase search statistics of
+the process (see search_stats.py).
+
+A request may name a strength profile (config.strength_profiles : checkpoint, sims,
+temperature). All the profiles and checkpoints share the batched evaluator of the process.
+
+POST /analyze evaluates many positions at once (see positions.py and analyze_positions.py).
+
+With config.root_parallel_workers other than 1, the requests without a sessionId are searched by
+independent trees in worker processes (see MCTS_parallel.py) instead of the batched evaluator.
+
+    python api_server.py --workers 4 --port 5000
+
+--workers forks server processes sharing the listening socket (Linux/macOS). The app
+can also be served by any WSGI server, e.g. gunicorn -w 4 --threads 32 'api_server:create_app()'
+(latency percentiles are then per worker process).
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import numpy as np
-import torch
+from werkzeug.serving import make_server
+
 from MCTS_NN import MCTS_NN
-from ResNet import ResNet
-from Game_bitboard import Connect4
+from MCTS_parallel import RootParallelMCTS
+from Game_bitboard import Game
+from admission import AdmissionController, Overloaded
+from inference import BatchedEvaluator
+from model_reload import ModelManager
+from profiles import StrengthProfile, load_profiles, choose_index
+from positions import analyze_records, parse_position
+from pondering import reuse_subtree
+from sessions import SessionStore
+from search_stats import SearchStats
 import config
+import threads
+
+# guards the search statistics merged by the request threads
+stats_lock = threading.Lock()
+
+class LatencyWindow:
+    """Latencies of the last `size` requests, in shared memory so that all worker processes report the same percentiles"""
+    def __init__(self, size=2000):
+        self.size = size
+        self.values = multiprocessing.Array('d', size)
+        self.count = multiprocessing.Value('l', 0, lock=False)
+        self.errors = multiprocessing.Value('l', 0, lock=False)
+        # sims run, and visits of the root after the search (reused from the session tree + sims run)
+        self.sims = multiprocessing.Value('l', 0, lock=False)
+        self.effective_sims = multiprocessing.Value('l', 0, lock=False)
 
-app = Flask(__name__)
-CORS(app)
+    def add(self, seconds, error=False, sims=0, effective_sims=0):
+        with self.values.get_lock():
+            self.values[self.count.value % self.size] = seconds
+            self.count.value += 1
+            self.errors.value += error
+            self.sims.value += sims
+            self.effective_sims.value += effective_sims
 
-# Load the trained model
-device = torch.device("cuda" if torch.cuda.is_available() and config.use_cuda else "cpu")
-model = ResNet()
-model.load_state_dict(torch.load('best_model_resnet.pth', map_location=device))
-model.to(device)
-model.eval()
+    def summary(self):
+        with self.values.get_lock():
+            count = self.count.value
+            errors = self.errors.value
+            sims = self.sims.value
+            effective_sims = self.effective_sims.value
+            window = np.array(self.values[:min(count, self.size)])
+
+        summary = {'requests': count, 'errors': errors}
+        if count > errors:
+            summary['meanSims'] = sims / (count - errors)
+            summary['meanEffectiveSims'] = effective_sims / (count - errors)
+        if len(window):
+            summary['p50Ms'] = float(np.percentile(window, 50) * 1000)
+            summary['p99Ms'] = float(np.percentile(window, 99) * 1000)
+        return summary
+
+class RootParallelSearches:
+    """Root parallel searches of the models (see MCTS_parallel.py), started on their first request.
+    The worker processes of a model are restarted with its new version when it is reloaded"""
+    def __init__(self, models, workers):
+        self.models = models
+        self.workers = workers
+        self.searches = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        manager = self.models[name]
+        with self.lock:
+            version, search = self.searches.get(name, (None, None))
+            if search is None or version != manager.version:
+                version = manager.version
+                if search is not None:
+                    # once the search running on the old workers is done
+                    with search.lock:
+                        search.close()
+                search = RootParallelMCTS(manager.model, self.workers)
+                self.searches[name] = version, search
+        return search
+
+    def close(self):
+        with self.lock:
+            for _, search in self.searches.values():
+                search.close()
+            self.searches = {}
 
 def board_to_bitboard(board_array):
-    """Convert 2D array board to bitboard format"""
+    """Convert 2D array board (board[col][row], row 0 at the bottom) to bitboard format"""
+    if len(board_array) != config.L or any(len(column) != config.H for column in board_array):
+        raise ValueError('board must be 7 columns of 6 cells')
+
     yellow_bitboard = 0
     red_bitboard = 0
-    
+
     for col in range(7):
         for row in range(6):
             if board_array[col][row] == 'yellow':
-                yellow_bitboard |= (1 << (col * 7 + row))
+                yellow_bitboard |= (1 << (col * 8 + row))
             elif board_array[col][row] == 'red':
-                red_bitboard |= (1 << (col * 7 + row))
-    
+                red_bitboard |= (1 << (col * 8 + row))
+            elif board_array[col][row] is not None:
+                raise ValueError(f'invalid cell {board_array[col][row]!r}')
+
     return yellow_bitboard, red_bitboard
 
-def get_ai_move(board_array, current_player):
-    """Get AI move using MCTS with neural network"""
+def get_ai_move(evaluator, board_array, current_player, sim_number, sessions=None, session_id=None,
+                model=None, temperature=0, stats=None, parallel=None):
+    """Get AI move using MCTS with neural network (model, or the default model of the evaluator).
+    The move is drawn from the root visits at temperature (see profiles.choose_index).
+    Without a session, a RootParallelMCTS of the model given as parallel searches instead of the batched tree.
+    With config.search_stats the statistics of the search are merged into stats (a SearchStats).
+    Returns (column, evaluation, sims done, visits reused from the session tree, root visits after the search)"""
     yellow_bitboard, red_bitboard = board_to_bitboard(board_array)
-    
+
     # Determine player turn (1 for yellow, -1 for red)
     player_turn = 1 if current_player == 'yellow' else -1
-    
-    # Create game state
-    game = Connect4()
-    game.yellowboard = yellow_bitboard
-    game.redboard = red_bitboard
-    game.playerturn = player_turn
-    
-    # Use MCTS to find best move
-    mcts = MCTS_NN(model, device, game, cpuct=config.CPUCT)
-    
-    # Run simulations
-    for _ in range(config.sim_number_defense):
-        mcts.run_sims(game)
-    
-    # Get move probabilities
-    probs = mcts.probs(game, tau=0)  # tau=0 for deterministic play
-    
-    # Choose best valid move
-    best_col = np.argmax(probs)
-    
-    # Get evaluation
-    state = game.get_state()
-    state_tensor = torch.FloatTensor(state).unsqueeze(0).to(device)
-    with torch.no_grad():
-        _, value = model(state_tensor)
+    state = [yellow_bitboard, red_bitboard, player_turn]
+    game = Game(state)
+    if game.gameover()[0]:
+        raise ValueError('game is over')
+
+    if parallel is not None and session_id is None and sim_number > 0:
+        with evaluator.client(model) as player:
+            value, _ = player.forward(game.state_flattener(state))
+        result = parallel.search(state, sim_number=sim_number, cpuct=config.CPUCT)
+        best_col = result['cols'][choose_index(result['visits'], temperature)]
+        return int(best_col), float(value.item()), result['sims'], 0, sum(result['visits'])
+
+    # Use MCTS to find best move, the leaf evaluations being batched with the other requests
+    with evaluator.client(model) as player:
+        # Get evaluation (NN value for the player to move)
+        value, policy = player.forward(game.state_flattener(state))
         evaluation = value.item()
-    
-    return int(best_col), float(evaluation)
-
-@app.route('/ai-move', methods=['POST'])
-def ai_move():
-    data = request.json
-    board = data['board']
-    current_player = data['currentPlayer']
-    
-    if current_player not in ['yellow', 'red']:
-        return jsonify({'error': 'Invalid player'}), 400
-    
-    try:
-        column, evaluation = get_ai_move(board, current_player)
+
+        tree = MCTS_NN(player, use_dirichlet=False)
+        rootnode = None
+        if session_id is not None:
+            rootnode = sessions.take(session_id, state)
+
+        if sim_number == 0:
+            # no sims : move from the NN policy alone (the session tree is dropped)
+            cols = [game.convert_move_to_col_index(move) for move in game.allowed_moves()]
+            best_col = cols[choose_index([policy[0][col].item() for col in cols], temperature)]
+            return int(best_col), float(evaluation), 0, 0, 0
+
+        if rootnode is None:
+            rootnode = tree.createNode(state)
+        reused = rootnode.N
+        report = tree.search(rootnode, config.CPUCT, max_sims=sim_number, max_time=config.move_time_budget)
+
+    if tree.stats is not None and stats is not None:
+        tree.stats.end_move(rootnode)
+        with stats_lock:
+            stats.merge(tree.stats)
+
+    best_child = report.best_child
+    if temperature > 0:
+        best_child = rootnode.children[choose_index([child.N for child in rootnode.children], temperature)]
+
+    # keep the subtree of the move played for the next request of the session
+    if session_id is not None:
+        sessions.put(session_id, reuse_subtree(rootnode, best_child.move))
+
+    best_col = game.convert_move_to_col_index(best_child.move)
+    return int(best_col), float(evaluation), report.sims, reused, rootnode.N
+
+def create_app(model_path=None, sim_number=None, latencies=None, profiles=None, model_paths=None):
+    """Build the Flask app with its models and their shared batched evaluator.
+    profiles and model_paths default to config.strength_profiles and config.serving_models ;
+    model_path replaces the 'best' checkpoint and sim_number the sims of the default profile.
+    Each model is reloaded when its checkpoint changes (config.model_watch_interval) or on POST /reload"""
+    if latencies is None:
+        latencies = LatencyWindow()
+    model_paths = dict(config.serving_models if model_paths is None else model_paths)
+    if model_path is not None:
+        model_paths['best'] = model_path
+    profiles = load_profiles(profiles, model_paths)
+    default_profile = profiles[config.default_profile]
+    if sim_number is not None:
+        profiles[default_profile.name] = default_profile = StrengthProfile(
+            default_profile.name, sim_number, default_profile.temperature, model=default_profile.model)
+    max_sims = max(profile.sims for profile in profiles.values())
+
+    # only the models used by a profile are loaded ; all their evaluations share one queue
+    models = {name: ModelManager(model_paths[name]) for name in set(p.model for p in profiles.values())}
+    for manager in models.values():
+        manager.watch()
+    evaluator = BatchedEvaluator(models[default_profile.model].model)
+    sessions = SessionStore()
+    admission = AdmissionController(max_sims)
+    profile_requests = {name: 0 for name in profiles}
+    search_stats = SearchStats() if config.search_stats else None
+    parallel = RootParallelSearches(models, config.root_parallel_workers) if config.root_parallel_workers != 1 else None
+
+    app = Flask(__name__)
+    CORS(app)
+    app.extensions.update(models=models, evaluator=evaluator, sessions=sessions, admission=admission,
+                          profiles=profiles, parallel=parallel)
+
+    @app.route('/ai-move', methods=['POST'])
+    def ai_move():
+        start = time.time()
+        data = request.get_json(silent=True) or {}
+        board = data.get('board')
+        current_player = data.get('currentPlayer')
+        session_id = data.get('sessionId')
+        profile = profiles.get(data.get('profile', default_profile.name))
+
+        if current_player not in ['yellow', 'red']:
+            return jsonify({'error': 'Invalid player'}), 400
+        if profile is None:
+            return jsonify({'error': f'unknown profile, choose from {sorted(profiles)}'}), 400
+        if session_id is not None:
+            # a session tree is only reused by the same model
+            session_id = (profile.model, str(session_id))
+
+        try:
+            ticket = admission.admit(profile.sims)
+        except Overloaded as e:
+            response = jsonify({'error': str(e), 'retryAfter': e.retry_after})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+
+        try:
+            column, evaluation, sims, reused, effective_sims = get_ai_move(
+                evaluator, board, current_player, ticket.sims, sessions, session_id,
+                models[profile.model].model, profile.temperature, search_stats,
+                parallel.get(profile.model) if parallel is not None and session_id is None else None)
+        except (ValueError, TypeError) as e:
+            ticket.release()
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            app.logger.exception('Error in AI move')
+            ticket.release()
+            latencies.add(time.time() - start, error=True)
+            return jsonify({'error': str(e)}), 500
+
+        ticket.release(time.time() - start, sims)
+        latencies.add(time.time() - start, sims=sims, effective_sims=effective_sims)
+        profile_requests[profile.name] += 1
         return jsonify({
             'column': column,
-            'evaluation': evaluation
+            'evaluation': evaluation,
+            'profile': profile.name,
+            'simBudget': ticket.sims,
+            'sims': sims,
+            'reusedVisits': reused,
+            'effectiveSims': effective_sims
         })
-    except Exception as e:
-        print(f"Error in AI move: {e}")
-        return jsonify({'error': str(e)}), 500
-
-@app.route('/validate-move', methods=['POST'])
-def validate_move():
-    data = request.json
-    board = data['board']
-    move = data['move']
-    
-    column = move['column']
-    if column < 0 or column >= 7:
-        return jsonify({'valid': False})
-    
-    # Check if column has space
-    column_cells = board[column]
-    valid = any(cell is None for cell in column_cells)
-    
-    return jsonify({'valid': valid})
-
-@app.route('/health', methods=['GET'])
-def health():
-    return jsonify({'status': 'healthy'})
+
+    @app.route('/analyze', methods=['POST'])
+    def analyze():
+        # {"positions": [{"moves": "4453"}, {"yellow": ..., "red": ...}, ...], "sims": 0, "profile": ...}
+        # see positions.py. The profile only chooses the model
+        data = request.get_json(silent=True) or {}
+        records = data.get('positions')
+        sims = data.get('sims', 0)
+        profile = profiles.get(data.get('profile', default_profile.name))
+        if profile is None:
+            return jsonify({'error': f'unknown profile, choose from {sorted(profiles)}'}), 400
+        if not isinstance(records, list) or not all(isinstance(record, dict) for record in records):
+            return jsonify({'error': 'positions must be a list of objects'}), 400
+        if len(records) > config.api_max_positions:
+            return jsonify({'error': f'at most {config.api_max_positions} positions per request'}), 400
+        if not isinstance(sims, int) or not 0 <= sims <= max_sims:
+            return jsonify({'error': f'sims must be between 0 and {max_sims}'}), 400
+        for i, record in enumerate(records):
+            try:
+                parse_position(record)
+            except (ValueError, TypeError) as e:
+                return jsonify({'error': f'position {i}: {e}'}), 400
+
+        # the searches of the positions share the batched evaluator of the process
+        results = analyze_records(models[profile.model].model, records, sims, evaluator)
+        return jsonify({'results': results})
+
+    @app.route('/validate-move', methods=['POST'])
+    def validate_move():
+        data = request.json
+        board = data['board']
+        move = data['move']
+
+        column = move['column']
+        if column < 0 or column >= 7:
+            return jsonify({'valid': False})
+
+        # Check if column has space
+        column_cells = board[column]
+        valid = any(cell is None for cell in column_cells)
+
+        return jsonify({'valid': valid})
+
+    @app.route('/end-session', methods=['POST'])
+    def end_session():
+        data = request.get_json(silent=True) or {}
+        for name in models:
+            sessions.discard((name, str(data.get('sessionId'))))
+        return jsonify({'ended': True})
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({'status': 'healthy', 'modelVersion': models[default_profile.model].version,
+                        'models': {name: manager.info() for name, manager in models.items()}})
+
+    @app.route('/reload', methods=['POST'])
+    def reload():
+        # {"model": name} or all the models. Reloads the process serving this request, the others follow the file watch
+        data = request.get_json(silent=True) or {}
+        names = [data['model']] if 'model' in data else list(models)
+        if any(name not in models for name in names):
+            return jsonify({'error': f'unknown model, choose from {sorted(models)}'}), 400
+        started = {name: models[name].reload() for name in names}
+        return jsonify({'reloading': True, 'started': started,
+                        'modelVersion': models[default_profile.model].version}), 202
+
+    @app.route('/profiles', methods=['GET'])
+    def list_profiles():
+        return jsonify({'default': default_profile.name,
+                        'profiles': {name: profile.to_dict() for name, profile in profiles.items()}})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        summary = latencies.summary()
+        summary['pid'] = os.getpid()
+        summary['meanBatchSize'] = evaluator.mean_batch_size()
+        summary['sessions'] = sessions.summary()
+        summary['admission'] = admission.summary()
+        summary['profiles'] = dict(profile_requests)
+        if search_stats is not None:
+            # per process, see search_stats.py
+            with stats_lock:
+                summary['search'] = search_stats.summary()
+        return jsonify(summary)
+
+    return app
+
+def serve(host, port, workers, model_path, sim_number):
+    """Serve with `workers` processes accepting on the same socket"""
+    latencies = LatencyWindow()
+
+    if workers == 1:
+        threads.use('serving')
+        app = create_app(model_path, sim_number, latencies)
+        print(f"Serving on http://{host}:{port}")
+        make_server(host, port, app, threaded=True).serve_forever()
+        return
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    # the model is loaded after the fork, each process using its share of the cores (see threads.py)
+    pids = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            threads.use('serving')
+            app = create_app(model_path, sim_number, latencies)
+            make_server(host, port, app, threaded=True, fd=sock.fileno()).serve_forever()
+            os._exit(0)
+        pids.append(pid)
+
+    print(f"Serving on http://{host}:{port} with {workers} processes")
+    try:
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except KeyboardInterrupt:
+        for pid in pids:
+            os.kill(pid, signal.SIGTERM)
 
 if __name__ == '__main__':
-    app.run(port=5000, debug=True)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Connect 4 move server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=config.api_workers, help='server processes')
+    parser.add_argument('--model', default=None, help="checkpoint of the 'best' model (config.serving_models)")
+    parser.add_argument('--sims', type=int, default=None, help='MCTS sims per move of the default profile')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers, args.model, args.sims)
@@ -0,0 +1,48 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             artifacts.py
+# Description:      Paths and stamps of the artifacts exported from a checkpoint (see
+#                   export_model.py), without torch so that numpy_net.py can check them
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# An artifact best_model_resnet.<ext> comes with best_model_resnet.<ext>.json, the stamp of the checkpoint it was
+# exported from (size, mtime) and of the config of the net : it is up to date while they match.
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import json
+import os
+import config
+# ============================================================================ #
+
+EXTENSIONS = {'torchscript': '.pt', 'onnx': '.onnx', 'numpy': '.npz'}
+
+
+# ---------------------------------------------------------------------------- #
+def artifact_path(model_path, backend):
+    return os.path.splitext(model_path)[0] + EXTENSIONS[backend]
+
+
+def stamp_path(path):
+    return path + '.json'
+
+
+# stamp of the checkpoint an artifact is made from, and of the config of the net it was built with
+def source_stamp(model_path):
+    stat = os.stat(model_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+            'net': [config.H, config.L, config.convsize, config.res_tower, config.polfilters, config.valfilters,
+                    config.usehiddenpol, config.hiddensize]}
+
+
+# true when the artifact of backend exists and was made from the current checkpoint
+def is_fresh(model_path, backend):
+    path = artifact_path(model_path, backend)
+    try:
+        with open(stamp_path(path)) as file:
+            return os.path.exists(path) and json.load(file) == source_stamp(model_path)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,302 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             benchmark.py
+# Description:      Seeded CPU benchmarks of the game engines, searches, NN inference,
+#                   self-play and training, saved as JSON and compared to a baseline
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Every scenario is seeded and uses untrained NNs built from the seed, so that two runs do the same work.
+# A metric ending with _per_sec or _per_hour is better when higher, one ending with _ms when lower.
+#
+#   python benchmark.py -o results.json                          all scenarios
+#   python benchmark.py --quick --only game,mcts                 smaller sizes, some scenarios
+#   python benchmark.py --baseline benchmark_baseline.json       exit code 1 on a regression
+#   python benchmark.py --save-baseline benchmark_baseline.json  new baseline (same machine !)
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import time
+import numpy as np
+import torch
+import config
+from Game_bitboard import Game
+from Game3D import Game3D
+from MCTS import MCTS
+from MCTS_NN import MCTS_NN
+from ResNet import resnet18, ResNet_Training
+from ResNet3D import resnet18_3d
+from inference import flats_to_batch
+from rng import RandomStreams
+import main_functions
+
+# relative slowdown allowed before a metric counts as a regression
+DEFAULT_THRESHOLD = 0.2
+
+
+# ---------------------------------------------------------------------------- #
+def seed_all(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    torch.manual_seed(seed)
+
+
+# ---------------------------------------------------------------------------- #
+# median over repeats of func(), which returns {metric: value}
+def repeated(func, repeats):
+    runs = [func() for _ in range(repeats)]
+    return {metric: float(np.median([run[metric] for run in runs])) for metric in runs[0]}
+
+
+# ---------------------------------------------------------------------------- #
+# random games : rate of move generation (allowed_moves) and win checks (gameover)
+def bench_game(quick, seed):
+    games = 50 if quick else 500
+    rand = random.Random(seed)
+    move_calls, win_calls = 0, 0
+    move_time, win_time = 0., 0.
+    for _ in range(games):
+        game = Game()
+        while True:
+            start = time.perf_counter()
+            over, _ = game.gameover()
+            win_time += time.perf_counter() - start
+            win_calls += 1
+            if over:
+                break
+            start = time.perf_counter()
+            moves = game.allowed_moves()
+            move_time += time.perf_counter() - start
+            move_calls += 1
+            game.takestep(rand.choice(moves))
+    return {'movegen_per_sec': move_calls / move_time, 'win_checks_per_sec': win_calls / win_time}
+
+
+def bench_game3d(quick, seed):
+    games = 10 if quick else 100
+    rand = random.Random(seed)
+    move_calls, win_calls = 0, 0
+    move_time, win_time = 0., 0.
+    for _ in range(games):
+        game = Game3D()
+        while True:
+            start = time.perf_counter()
+            over = game.is_game_over()
+            win_time += time.perf_counter() - start
+            win_calls += 1
+            if over:
+                break
+            start = time.perf_counter()
+            moves = game.allowed_moves()
+            move_time += time.perf_counter() - start
+            move_calls += 1
+            game = game.make_move(*rand.choice(moves))
+    return {'movegen_per_sec': move_calls / move_time, 'win_checks_per_sec': win_calls / win_time}
+
+
+# ---------------------------------------------------------------------------- #
+# pure MCTS (rollouts) and MCTS_NN sims from the empty board
+def bench_mcts(quick, seed):
+    sims = 200 if quick else 2000
+    seed_all(seed)
+    tree = MCTS(rng=RandomStreams(seed))
+    rootnode = tree.createNode(Game().state)
+    start = time.perf_counter()
+    for _ in range(sims):
+        tree.simulate(rootnode, main_functions.UCT_simu, config.CPUCT, config.use_counter_in_pure_mcts)
+    return {'sims_per_sec': sims / (time.perf_counter() - start)}
+
+
+def bench_mcts_nn(quick, seed):
+    sims = 50 if quick else 400
+    seed_all(seed)
+    model = resnet18()
+    model.eval()
+    tree = MCTS_NN(model, use_dirichlet=False, rng=RandomStreams(seed))
+    rootnode = tree.createNode(Game().state)
+    start = time.perf_counter()
+    with torch.no_grad():
+        for _ in range(sims):
+            tree.simulate(rootnode, config.CPUCT)
+    return {'sims_per_sec': sims / (time.perf_counter() - start)}
+
+
+# ---------------------------------------------------------------------------- #
+# forward latency of one batch of random positions, per batch size
+def forward_latencies(model, make_batch, quick):
+    results = {}
+    for size in [1, 8, 64]:
+        x = make_batch(size)
+        calls = max(3, (20 if quick else 200) // size)
+        with torch.no_grad():
+            model.forward(x)
+            start = time.perf_counter()
+            for _ in range(calls):
+                model.forward(x)
+        elapsed = (time.perf_counter() - start) / calls
+        results['batch{}_ms'.format(size)] = elapsed * 1000
+        results['batch{}_positions_per_sec'.format(size)] = size / elapsed
+    return results
+
+
+def bench_resnet(quick, seed):
+    seed_all(seed)
+    model = resnet18()
+    model.eval()
+    flats = [np.random.randint(0, 2, 3 * config.H * config.L).astype(float) for _ in range(64)]
+    return forward_latencies(model, lambda size: flats_to_batch(flats[:size]), quick)
+
+
+def bench_resnet3d(quick, seed):
+    seed_all(seed)
+    model = resnet18_3d()
+    model.eval()
+    states = [np.random.randint(0, 2, 192).astype(float) for _ in range(64)]
+    inputs = torch.stack([model._convert_3d_to_input(state) for state in states])
+    return forward_latencies(model, lambda size: inputs[:size], quick)
+
+
+# ---------------------------------------------------------------------------- #
+# self-play games in this process (the training loop runs config.CPUS of them in parallel)
+def bench_self_play(quick, seed):
+    games = 1 if quick else 4
+    sims = 10 if quick else 50
+    seed_all(seed)
+    model = resnet18()
+    model.eval()
+
+    saved = config.SIM_NUMBER, config.sim_number_defense
+    config.SIM_NUMBER = config.sim_number_defense = sims
+    data_file = './data/createdata_benchmark.txt'
+    try:
+        start = time.perf_counter()
+        for i in range(games):
+            main_functions.onevsonegame(model, sims, model, sims, 'player1' if i % 2 == 0 else 'player2',
+                                        config.CPUCT, config.tau_self_play, config.tau_zero_self_play,
+                                        config.dirichlet_for_self_play, '_benchmark', RandomStreams([seed, i]))
+        elapsed = time.perf_counter() - start
+    finally:
+        config.SIM_NUMBER, config.sim_number_defense = saved
+        if os.path.exists(data_file):
+            os.remove(data_file)
+    return {'games_per_hour': games * 3600 / elapsed, 'sims': sims}
+
+
+# ---------------------------------------------------------------------------- #
+def bench_training(quick, seed):
+    samples = 8 * config.MINIBATCH if quick else 64 * config.MINIBATCH
+    seed_all(seed)
+    data = np.random.rand(samples, 3 * config.H * config.L + config.L + 1)
+    use_cuda, config.use_cuda = config.use_cuda, False
+    try:
+        training = ResNet_Training(resnet18(), config.MINIBATCH, 1, config.sgd_lr, data, data, 0)
+        start = time.perf_counter()
+        # progress lines of trainNet away from the JSON on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            training.trainNet()
+        elapsed = time.perf_counter() - start
+    finally:
+        config.use_cuda = use_cuda
+    return {'samples_per_sec': samples / elapsed}
+
+
+SCENARIOS = {
+    'game': bench_game,
+    'game3d': bench_game3d,
+    'mcts': bench_mcts,
+    'mcts_nn': bench_mcts_nn,
+    'resnet': bench_resnet,
+    'resnet3d': bench_resnet3d,
+    'self_play': bench_self_play,
+    'training': bench_training,
+}
+
+
+# ---------------------------------------------------------------------------- #
+def environment(threads, quick, seed):
+    return {'python': platform.python_version(), 'torch': torch.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(), 'processor': platform.processor(), 'cpus': os.cpu_count(),
+            'threads': threads, 'quick': quick, 'seed': seed, 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def run(names=None, quick=False, seed=0, repeats=3, threads=1):
+    previous_threads = torch.get_num_threads()
+    torch.set_num_threads(threads)
+    results = {}
+    try:
+        for name in names or SCENARIOS:
+            start = time.time()
+            # training and self-play are long enough to be measured once
+            results[name] = repeated(lambda: SCENARIOS[name](quick, seed),
+                                     1 if name in ['self_play', 'training'] else repeats)
+            print('{:<10} {:>6.1f}s  {}'.format(name, time.time() - start, ', '.join(
+                '{} {:.4g}'.format(metric, value) for metric, value in results[name].items())), file=sys.stderr)
+    finally:
+        torch.set_num_threads(previous_threads)
+    return {'environment': environment(threads, quick, seed), 'results': results}
+
+
+# ---------------------------------------------------------------------------- #
+# metrics worse than the baseline by more than threshold (relative). Returns a list of
+# (scenario, metric, baseline value, value, relative change), the change being negative for a slowdown
+def compare(report, baseline, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, metrics in report['results'].items():
+        for metric, value in metrics.items():
+            base = baseline['results'].get(name, {}).get(metric)
+            if not base:
+                continue
+            if metric.endswith('_ms'):
+                change = base / value - 1
+            elif metric.endswith('_per_sec') or metric.endswith('_per_hour'):
+                change = value / base - 1
+            else:
+                continue
+            if change < -threshold:
+                regressions.append((name, metric, base, value, change))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='CPU benchmarks of the game, searches, NN, self-play and training')
+    parser.add_argument('--only', default=None, help='comma separated scenarios among ' + ', '.join(SCENARIOS))
+    parser.add_argument('--quick', action='store_true', help='smaller sizes (smoke test)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeats', type=int, default=3, help='runs per scenario, the median is kept')
+    parser.add_argument('--threads', type=int, default=1, help='torch threads')
+    parser.add_argument('-o', '--output', default=None, help='JSON file of the results')
+    parser.add_argument('--baseline', default=None, help='JSON results to compare to')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='relative slowdown allowed')
+    parser.add_argument('--save-baseline', default=None, help='also save the results as this baseline')
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else None
+    if names and any(name not in SCENARIOS for name in names):
+        parser.error('unknown scenario, choose from ' + ', '.join(SCENARIOS))
+
+    report = run(names, args.quick, args.seed, args.repeats, args.threads)
+    for path in [args.output, args.save_baseline]:
+        if path:
+            with open(path, 'w') as file:
+                json.dump(report, file, indent=2)
+    if not args.output:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['environment'].get('quick') != args.quick:
+            print('warning: the baseline was run with quick =', baseline['environment'].get('quick'), file=sys.stderr)
+        regressions = compare(report, baseline, args.threshold)
+        for name, metric, base, value, change in regressions:
+            print('REGRESSION {} {} : {:.4g} -> {:.4g} ({:+.0f}%)'.format(name, metric, base, value, 100 * change),
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print('no regression against', args.baseline, 'with threshold', args.threshold, file=sys.stderr)
@@ -0,0 +1,105 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             benchmark_root_parallel.py
+# Description:      Root parallel search against the usual single tree search,
+#                   both players getting the same wall-clock time per move
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import argparse
+import os
+import random
+import time
+import numpy as np
+import config
+import main_functions
+from MCTS_NN import MCTS_NN
+from MCTS_parallel import RootParallelMCTS, run_sims, root_statistics, merge_root_statistics
+from Game_bitboard import Game
+
+
+# ---------------------------------------------------------------------------- #
+def move_of_col(game, col):
+    for move in game.allowed_moves():
+        if game.convert_move_to_col_index(move) == col:
+            return move
+
+
+# ---------------------------------------------------------------------------- #
+# plays one game, returns +1 if the root parallel player wins, -1 if it loses, 0 for a draw,
+# and the number of sims per move done by each player
+def play_game(player, parallel_search, time_per_move, parallel_is_yellow, opening):
+    game = Game()
+    for col in opening:
+        game.takestep(move_of_col(game, col))
+
+    sims = {'parallel': [], 'single': []}
+
+    while not game.gameover()[0]:
+        if (game.player_turn == 1) == parallel_is_yellow:
+            result = parallel_search.search(game.state, time_budget=time_per_move, cpuct=config.CPUCT)
+            sims['parallel'].append(result['sims'])
+        else:
+            tree = MCTS_NN(player, use_dirichlet=False)
+            rootnode = tree.createNode(game.state)
+            done = run_sims(tree, rootnode, config.CPUCT, time_budget=time_per_move)
+            result = merge_root_statistics([root_statistics(rootnode)])
+            sims['single'].append(done)
+
+        game.takestep(move_of_col(game, result['col']))
+
+    _, winner = game.gameover()
+    if winner == 0:
+        return 0, sims
+    return (1 if (winner == 1) == parallel_is_yellow else -1), sims
+
+
+# ---------------------------------------------------------------------------- #
+def launch(games, time_per_move, workers, opening_moves, seed):
+    rand = random.Random(seed)
+    player = main_functions.load_or_create_neural_net()
+    if workers is None:
+        workers = max(2, (os.cpu_count() or 1) - 1)
+    parallel_search = RootParallelMCTS(player, workers=workers)
+
+    print('root parallel search with', parallel_search.workers, 'trees against a single tree,',
+          time_per_move, 's per move,', games, 'games')
+
+    wins, draws, losses = 0, 0, 0
+    all_sims = {'parallel': [], 'single': []}
+    start = time.time()
+
+    for i in range(games):
+        # both colors play the same random opening, then the colors are swapped
+        if i % 2 == 0:
+            opening = [rand.randrange(config.L) for _ in range(opening_moves)]
+        result, sims = play_game(player, parallel_search, time_per_move, i % 2 == 0, opening)
+        wins += result == 1
+        draws += result == 0
+        losses += result == -1
+        for key in all_sims:
+            all_sims[key] += sims[key]
+        print('game', i + 1, 'result for root parallel', result)
+
+    parallel_search.close()
+
+    score = (wins + draws / 2) / games
+    print('')
+    print('root parallel wins', wins, 'draws', draws, 'loses', losses, '- score', int(1000 * score) / 10, '%')
+    print('mean sims per move : root parallel (all trees)', int(np.mean(all_sims['parallel'])),
+          '- single tree', int(np.mean(all_sims['single'])))
+    print('took', int(time.time() - start), 's')
+    return score
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Root parallel against single tree search at fixed time per move')
+    parser.add_argument('--games', type=int, default=20)
+    parser.add_argument('--time', type=float, default=0.2, help='wall-clock seconds per move for both players')
+    parser.add_argument('--workers', type=int, default=None, help='trees searched in parallel (default: all cores but one)')
+    parser.add_argument('--opening', type=int, default=2, help='random opening moves, to vary the games')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    launch(args.games, args.time, args.workers, args.opening, args.seed)
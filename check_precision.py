@@ -0,0 +1,176 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             check_precision.py
+# Description:      Accuracy guard of the reduced precision modes : policies and values compared
+#                   to float32, with the speedup and the memory saved by each mode
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# The positions are the test-position suite (config.position_suite), or the replay data of a run checkpoint.
+# A mode passes when its largest policy and value differences to float32 are within
+# config.precision_policy_tolerance and config.precision_value_tolerance ; the exit code is 1 otherwise.
+#
+#   python check_precision.py                                       best_model_resnet.pth on the suite
+#   python check_precision.py --replay checkpoints/run-0003-end.pth --rows 4096
+#   python check_precision.py --modes bfloat16 --no-training -o precision.json
+
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+import torch
+import config
+import checkpoint
+import precision
+from ResNet import resnet18, ResNet_Training
+from inference import load_model, flats_to_batch
+from positions import state_from_moves, flatten_states
+from position_suite import load_suite
+from numpy_net import as_numpy
+
+
+# ---------------------------------------------------------------------------- #
+# flat states of the suite positions
+def suite_flats(path=None, limit=None):
+    records = load_suite(path, limit=limit)
+    return flatten_states([state_from_moves(record['moves']) for record in records])
+
+
+# flat states of rows of the replay data saved in a run checkpoint (see checkpoint.py)
+def replay_flats(path, rows, seed=0):
+    data = checkpoint.load_checkpoint(path)['dataseen']
+    data = data[np.any(data != 0, axis=1)]
+    picked = np.random.RandomState(seed).choice(data.shape[0], min(rows, data.shape[0]), replace=False)
+    return data[picked, :3 * config.H * config.L]
+
+
+# ---------------------------------------------------------------------------- #
+def evaluate(net, flats, batch_size=256):
+    values, policies = [], []
+    with torch.no_grad():
+        for first in range(0, len(flats), batch_size):
+            value, policy = net.forward(flats_to_batch(flats[first:first + batch_size]))
+            values.append(as_numpy(value)[:, 0])
+            policies.append(as_numpy(policy))
+    return np.concatenate(values), np.concatenate(policies)
+
+
+# differences of the outputs of net in mode to those of the float32 net
+def compare(model, flats, mode):
+    values, policies = evaluate(model, flats)
+    reduced_values, reduced_policies = evaluate(precision.for_inference(model, mode), flats)
+    policy_errors = np.abs(reduced_policies - policies)
+    value_errors = np.abs(reduced_values - values)
+    result = {'positions': len(flats),
+              'policyMaxError': float(policy_errors.max()),
+              'policyMeanError': float(policy_errors.mean()),
+              'valueMaxError': float(value_errors.max()),
+              'valueMeanError': float(value_errors.mean()),
+              'bestMoveAgreement': float(np.mean(reduced_policies.argmax(1) == policies.argmax(1)))}
+    result['ok'] = bool(result['policyMaxError'] <= config.precision_policy_tolerance
+                        and result['valueMaxError'] <= config.precision_value_tolerance)
+    return result
+
+
+# ---------------------------------------------------------------------------- #
+# ms per forward pass of a batch of each size (the MCTS evaluates one leaf, a BatchedEvaluator many)
+def inference_ms(net, flats, batch_sizes=(1, 64), seconds=1.0):
+    timings = {}
+    with torch.no_grad():
+        for size in batch_sizes:
+            x = flats_to_batch(np.resize(flats, (size, flats.shape[1])))
+            net.forward(x)
+            calls, start = 0, time.perf_counter()
+            while calls < 3 or time.perf_counter() - start < seconds:
+                net.forward(x)
+                calls += 1
+            timings[size] = 1000 * (time.perf_counter() - start) / calls
+    return timings
+
+
+# samples per second of one epoch of ResNet_Training with the given train precision, on random data
+def training_samples_per_sec(mode, batches=32, seed=0):
+    data = np.random.RandomState(seed).rand(batches * config.MINIBATCH, 3 * config.H * config.L + config.L + 1)
+    saved = config.train_precision, config.use_cuda
+    config.train_precision, config.use_cuda = mode, False
+    try:
+        torch.manual_seed(seed)
+        training = ResNet_Training(resnet18(), config.MINIBATCH, 1, 0.01, data, None, 0)
+        start = time.perf_counter()
+        training.trainNet()
+        return batches * config.MINIBATCH / (time.perf_counter() - start)
+    finally:
+        config.train_precision, config.use_cuda = saved
+
+
+# ---------------------------------------------------------------------------- #
+# accuracy, speedup and memory of each mode against float32
+def check(model, flats, modes=('bfloat16', 'float16'), training=True, seconds=1.0):
+    reference_ms = inference_ms(model, flats, seconds=seconds)
+    reference_bytes = precision.model_bytes(model)
+    reference_training = None
+    if training:
+        # the first training of the process is slower (allocations)
+        training_samples_per_sec('float32', batches=2)
+        reference_training = training_samples_per_sec('float32')
+    report = {'float32': {'inferenceMs': reference_ms, 'modelBytes': reference_bytes,
+                          'trainSamplesPerSec': reference_training}}
+    for mode in modes:
+        net = precision.for_inference(model, mode)
+        row = compare(model, flats, mode)
+        row['inferenceMs'] = inference_ms(net, flats, seconds=seconds)
+        row['speedup'] = {size: reference_ms[size] / row['inferenceMs'][size] for size in reference_ms}
+        row['modelBytes'] = precision.model_bytes(net)
+        row['memorySaved'] = 1 - row['modelBytes'] / reference_bytes
+        # autocast training is only for bfloat16
+        if training and mode == 'bfloat16':
+            row['trainSamplesPerSec'] = training_samples_per_sec(mode)
+            row['trainSpeedup'] = row['trainSamplesPerSec'] / reference_training
+        report[mode] = row
+    return report
+
+
+def format_report(report):
+    lines = ['mode       policy err (max/mean)  value err (max/mean)  best move  speedup b1/b64  memory saved  train speedup']
+    for mode, row in report.items():
+        if mode == 'float32':
+            continue
+        sizes = sorted(row['speedup'])
+        lines.append('{:<9}  {:>9.4f} / {:<9.5f}  {:>8.4f} / {:<9.5f}  {:>8.1%}  {:>13}  {:>12.0%}  {:>13}  {}'.format(
+            mode, row['policyMaxError'], row['policyMeanError'], row['valueMaxError'], row['valueMeanError'],
+            row['bestMoveAgreement'], ' / '.join('{:.2f}x'.format(row['speedup'][size]) for size in sizes),
+            row['memorySaved'], '{:.2f}x'.format(row['trainSpeedup']) if 'trainSpeedup' in row else '-',
+            'ok' if row['ok'] else 'FAILED'))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reduced precision modes compared to float32')
+    parser.add_argument('--model', default='./best_model_resnet.pth', help='untrained NN if the file does not exist')
+    parser.add_argument('--modes', default='bfloat16,float16', help='comma separated, among bfloat16, float16')
+    parser.add_argument('--suite', default=config.position_suite)
+    parser.add_argument('--limit', type=int, default=None, help='suite positions per group')
+    parser.add_argument('--replay', default=None, metavar='CHECKPOINT', help='replay data of a run checkpoint instead')
+    parser.add_argument('--rows', type=int, default=4096, help='replay rows')
+    parser.add_argument('--no-training', action='store_true', help='skip the training speed of bfloat16 autocast')
+    parser.add_argument('-o', '--output', default=None, help='JSON file of the report')
+    args = parser.parse_args()
+
+    if os.path.exists(args.model):
+        model = load_model(args.model, 'float32', 'torch')
+    else:
+        print('no model at', args.model, ': untrained NN', file=sys.stderr)
+        model = resnet18()
+        model.eval()
+
+    flats = replay_flats(args.replay, args.rows) if args.replay else suite_flats(args.suite, args.limit)
+    report = check(model, flats, [precision.check_mode(mode) for mode in args.modes.split(',')],
+                   training=not args.no_training)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    sys.exit(0 if all(row.get('ok', True) for row in report.values()) else 1)
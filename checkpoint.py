@@ -0,0 +1,105 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             checkpoint.py
+# Description:      Run checkpoints of Main.py : everything needed to resume a training
+#                   run (iteration, model, optimizer, Elo ratings, replay data, random
+#                   generators), written atomically
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# A checkpoint is written twice per iteration i (every config.run_checkpoint_every iterations) :
+#   run_<i>_selfplay.pt   after the self-play of iteration i, with its data : a run resumed from it does
+#                         not replay the games, and goes on with the training, gating and Elo games
+#   run_<i>_end.pt        at the end of iteration i : a run resumed from it starts iteration i + 1
+# Each file is written to a temporary file then renamed, so that a crash never leaves a partial checkpoint.
+# Only the config.run_checkpoint_keep last files are kept.
+#
+#   python Main.py --resume                        from the last checkpoint of config.run_checkpoint_dir
+#   python Main.py --resume ./checkpoints/run_00012_end.pt
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import glob
+import os
+import random
+import re
+import numpy as np
+import torch
+import config
+# ============================================================================ #
+
+# stages of an iteration, in their order
+SELF_PLAY = 'selfplay'
+END = 'end'
+STAGES = [SELF_PLAY, END]
+
+
+# ---------------------------------------------------------------------------- #
+def checkpoint_path(iteration, stage, directory=None):
+    directory = config.run_checkpoint_dir if directory is None else directory
+    return os.path.join(directory, 'run_{:05d}_{}.pt'.format(iteration, stage))
+
+
+# (iteration, stage index) of a checkpoint file, None for another file
+def checkpoint_order(path):
+    match = re.match(r'run_(\d+)_(\w+)\.pt$', os.path.basename(path))
+    if match is None or match.group(2) not in STAGES:
+        return None
+    return int(match.group(1)), STAGES.index(match.group(2))
+
+
+# checkpoints of directory, oldest first
+def list_checkpoints(directory=None):
+    directory = config.run_checkpoint_dir if directory is None else directory
+    paths = [path for path in glob.glob(os.path.join(directory, 'run_*.pt')) if checkpoint_order(path)]
+    return sorted(paths, key=checkpoint_order)
+
+
+def latest_checkpoint(directory=None):
+    paths = list_checkpoints(directory)
+    return paths[-1] if paths else None
+
+
+# ---------------------------------------------------------------------------- #
+# state of the global generators (the searches use their own streams, see rng.py)
+def rng_state():
+    return {'random': random.getstate(), 'numpy': np.random.get_state(), 'torch': torch.get_rng_state()}
+
+
+def restore_rng_state(state):
+    random.setstate(state['random'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+
+
+# ---------------------------------------------------------------------------- #
+# writes state (a dict, see Main.launch) as the checkpoint of (iteration, stage) and removes the old ones
+def save_checkpoint(state, iteration, stage, directory=None, keep=None):
+    keep = config.run_checkpoint_keep if keep is None else keep
+    path = checkpoint_path(iteration, stage, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state = dict(state, iteration=iteration, stage=stage, rng=rng_state())
+    tmp_path = path + '.tmp'
+    torch.save(state, tmp_path)
+    os.replace(tmp_path, path)
+
+    paths = list_checkpoints(os.path.dirname(path))
+    for old in paths[:max(len(paths) - keep, 0)]:
+        os.remove(old)
+    return path
+
+
+# ---------------------------------------------------------------------------- #
+# checkpoint of path (the last one of config.run_checkpoint_dir when path is None), its random generators
+# restored. Raises FileNotFoundError when there is none
+def load_checkpoint(path=None):
+    if path is None:
+        path = latest_checkpoint()
+        if path is None:
+            raise FileNotFoundError('no run checkpoint in {}'.format(config.run_checkpoint_dir))
+    # the checkpoint holds numpy arrays and python objects besides tensors
+    state = torch.load(path, map_location='cpu', weights_only=False)
+    restore_rng_state(state['rng'])
+    return state
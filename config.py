@@ -36,6 +36,79 @@ use_counter_in_mcts_nn = False
 # it is actually not required since the NN does learn it by itself (see the probability going to zero at turn 6 for the full central column)
 maskinmcts = False
 
+#root parallel search for interactive play (see MCTS_parallel.py): number of independent trees searched in parallel
+#processes for one move. 1 is the usual single tree search, None uses all cores but one. In api_server.py it
+#replaces the batched search of the requests without a session
+root_parallel_workers = 1
+#wall-clock budget in seconds per move for interactive play (GUIs, api server), on top of their sim number.
+#None means no time limit. The search also stops early when the move is forced or cannot change (see search_control.py)
+move_time_budget = None
+#pondering in the GUIs (see pondering.py): the AI keeps searching while the human thinks, and keeps the subtree
+#of the move played. ponder_max_sims caps the sims of one pondering (memory)
+ponder = False
+ponder_max_sims = 100000
+#per-phase instrumentation of the MCTS_NN sims (see search_stats.py): time in selection, expansion, leaf evaluation
+#and backfill, depth, nodes, NN calls and tree sizes, printed after self-play and given by the api server /metrics
+search_stats = False
+#timeline of the training run (see tracing.py): spans of the iterations, self-play and gating games, searches, training
+#steps and Elo checkpoints from all the processes, merged into trace_dir/trace.json (chrome://tracing, ui.perfetto.dev)
+#after each iteration. trace_nn adds a span per NN forward of the searches (large files)
+trace = False
+trace_dir = './traces'
+trace_nn = False
+#profiles of the self-play, tournament and Elo worker processes (see profiling.py): None, 'cprofile' (deterministic)
+#or 'sampling' (stack sampled every profile_sample_interval s of CPU time). Merged into profile_dir/report.txt
+profile_workers = None
+profile_dir = './profiles'
+profile_sample_interval = 0.005
+#torch intra-op threads of each phase (see threads.py), None for the default of the machine : 1 per self-play worker,
+#every core for the training, the cores shared out between the api_workers when serving
+threads_self_play = None
+threads_training = None
+threads_serving = None
+#pins each self-play / tournament worker to one core (Linux only)
+pin_workers = False
+#run checkpoints of Main.py (see checkpoint.py): after the self-play and at the end of every run_checkpoint_every
+#iterations (0 : never), the run_checkpoint_keep last ones are kept. python Main.py --resume continues from the last one
+run_checkpoint_dir = './checkpoints'
+run_checkpoint_every = 1
+run_checkpoint_keep = 2
+#deterministic mode (see rng.py): None seeds every game and iteration from the OS. With an int, the searches,
+#self-play, gating and Elo games, training set sampling and NN init of an iteration are fixed by (seed, iteration)
+seed = None
+
+#api server (see api_server.py and inference.py): leaf evaluations of concurrent requests are batched together.
+#A batch runs when every searching request has a leaf queued, when inference_max_batch leaves are queued,
+#or after inference_max_wait seconds. api_workers is the number of server processes, api_sim_number the sims per move
+inference_max_batch = 64
+inference_max_wait = 0.002
+api_workers = 1
+api_sim_number = sim_number_defense
+api_max_positions = 4096 #positions per /analyze request
+#admission control of the api server (see admission.py): sims per move are cut when more than admission_soft_in_flight
+#requests are searched at once, or when the full sim budget would take more than admission_target_latency seconds.
+#Budgets below admission_min_sims give a move from the NN policy alone, requests past admission_max_in_flight get a 503
+admission_soft_in_flight = 16
+admission_max_in_flight = 64
+admission_target_latency = 1.0
+admission_min_sims = 4
+admission_ewma = 0.1
+#serving processes (api server, GUI) check the model file every model_watch_interval seconds and hot reload a new
+#best model (see model_reload.py). None disables the watch
+model_watch_interval = 5
+#checkpoints served by the api server, and its strength profiles (see profiles.py): a request names a profile, which
+#gives the model, the sims per move (0 for moves from the NN policy alone) and the move temperature (0 plays the best move)
+serving_models = {'best': './best_model_resnet.pth'}
+strength_profiles = {'easy': {'sims': 0, 'temperature': 1.0},
+                     'normal': {'sims': api_sim_number, 'temperature': 0},
+                     'hard': {'sims': 200, 'temperature': 0},
+                     'nightmare': {'sims': 800, 'temperature': 0}}
+default_profile = 'normal'
+#game sessions of the api server (see sessions.py): the search tree of a session is dropped after session_ttl seconds
+#without request, and the least recently used trees are dropped when all trees hold more than session_max_nodes nodes
+session_ttl = 600
+session_max_nodes = 500000
+
 #----------------------------------------------------------------------#
 #NN architecture
 
@@ -63,13 +136,33 @@ annealing = 30
 # Neural Net training
 
 use_cuda = True #if you have a GPU
+#reduced precision on the CPU (see precision.py, check it with python check_precision.py) : 'float32', or 'bfloat16'
+#autocast for the training ; 'float32', 'bfloat16' or 'float16' nets for the NN evaluations of self play and serving
+train_precision = 'float32'
+inference_precision = 'float32'
+#largest differences to float32 of the policies and the values accepted by check_precision.py
+precision_policy_tolerance = 0.05
+precision_value_tolerance = 0.05
+#int8 models (see quantize.py) : 'static' (convolutions and dense layers, calibrated on quantize_calibration_rows
+#replay positions) or 'dynamic' (dense layers only). With serve_int8 the api server and the GUIs load the int8 model
+#saved next to each float one, and Main.py writes a new one with every new best model
+quantize_mode = 'static'
+quantize_calibration_rows = 2048
+quantized_engine = 'x86' #'qnnpack' on ARM
+serve_int8 = False
+#how the processes that load a float checkpoint (api server, GUIs) run it (see export_model.py) : 'torch' (resnet18 and
+#its state_dict), 'torchscript' (frozen trace cached next to the checkpoint), 'onnx' (needs onnxruntime) or 'numpy'
+#(see numpy_net.py). The exported backends are float32 : inference_precision only applies to 'torch'
+model_backend = 'torch'
 momentum = 0.9
+carry_optimizer_state = False #True : the optimizer (momentum) goes on from one training to the next, and is saved in the run checkpoints
 wdecay = 0.0001 #weight decay
 EPOCHS = 4
 MINIBATCH = 32
 MAXMEMORY = MINIBATCH * 3000 #one iteration of 400 games typically creates 600-1000 batches : here we thus save the last 10-6 games or so
 MAXBATCHNUMBER = 1000 #and we improve the NN by sample randomly in the last maxmemory batches
 MINBATCHNUMBER = 64
+train_processes = 1 #resnet on the CPU : > 1 for data-parallel training with this many processes (see distributed_training.py)
 
 #----------------------------------------------------------------------#
 #self play options
@@ -102,7 +195,13 @@ useprevdata = False
 #----------------------------------------------------------------------#
 #MCTS checkpoint options and ELO ratings
 use_counter_in_pure_mcts = False
+# pure MCTS leaf evaluation (see Rollout_bitboard.py) : number of random playouts per expanded leaf, and whether
+# all the children of the expanded leaf are rolled out at once. 1 and False give the original single python rollout
+rollouts_per_leaf = 1
+rollout_all_children = False
 printstatefreq = 1
+#positions with known solutions (see position_suite.py and solver.py): accuracy, value error and speed of the engines
+position_suite = './position_suite.jsonl'
 checkpoint_frequency = 1
 
 #----------------------------------------------------------------------#
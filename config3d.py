@@ -105,6 +105,10 @@ use_counter_in_pure_mcts = False
 printstatefreq = 1
 checkpoint_frequency = 1
 
+#----------------------------------------------------------------------#
+#pondering in the 3D GUI (see pondering.py)
+ponder = False
+
 #----------------------------------------------------------------------#
 # print particular values on specific states for 3D
 
@@ -5,8 +5,7 @@ Demo script showing AI vs AI game
 
 from MCTS_NN import MCTS_NN
 from Game_bitboard import Game
-from ResNet import resnet18
-import torch
+import numpy_net
 import numpy as np
 import time
 
@@ -16,9 +15,8 @@ def ai_vs_ai_demo():
     
     # Load the trained model
     print("Loading trained neural network...")
-    model = resnet18()
-    model.load_state_dict(torch.load('./best_model_resnet.pth'))
-    model.eval()
+    # NumPy export of the model (see numpy_net.py)
+    model = numpy_net.load_player('./best_model_resnet.pth')
     print("Model loaded successfully!\n")
     
     # Initialize game
@@ -90,9 +88,8 @@ def show_nn_analysis():
     """Show neural network's analysis of key positions"""
     print("\n=== Neural Network Analysis of Key Positions ===\n")
     
-    model = resnet18()
-    model.load_state_dict(torch.load('./best_model_resnet.pth'))
-    model.eval()
+    # NumPy export of the model (see numpy_net.py)
+    model = numpy_net.load_player('./best_model_resnet.pth')
     
     # Analyze some standard openings
     positions = [
@@ -116,14 +113,13 @@ def show_nn_analysis():
         
         # Get NN evaluation
         flat_state = game.state_flattener(game.state)
-        with torch.no_grad():
-            value, policy = model.forward(flat_state)
+        value, policy = model.forward(flat_state)
         
         print(f"{desc}:")
         game.display_it()
         print(f"Current player: {'Yellow' if game.player_turn == 1 else 'Red'}")
         print(f"NN evaluation: {value.item():.3f}")
-        print(f"Move probabilities: {[f'{p:.1%}' for p in policy.numpy()[0]]}")
+        print(f"Move probabilities: {[f'{p:.1%}' for p in policy[0]]}")
         print()
 
 if __name__ == '__main__':
@@ -0,0 +1,155 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             distributed_training.py
+# Description:      Data-parallel training of the resnet on the CPU : processes on localhost
+#                   each training on a shard of the data, gradients all-reduced with gloo
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# With config.train_processes = N > 1, improve_model_resnet (main_functions.py) trains with train(). The N processes
+# are forked from the caller (same weights), join a gloo process group on 127.0.0.1 and each train a
+# DistributedDataParallel copy of the net on every N-th row of the sampled data, with minibatches of config.MINIBATCH :
+# a step sees N * MINIBATCH samples and an epoch has N times less steps. The gradients are averaged over the processes
+# after each backward, so the copies stay identical ; the first one writes its weights and optimizer state, which are
+# loaded back into the player of the caller (the same module as with a single process).
+# Each process gets its share of the training thread budget (see threads.py).
+#
+#   python distributed_training.py --processes 1 2 4      throughput and scaling efficiency of 1, 2 and 4 processes
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import argparse
+import os
+import socket
+import sys
+import tempfile
+import time
+from multiprocessing import Process
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+import config
+import threads
+from ResNet import ResNet_Training, resnet18
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# a free port of localhost for the rendezvous of the process group
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+# ================================= CLASS : DistributedTraining ================================= #
+
+class DistributedTraining(ResNet_Training):
+    # -----------------------------------------------------------------#
+    # ResNet_Training of one process of the group : the tensors are made from the shard with the plain net,
+    # which is then wrapped so that backward all-reduces its gradients
+    def __init__(self, net, batch_size, n_epoch, learning_rate, shard, optimizer_state=None):
+        super(DistributedTraining, self).__init__(net, batch_size, n_epoch, learning_rate, shard, None, 0,
+                                                  optimizer_state)
+        self.module = net
+        self.net = DistributedDataParallel(net)
+
+    def trainNet(self):
+        super(DistributedTraining, self).trainNet()
+        self.net = self.module
+
+
+# ---------------------------------------------------------------------------- #
+# one process of the group. Rank 0 saves the result (weights, optimizer state, training time) to result_path
+def train_worker(rank, processes, port, player, data, learning_rate, optimizer_state, seed, result_path):
+    config.use_cuda = False
+    torch.set_num_threads(max(1, threads.budget('training') // processes))
+    torch.manual_seed(seed + rank)
+    if rank != 0:
+        sys.stdout = open(os.devnull, 'w')
+
+    dist.init_process_group('gloo', init_method='tcp://127.0.0.1:{}'.format(port), rank=rank,
+                            world_size=processes)
+    try:
+        training = DistributedTraining(player, config.MINIBATCH, config.EPOCHS, learning_rate,
+                                       data[rank::processes], optimizer_state)
+        dist.barrier()
+        start = time.time()
+        training.trainNet()
+        elapsed = time.time() - start
+        if rank == 0:
+            torch.save({'model': player.state_dict(), 'optimizer': training.optimizer.state_dict(),
+                        'seconds': elapsed}, result_path)
+    finally:
+        dist.destroy_process_group()
+
+
+# ---------------------------------------------------------------------------- #
+# trains player in place with `processes` processes on data (rows of self play, as for ResNet_Training).
+# Returns the state of the optimizer and the samples per second of the training
+def train(player, data, learning_rate, optimizer_state=None, processes=None):
+    if processes is None:
+        processes = config.train_processes
+    # equal shards : every process makes the same number of steps
+    data = data[:data.shape[0] - data.shape[0] % processes]
+    if data.shape[0] // processes < config.MINIBATCH:
+        raise ValueError('{} rows do not make a minibatch per process'.format(data.shape[0]))
+
+    player.cpu()
+    port = free_port()
+    seed = int(torch.randint(2 ** 31 - 1 - processes, (1,)))
+    result_path = os.path.join(tempfile.mkdtemp(), 'result.pth')
+    workers = [Process(target=train_worker, args=(rank, processes, port, player, data, learning_rate,
+                                                  optimizer_state, seed, result_path))
+               for rank in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    if any(worker.exitcode != 0 for worker in workers) or not os.path.exists(result_path):
+        raise RuntimeError('distributed training failed, exit codes {}'.format([w.exitcode for w in workers]))
+
+    result = torch.load(result_path, weights_only=False)
+    os.remove(result_path)
+    os.rmdir(os.path.dirname(result_path))
+    player.load_state_dict(result['model'])
+
+    steps = (data.shape[0] // processes) // config.MINIBATCH
+    samples_per_sec = config.EPOCHS * steps * config.MINIBATCH * processes / max(result['seconds'], 1e-9)
+    print('{} processes : {:.0f} samples/sec'.format(processes, samples_per_sec))
+    return result['optimizer'], samples_per_sec
+
+
+# ---------------------------------------------------------------------------- #
+# throughput of the same training with each number of processes, and its scaling efficiency
+# (throughput over processes times the throughput of 1 process)
+def scaling(process_counts, rows=None, seed=0):
+    rows = rows or config.MINIBATCH * config.MAXBATCHNUMBER
+    rand = np.random.RandomState(seed)
+    data = rand.rand(rows, 3 * config.H * config.L + config.L + 1)
+    results = {}
+    for processes in sorted(set([1] + list(process_counts))):
+        torch.manual_seed(seed)
+        player = resnet18()
+        _, results[processes] = train(player, data, config.sgd_lr, processes=processes)
+    return [(processes, results[processes], results[processes] / (processes * results[1]))
+            for processes in sorted(results)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scaling of the data-parallel training on this machine')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--rows', type=int, default=None, help='rows of random training data')
+    parser.add_argument('--epochs', type=int, default=1)
+    args = parser.parse_args()
+
+    config.EPOCHS = args.epochs
+    config.use_cuda = False
+    report = scaling(args.processes, args.rows)
+    print('')
+    print('processes  samples/sec  efficiency')
+    for processes, samples_per_sec, efficiency in report:
+        print('{:>9d}  {:>11.0f}  {:>9.0%}'.format(processes, samples_per_sec, efficiency))
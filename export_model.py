@@ -0,0 +1,232 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             export_model.py
+# Description:      Exported artifacts of a trained resnet (frozen TorchScript, ONNX for
+#                   onnxruntime, NumPy arrays), cached next to the checkpoint and loaded without ResNet.py
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Backends (config.model_backend), used by inference.load_model for the float checkpoints :
+#   torch        resnet18() built from config, then load_state_dict (nothing exported)
+#   torchscript  the net traced on a (batch, 3, H, L) input and frozen (batchnorms folded into the convolutions,
+#                no python branch on the type of the input), saved as best_model_resnet.pt
+#   onnx         the same graph as best_model_resnet.onnx, run by onnxruntime (optional package, CPU provider)
+#   numpy        batchnorms folded, weights as im2col matrices in best_model_resnet.npz, run by numpy_net.py
+#                without torch (also for a ResNet3D, with export_numpy)
+# The batch size stays free (the BatchedEvaluator runs batches of any size), the board shape is fixed.
+#
+# An artifact records the size and mtime of the checkpoint it was exported from (see artifacts.py) : load_exported
+# uses it directly when they still match, and exports it again otherwise (e.g. after Main.py saved a new best model). It is written
+# atomically, so that serving processes loading at the same time only ever see complete files.
+#
+#   python export_model.py                       the artifacts of best_model_resnet.pth, startup and forward timings
+#   python export_model.py --backends numpy --model other.pth
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import argparse
+import importlib.util
+import subprocess
+import json
+import os
+import sys
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+import config
+import numpy_net
+from artifacts import EXTENSIONS, artifact_path, source_stamp, stamp_path, is_fresh
+from ResNet import resnet18, ResNet
+from ResNet3D import ResNet3D
+# ============================================================================ #
+
+BACKENDS = ['torch', 'torchscript', 'onnx', 'numpy']
+
+
+# ---------------------------------------------------------------------------- #
+def example_input(batch=1):
+    return torch.zeros(batch, 3, config.H, config.L)
+
+
+# flat states (one or a batch) as the input tensor of an exported net
+def as_batch(x):
+    if type(x) == np.ndarray:
+        x = torch.as_tensor(x, dtype=torch.float32)
+    return x.reshape(-1, 3, config.H, config.L)
+
+
+# ---------------------------------------------------------------------------- #
+# float resnet of a checkpoint, on the CPU
+def load_float(model_path):
+    model = resnet18()
+    model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    model.eval()
+    return model
+
+
+def write_atomic(path, write):
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_json(data, path):
+    with open(path, 'w') as file:
+        json.dump(data, file)
+
+
+# writes the artifact of backend for the checkpoint model_path, returns its path
+def export(model_path, backend, model=None):
+    if backend not in EXTENSIONS:
+        raise ValueError('no artifact for the backend {!r}, among {}'.format(backend, sorted(EXTENSIONS)))
+    if backend == 'onnx' and importlib.util.find_spec('onnx') is None:
+        raise ImportError("the onnx export needs the onnx package")
+    model = model if model is not None else load_float(model_path)
+    path = artifact_path(model_path, backend)
+    stamp = source_stamp(model_path)
+
+    with torch.no_grad():
+        if backend == 'torchscript':
+            frozen = torch.jit.freeze(torch.jit.trace(model, example_input()))
+            write_atomic(path, lambda tmp_path: torch.jit.save(frozen, tmp_path))
+        elif backend == 'numpy':
+            export_numpy(model, path)
+        else:
+            write_atomic(path, lambda tmp_path: torch.onnx.export(
+                model, (example_input(),), tmp_path, input_names=['board'], output_names=['value', 'policy'],
+                dynamic_axes={'board': {0: 'batch'}, 'value': {0: 'batch'}, 'policy': {0: 'batch'}}, dynamo=False))
+    write_atomic(stamp_path(path), lambda tmp_path: write_json(stamp, tmp_path))
+    return path
+
+
+# frozen NumPy arrays of a trained ResNet or ResNet3D (see numpy_net.py), written to path
+def export_numpy(model, path):
+    if not isinstance(model, (ResNet, ResNet3D)):
+        raise ValueError('no NumPy export of {}'.format(type(model).__name__))
+    kind = 'connect4_3d' if isinstance(model, ResNet3D) else 'connect4'
+    state = {key: value.detach().cpu().numpy() for key, value in model.state_dict().items()}
+    frozen = numpy_net.freeze(state, kind, model.group1.conv1.padding[0])
+    write_atomic(path, lambda tmp_path: numpy_net.save(frozen, tmp_path))
+
+
+# =============================== CLASS: TorchScriptNet ================================ #
+# player for MCTS_NN or a BatchedEvaluator, with the (value, policy) interface of the resnet
+class TorchScriptNet(nn.Module):
+    # not converted by precision.for_inference
+    fixed_precision = True
+
+    def __init__(self, path):
+        super(TorchScriptNet, self).__init__()
+        self.net = torch.jit.load(path, map_location='cpu')
+        self.net.eval()
+
+    def forward(self, x):
+        return self.net(as_batch(x))
+
+# ============================================================================ #
+
+
+# =============================== CLASS: OnnxNet ================================ #
+# same interface, evaluated by an onnxruntime session (imported here : optional package)
+class OnnxNet:
+    fixed_precision = True
+
+    def __init__(self, path):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise ImportError("config.model_backend = 'onnx' needs the onnxruntime package")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+    def eval(self):
+        return self
+
+    def forward(self, x):
+        board = as_batch(x).detach().numpy().astype(np.float32, copy=False)
+        value, policy = self.session.run(['value', 'policy'], {'board': board})
+        return torch.from_numpy(value), torch.from_numpy(policy)
+
+    __call__ = forward
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# net of the artifact of backend for the checkpoint model_path, exported first when missing or stale
+def load_exported(model_path, backend=None):
+    backend = backend or config.model_backend
+    if not is_fresh(model_path, backend):
+        export(model_path, backend)
+    path = artifact_path(model_path, backend)
+    if backend == 'numpy':
+        return numpy_net.load(path)
+    return TorchScriptNet(path) if backend == 'torchscript' else OnnxNet(path)
+
+
+# ---------------------------------------------------------------------------- #
+# seconds to load, and ms per forward pass of a batch of each size
+def timings(load, batch_sizes=(1, 64), calls=50):
+    start = time.perf_counter()
+    net = load()
+    result = {'loadSeconds': time.perf_counter() - start}
+    with torch.no_grad():
+        for size in batch_sizes:
+            x = torch.rand(size, 3, config.H, config.L).round()
+            # the first calls of a TorchScript net optimize its graph
+            for _ in range(3):
+                net.forward(x)
+            start = time.perf_counter()
+            for _ in range(calls):
+                net.forward(x)
+            result[size] = 1000 * (time.perf_counter() - start) / calls
+    return net, result
+
+
+# seconds for a new python process to import what a backend needs and load the model of model_path
+def startup_seconds(model_path, backend):
+    if backend == 'numpy':
+        code = 'import numpy_net; numpy_net.load_player({!r})'.format(model_path)
+    else:
+        code = 'from inference import load_model; load_model({!r}, backend={!r})'.format(model_path, backend)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Exported artifacts of a checkpoint, with load and forward timings')
+    parser.add_argument('--model', default='./best_model_resnet.pth')
+    parser.add_argument('--backends', default='torchscript,onnx,numpy',
+                        help='comma separated, among torchscript, onnx, numpy')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        sys.exit('no model at {}'.format(args.model))
+    model_path = os.path.abspath(args.model)
+    reference, reference_times = timings(lambda: load_float(model_path))
+    print('{:<12} startup {:5.2f} s  load {:6.1f} ms  batch 1 {:6.2f} ms  batch 64 {:6.2f} ms'.format(
+        'torch', startup_seconds(model_path, 'torch'), 1000 * reference_times['loadSeconds'], reference_times[1],
+        reference_times[64]))
+    x = torch.rand(16, 3, config.H, config.L).round()
+    for backend in args.backends.split(','):
+        try:
+            path = export(model_path, backend, reference)
+            net, times = timings(lambda: load_exported(model_path, backend))
+        except ImportError as error:
+            print('{:<12} skipped : {}'.format(backend, error))
+            continue
+        with torch.no_grad():
+            error = max(float(np.abs(numpy_net.as_numpy(a) - numpy_net.as_numpy(b)).max())
+                        for a, b in zip(net.forward(x), reference.forward(x)))
+        print('{:<12} startup {:5.2f} s  load {:6.1f} ms  batch 1 {:6.2f} ms  batch 64 {:6.2f} ms  '
+              'max difference {:.1e}  {}'.format(backend, startup_seconds(model_path, backend),
+                                                 1000 * times['loadSeconds'], times[1], times[64], error, path))
@@ -12,6 +12,8 @@ import math
 
 from Game3D import Game3D
 from MCTS_NN3D import MCTS_NN3D
+from pondering import Ponderer, reuse_subtree
+import config3d
 import torch
 import numpy as np
 import random
@@ -30,6 +32,9 @@ class HumanVsAI3DGUI:
         self.moves_history = []
         self.human_color = None
         self.ai_simulations = 50
+        self.mcts = None
+        self.search_root = None
+        self.ponderer = None
         self.is_human_turn = False
         self.game_active = False
         self.ai_thread = None
@@ -184,6 +189,13 @@ class HumanVsAI3DGUI:
                                  values=["Yellow (First)", "Red (Second)"],
                                  state="readonly", width=15)
         color_combo.pack(side='left', padx=5)
+        
+        # Pondering: the AI keeps searching while the human thinks
+        self.ponder_var = tk.BooleanVar(value=config3d.ponder)
+        tk.Checkbutton(control_frame, text="Ponder", variable=self.ponder_var,
+                      command=self.on_ponder_change,
+                      fg=self.colors['text'], bg=self.colors['bg'],
+                      selectcolor=self.colors['bg'], font=('Arial', 12)).pack(side='left', padx=(20, 5))
     
     def setup_status_area(self, parent):
         """Setup status and move history area"""
@@ -381,6 +393,8 @@ class HumanVsAI3DGUI:
             self.ai_simulations = 50
         
         # Initialize game
+        self.stop_pondering()
+        self.search_root = None
         self.game = Game3D()
         self.turn = 0
         self.moves_history = []
@@ -398,6 +412,8 @@ class HumanVsAI3DGUI:
         # If AI goes first
         if not self.is_human_turn:
             self.root.after(1000, self.make_ai_move)
+        else:
+            self.start_pondering()
     
     def make_human_move(self, move):
         """Make a human move"""
@@ -410,6 +426,10 @@ class HumanVsAI3DGUI:
             self.update_status("Invalid move!")
             return
         
+        # Keep the subtree searched while the human was thinking
+        self.stop_pondering()
+        self.search_root = reuse_subtree(self.search_root, move)
+        
         self.game = new_game
         self.turn += 1
         self.moves_history.append(move)
@@ -444,8 +464,15 @@ class HumanVsAI3DGUI:
     def ai_move_thread(self):
         """AI move calculation in separate thread"""
         try:
-            mcts = MCTS_NN3D(self.ai_player, use_dirichlet=False)
-            root = mcts.run_simulations(self.game, self.ai_simulations, cpuct=1.0)
+            # Start from the subtree kept while pondering, if any
+            mcts = self.get_mcts()
+            root = self.search_root
+            if root is None:
+                root = mcts.createNode(self.game)
+            reused = {child.move: child.N for child in root.children}
+            
+            for _ in range(self.ai_simulations):
+                mcts.simulate(root, 1.0)
             
             if root.children:
                 visits = [child.N for child in root.children]
@@ -454,12 +481,16 @@ class HumanVsAI3DGUI:
                 
                 # Prepare analysis
                 analysis = f"AI Analysis (Turn {self.turn + 1}):\n"
+                if reused:
+                    analysis += f"  {sum(reused.values())} visits reused from pondering\n"
                 sorted_children = sorted(root.children, key=lambda x: x.N, reverse=True)
                 for i, child in enumerate(sorted_children[:3]):
                     visits = child.N
                     win_rate = 50 * (1 - child.Q) if child.Q != 0 else 50
-                    analysis += f"  {child.move}: {visits} visits, {win_rate:.1f}%\n"
+                    analysis += f"  {child.move}: {visits} visits ({reused.get(child.move, 0)} reused), {win_rate:.1f}%\n"
                 
+                # The subtree of the chosen move is where pondering continues
+                self.search_root = reuse_subtree(root, best_move) if self.ponder_var.get() else None
                 self.message_queue.put(('move', best_move, analysis))
             else:
                 # Fallback to random
@@ -501,6 +532,7 @@ class HumanVsAI3DGUI:
                     # Switch to human turn
                     self.is_human_turn = True
                     self.update_status("Your turn! Click on a column to play.")
+                    self.start_pondering()
                 else:
                     self.update_status("AI move error!")
             
@@ -514,6 +546,7 @@ class HumanVsAI3DGUI:
     def end_game(self):
         """Handle game end"""
         self.game_active = False
+        self.stop_pondering()
         winner = self.game.get_winner()
         
         if winner == 0:
@@ -531,6 +564,7 @@ class HumanVsAI3DGUI:
         if self.game_active:
             if messagebox.askyesno("Resign", "Are you sure you want to resign?"):
                 self.game_active = False
+                self.stop_pondering()
                 self.update_status("Game resigned.")
     
     def on_difficulty_change(self, event):
@@ -543,6 +577,36 @@ class HumanVsAI3DGUI:
         else:
             self.ai_simulations = 50
     
+    def get_mcts(self):
+        """MCTS kept across moves, so that pondered subtrees can be reused"""
+        if self.mcts is None:
+            self.mcts = MCTS_NN3D(self.ai_player, use_dirichlet=False)
+        return self.mcts
+    
+    def start_pondering(self):
+        """Search from the current position while the human thinks"""
+        if not self.ponder_var.get() or not self.game_active:
+            return
+        mcts = self.get_mcts()
+        if self.search_root is None:
+            self.search_root = mcts.createNode(self.game)
+        if self.ponderer is None:
+            self.ponderer = Ponderer(lambda node: mcts.simulate(node, 1.0))
+        self.ponderer.start(self.search_root)
+    
+    def stop_pondering(self):
+        """Stop the background search, the tree is then safe to use"""
+        if self.ponderer is not None:
+            self.ponderer.stop()
+    
+    def on_ponder_change(self):
+        """Handle pondering checkbox"""
+        if not self.ponder_var.get():
+            self.stop_pondering()
+            self.search_root = None
+        elif self.is_human_turn:
+            self.start_pondering()
+    
     def update_status(self, message):
         """Update status label"""
         self.status_label.configure(text=message)
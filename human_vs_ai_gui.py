@@ -10,10 +10,14 @@ import time
 import queue
 
 from MCTS_NN import MCTS_NN
+from MCTS_parallel import RootParallelMCTS
+from pondering import Ponderer, reuse_subtree
+from model_reload import ModelManager
 from Game_bitboard import Game
-from ResNet import resnet18
 import torch
 import numpy as np
+import os
+import config
 
 class HumanVsAIGUI:
     def __init__(self, root):
@@ -25,10 +29,18 @@ class HumanVsAIGUI:
         # Game state
         self.game = None
         self.model = None
+        self.model_manager = None
+        self.new_model = None
         self.turn = 0
         self.moves_history = []
         self.human_color = None
         self.ai_simulations = 200
+        self.parallel_workers = config.root_parallel_workers
+        self.parallel_search = None
+        self.ponder = config.ponder
+        self.tree = None
+        self.search_root = None
+        self.ponderer = None
         self.is_human_turn = False
         self.game_active = False
         self.ai_thread = None
@@ -122,12 +134,12 @@ class HumanVsAIGUI:
         analysis_frame.pack(fill='x', pady=10)
         
         # Analysis table
-        columns = ('Col', 'Visits', 'Win %', 'Policy %')
+        columns = ('Col', 'Visits', 'Reused', 'Win %', 'Policy %')
         self.analysis_tree = ttk.Treeview(analysis_frame, columns=columns, show='headings', height=5)
         
         for col in columns:
             self.analysis_tree.heading(col, text=col)
-            self.analysis_tree.column(col, width=120, anchor='center')
+            self.analysis_tree.column(col, width=100, anchor='center')
         
         self.analysis_tree.pack(fill='x', padx=10, pady=10)
         
@@ -178,11 +190,13 @@ class HumanVsAIGUI:
             self.status_label.config(text="Loading Alpha Zero neural network...")
             self.root.update()
             
-            self.model = resnet18()
-            self.model.load_state_dict(torch.load('./best_model_resnet.pth'))
-            self.model.eval()
+            # The model file is watched: a new best model is loaded in the background
+            self.model_manager = ModelManager('./best_model_resnet.pth')
+            self.model = self.model_manager.model
+            self.model_manager.on_swap(self.model_swapped)
+            self.model_manager.watch()
             
-            self.status_label.config(text="Alpha Zero loaded successfully! Ready to play.")
+            self.status_label.config(text=f"Alpha Zero loaded successfully (model {self.model_manager.version})! Ready to play.")
         except Exception as e:
             messagebox.showerror("Error", f"Failed to load AI model: {str(e)}")
             self.status_label.config(text="Failed to load AI model")
@@ -191,7 +205,7 @@ class HumanVsAIGUI:
         """Show game settings dialog"""
         settings_window = tk.Toplevel(self.root)
         settings_window.title("Game Settings")
-        settings_window.geometry("400x300")
+        settings_window.geometry("400x330")
         settings_window.configure(bg=self.colors['bg'])
         
         # Color choice
@@ -227,6 +241,21 @@ class HumanVsAIGUI:
                           fg=self.colors['text'], bg=self.colors['bg'],
                           selectcolor=self.colors['bg']).pack(anchor='w')
         
+        # Root parallel search
+        cores = max(1, (os.cpu_count() or 1) - 1)
+        self.parallel_var = tk.BooleanVar(value=self.parallel_workers != 1)
+        tk.Checkbutton(diff_frame, text=f"⚡ Search with {cores} cores (root parallel)",
+                      variable=self.parallel_var,
+                      fg=self.colors['text'], bg=self.colors['bg'],
+                      selectcolor=self.colors['bg']).pack(anchor='w')
+        
+        # Pondering (single tree search only)
+        self.ponder_var = tk.BooleanVar(value=self.ponder)
+        tk.Checkbutton(diff_frame, text="🧠 Think during your turn (pondering)",
+                      variable=self.ponder_var,
+                      fg=self.colors['text'], bg=self.colors['bg'],
+                      selectcolor=self.colors['bg']).pack(anchor='w')
+        
         # Buttons
         btn_frame = tk.Frame(settings_window, bg=self.colors['bg'])
         btn_frame.pack(pady=20)
@@ -243,6 +272,15 @@ class HumanVsAIGUI:
         diff_map = {"Easy": 50, "Normal": 200, "Hard": 500, "Nightmare": 1000}
         self.ai_simulations = diff_map[self.diff_var.get()]
         
+        workers = None if self.parallel_var.get() else 1
+        if workers != self.parallel_workers:
+            self.parallel_workers = workers
+            self.close_parallel_search()
+        
+        self.ponder = self.ponder_var.get()
+        if not self.ponder:
+            self.stop_pondering()
+        
         self.status_label.config(text=f"Settings applied: {self.human_color}, {self.diff_var.get()} AI")
         window.destroy()
     
@@ -253,6 +291,9 @@ class HumanVsAIGUI:
             return
         
         # Reset game state
+        self.stop_pondering()
+        self.search_root = None
+        self.use_new_model()
         self.game = Game()
         self.turn = 0
         self.moves_history = []
@@ -277,6 +318,7 @@ class HumanVsAIGUI:
         if self.is_human_turn:
             self.enable_human_moves()
             self.status_label.config(text="Your turn! Click a column to make your move.")
+            self.start_pondering()
         else:
             self.disable_human_moves()
             self.status_label.config(text="AI is thinking...")
@@ -390,6 +432,10 @@ class HumanVsAIGUI:
         if move is None:
             return
         
+        # Keep the subtree searched while the human was thinking
+        self.stop_pondering()
+        self.search_root = reuse_subtree(self.search_root, move)
+        
         # Make the move
         self.game.takestep(move)
         self.moves_history.append(col)
@@ -416,6 +462,7 @@ class HumanVsAIGUI:
     
     def start_ai_move(self):
         """Start AI move in separate thread"""
+        self.use_new_model()
         self.ai_thread = threading.Thread(target=self.ai_move_worker)
         self.ai_thread.daemon = True
         self.ai_thread.start()
@@ -426,29 +473,55 @@ class HumanVsAIGUI:
     def ai_move_worker(self):
         """Worker thread for AI move calculation"""
         try:
-            # Create MCTS tree
-            tree = MCTS_NN(self.model, use_dirichlet=False)
-            rootnode = tree.createNode(self.game.state)
-            
-            # Run simulations
-            for _ in range(self.ai_simulations):
-                tree.simulate(rootnode, cpuct=1)
-            
-            # Get analysis
-            visits = []
-            moves = []
-            q_values = []
-            
-            for child in rootnode.children:
-                visits.append(child.N)
-                col = self.game.convert_move_to_col_index(child.move)
-                moves.append(col)
-                q_values.append(child.Q)
-            
-            # Choose best move
-            best_idx = np.argmax(visits)
-            best_move = rootnode.children[best_idx].move
-            best_col = moves[best_idx]
+            reused_visits = None
+            if self.parallel_workers != 1:
+                # Root parallel search: one tree per process, statistics merged per column
+                if self.parallel_search is None:
+                    self.parallel_search = RootParallelMCTS(self.model, workers=self.parallel_workers)
+                self.search_root = None
+                result = self.parallel_search.search(self.game.state, sim_number=self.ai_simulations,
+                                                     time_budget=config.move_time_budget, cpuct=1)
+                search_info = f"{result['sims']} sims on {self.parallel_search.workers} trees"
+                moves = result['cols']
+                visits = result['visits']
+                q_values = result['q_values']
+                best_col = result['col']
+                best_move = [m for m in self.game.allowed_moves()
+                             if self.game.convert_move_to_col_index(m) == best_col][0]
+            else:
+                # Start from the subtree kept while pondering, if any
+                tree = self.get_tree()
+                rootnode = self.search_root
+                if rootnode is None:
+                    rootnode = tree.createNode(self.game.state)
+                reused = {child.move: child.N for child in rootnode.children}
+                
+                # Run simulations (stops early if the move is forced or decided)
+                report = tree.search(rootnode, cpuct=1, max_sims=self.ai_simulations,
+                                     max_time=config.move_time_budget)
+                search_info = f"{report.sims} sims, {report.elapsed:.2f}s, stop: {report.stop_reason}"
+                if reused:
+                    search_info += f", {sum(reused.values())} visits reused"
+                
+                # Get analysis
+                visits = []
+                moves = []
+                q_values = []
+                reused_visits = []
+                
+                for child in rootnode.children:
+                    visits.append(child.N)
+                    col = self.game.convert_move_to_col_index(child.move)
+                    moves.append(col)
+                    q_values.append(child.Q)
+                    reused_visits.append(reused.get(child.move, 0))
+                
+                # Choose best move
+                best_move = report.best_child.move
+                best_col = self.game.convert_move_to_col_index(best_move)
+                
+                # The subtree of the chosen move is where pondering continues
+                self.search_root = reuse_subtree(rootnode, best_move) if self.ponder else None
             
             # Get policy for analysis
             flat_state = self.game.state_flattener(self.game.state)
@@ -462,7 +535,9 @@ class HumanVsAIGUI:
                 'moves': moves,
                 'visits': visits,
                 'q_values': q_values,
-                'policy': policy.numpy()[0]
+                'reused': reused_visits,
+                'policy': policy.numpy()[0],
+                'search_info': search_info
             }))
             
         except Exception as e:
@@ -496,7 +571,8 @@ class HumanVsAIGUI:
         # Update display
         self.update_board_display(data['col'])
         self.update_evaluation_from_game()
-        self.update_move_analysis(data['moves'], data['visits'], data['q_values'], data['policy'])
+        self.update_move_analysis(data['moves'], data['visits'], data['q_values'], data['policy'],
+                                  data['reused'])
         
         # Check for game over
         gameover, winner = self.game.gameover()
@@ -508,7 +584,8 @@ class HumanVsAIGUI:
         self.is_human_turn = True
         self.enable_human_moves()
         self.update_turn_display()
-        self.status_label.config(text="Your turn! Click a column to make your move.")
+        self.status_label.config(text=f"AI played column {data['col']} ({data['search_info']}). Your turn!")
+        self.start_pondering()
     
     def update_evaluation_from_game(self):
         """Update evaluation from current game state"""
@@ -518,8 +595,8 @@ class HumanVsAIGUI:
         
         self.update_evaluation(value.item())
     
-    def update_move_analysis(self, moves, visits, q_values, policy):
-        """Update move analysis table"""
+    def update_move_analysis(self, moves, visits, q_values, policy, reused=None):
+        """Update move analysis table (reused: visits kept from pondering, per move)"""
         # Clear existing items
         for item in self.analysis_tree.get_children():
             self.analysis_tree.delete(item)
@@ -533,10 +610,11 @@ class HumanVsAIGUI:
             visit = visits[idx]
             win_pct = 50 * (1 - q_values[idx])
             policy_pct = policy[col] * 100
+            reused_visit = reused[idx] if reused is not None else '-'
             
             tags = ('best',) if i == 0 else ()
             self.analysis_tree.insert('', 'end', 
-                                    values=(col, visit, f"{win_pct:.1f}%", f"{policy_pct:.1f}%"),
+                                    values=(col, visit, reused_visit, f"{win_pct:.1f}%", f"{policy_pct:.1f}%"),
                                     tags=tags)
         
         # Style the best move
@@ -568,9 +646,57 @@ class HumanVsAIGUI:
         detail = f"Total moves: {len(self.moves_history)}\nSequence: {moves_str}"
         messagebox.showinfo("Game Over", f"{result}\n\n{detail}")
     
+    def model_swapped(self, model, version):
+        """Called from the reload thread: the new model is used from the next AI move"""
+        self.new_model = (model, version)
+    
+    def use_new_model(self):
+        """Switch to a reloaded model, between two AI moves"""
+        if self.new_model is None:
+            return
+        self.stop_pondering()
+        self.model, version = self.new_model
+        self.new_model = None
+        self.tree = None
+        self.search_root = None
+        self.ponderer = None
+        self.close_parallel_search()
+        self.root.after(0, lambda: self.status_label.config(text=f"New model {version} loaded"))
+    
+    def get_tree(self):
+        """MCTS tree kept across moves, so that pondered subtrees can be reused"""
+        if self.tree is None:
+            self.tree = MCTS_NN(self.model, use_dirichlet=False)
+        return self.tree
+    
+    def start_pondering(self):
+        """Search from the current position while the human thinks"""
+        if not self.ponder or self.parallel_workers != 1 or not self.game_active:
+            return
+        tree = self.get_tree()
+        if self.search_root is None:
+            self.search_root = tree.createNode(self.game.state)
+        if self.ponderer is None:
+            # the tree current at each sim : a reloaded model gets a new tree
+            self.ponderer = Ponderer(lambda node: self.get_tree().simulate(node, 1))
+        self.ponderer.start(self.search_root)
+    
+    def stop_pondering(self):
+        """Stop the background search, the tree is then safe to use"""
+        if self.ponderer is not None:
+            self.ponderer.stop()
+    
+    def close_parallel_search(self):
+        """Stop the root parallel search processes"""
+        if self.parallel_search is not None:
+            self.parallel_search.close()
+            self.parallel_search = None
+    
     def quit_game(self):
         """Quit the application"""
         if messagebox.askokcancel("Quit", "Are you sure you want to quit?"):
+            self.stop_pondering()
+            self.close_parallel_search()
             self.root.quit()
 
 def main():
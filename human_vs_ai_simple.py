@@ -4,10 +4,11 @@ Simple Human vs AI Connect 4 with minimal UI for testing
 """
 
 from MCTS_NN import MCTS_NN
+from pondering import Ponderer, reuse_subtree
 from Game_bitboard import Game
-from ResNet import resnet18
-import torch
+import numpy_net
 import numpy as np
+import config
 
 def simple_board_display(game, last_col=None):
     """Simple board display"""
@@ -56,22 +57,23 @@ def get_human_move(game):
         except ValueError:
             print("Please enter a number!")
 
-def get_ai_move(game, model, simulations=100):
-    """Get move from AI"""
+def get_ai_move(game, model, simulations=100, tree=None, rootnode=None):
+    """Get move from AI, continuing from rootnode (a subtree kept while pondering) if given"""
     print(f"AI is thinking with {simulations} simulations...")
     
     # Create MCTS tree
-    tree = MCTS_NN(model, use_dirichlet=False)
-    rootnode = tree.createNode(game.state)
+    if tree is None:
+        tree = MCTS_NN(model, use_dirichlet=False)
+    if rootnode is None:
+        rootnode = tree.createNode(game.state)
+    reused = {child.move: child.N for child in rootnode.children}
     
-    # Run simulations
-    for _ in range(simulations):
-        tree.simulate(rootnode, cpuct=1)
+    # Run simulations (stops early if the move is forced or decided)
+    report = tree.search(rootnode, cpuct=1, max_sims=simulations, max_time=config.move_time_budget)
     
     # Get best move
-    visits = [child.N for child in rootnode.children]
-    best_idx = np.argmax(visits)
-    best_move = rootnode.children[best_idx].move
+    best_idx = rootnode.children.index(report.best_child)
+    best_move = report.best_child.move
     best_col = game.convert_move_to_col_index(best_move)
     
     # Show AI analysis
@@ -81,10 +83,14 @@ def get_ai_move(game, model, simulations=100):
         visits = child.N
         win_rate = 50 * (1 - child.Q)
         marker = "→" if i == best_idx else " "
-        print(f"  {marker} Column {col}: {visits} visits, {win_rate:.1f}% win rate")
-    
-    print(f"\nAI chooses column {best_col}")
-    return best_move, best_col
+        reused_info = f" ({reused[child.move]} reused)" if reused else ""
+        print(f"  {marker} Column {col}: {visits} visits{reused_info}, {win_rate:.1f}% win rate")
+    
+    print(f"\n  {report.sims} simulations in {report.elapsed:.2f}s (stop: {report.stop_reason})")
+    if reused:
+        print(f"  {sum(reused.values())} visits reused from pondering")
+    print(f"AI chooses column {best_col}")
+    return best_move, best_col, rootnode
 
 def play_game():
     """Play a simple human vs AI game"""
@@ -95,9 +101,8 @@ def play_game():
     # Load model
     print("Loading AI model...")
     try:
-        model = resnet18()
-        model.load_state_dict(torch.load('./best_model_resnet.pth'))
-        model.eval()
+        # NumPy export of the model (see numpy_net.py)
+        model = numpy_net.load_player('./best_model_resnet.pth')
         print("AI loaded successfully!")
     except Exception as e:
         print(f"Error loading AI: {e}")
@@ -113,12 +118,22 @@ def play_game():
     sim_map = {'1': 50, '2': 100, '3': 200}
     simulations = sim_map.get(difficulty, 100)
     
+    ponder = config.ponder
+    answer = input(f"Let the AI think during your turn? (y/n, default {'y' if ponder else 'n'}): ").lower()
+    if answer in ['y', 'n']:
+        ponder = (answer == 'y')
+    
     # Initialize game
     game = Game()
     turn = 0
     moves_history = []
     human_turn = (human_color == 'Y')  # Yellow goes first
     
+    # One tree for the whole game : the subtree of each move played is kept as the next root
+    tree = MCTS_NN(model, use_dirichlet=False)
+    search_root = None
+    ponderer = Ponderer(lambda node: tree.simulate(node, 1))
+    
     print(f"\nStarting game! You are {'Yellow' if human_color == 'Y' else 'Red'}")
     print("=" * 50)
     
@@ -131,10 +146,21 @@ def play_game():
         
         # Get move
         if human_turn:
-            move, col = get_human_move(game)
+            if ponder:
+                if search_root is None:
+                    search_root = tree.createNode(game.state)
+                ponderer.start(search_root)
+            try:
+                move, col = get_human_move(game)
+            finally:
+                pondered = ponderer.stop()
             print(f"You played column {col}")
+            search_root = reuse_subtree(search_root, move)
+            if ponder:
+                print(f"(AI pondered {pondered} simulations during your turn)")
         else:
-            move, col = get_ai_move(game, model, simulations)
+            move, col, rootnode = get_ai_move(game, model, simulations, tree, search_root)
+            search_root = reuse_subtree(rootnode, move) if ponder else None
         
         # Make move
         game.takestep(move)
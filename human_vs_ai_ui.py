@@ -5,7 +5,7 @@ Human vs AI Connect 4 with beautiful UI
 
 from MCTS_NN import MCTS_NN, Node
 from Game_bitboard import Game
-from ResNet import resnet18
+from inference import load_model, model_file
 import torch
 import numpy as np
 import time
@@ -283,9 +283,8 @@ class HumanVsAIUI:
         print(f"\n{self.CYAN}Loading Alpha Zero neural network...{self.RESET}", end="", flush=True)
         
         try:
-            self.model = resnet18()
-            self.model.load_state_dict(torch.load('./best_model_resnet.pth'))
-            self.model.eval()
+            # the int8 model with config.serve_int8 (see quantize.py)
+            self.model = load_model(model_file('./best_model_resnet.pth'))
             print(f" {self.GREEN}✓{self.RESET}")
             return True
         except Exception as e:
@@ -0,0 +1,225 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             inference.py
+# Description:      Batched NN evaluation shared by concurrent searches : leaf
+#                   evaluations from several threads are run as one forward pass
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+from contextlib import contextmanager
+import os
+import threading
+import time
+import numpy as np
+import torch
+from ResNet import resnet18
+import tracing
+import precision
+import export_model
+import config
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# trained resnet for inference on the CPU, in mode (config.inference_precision by default, see precision.py) with
+# the 'torch' backend, or as the float32 artifact of the backend (config.model_backend by default, see
+# export_model.py). An int8 checkpoint (see quantize.py) gives its int8 net
+def load_model(model_path, mode=None, backend=None):
+    backend = backend or config.model_backend
+    # up to date artifact : the checkpoint is not even read
+    if backend != 'torch' and export_model.is_fresh(model_path, backend):
+        return export_model.load_exported(model_path, backend)
+
+    checkpoint = torch.load(model_path, map_location='cpu')
+    if 'quantization' in checkpoint:
+        # (imported here : quantize.py imports this module)
+        import quantize
+        return quantize.load_quantized(checkpoint)
+    model = resnet18()
+    model.load_state_dict(checkpoint)
+    model.eval()
+    if backend != 'torch':
+        export_model.export(model_path, backend, model)
+        return export_model.load_exported(model_path, backend)
+    return precision.for_inference(model, mode)
+
+
+# int8 checkpoint written by quantize.py next to a float one
+def int8_path(model_path):
+    root, ext = os.path.splitext(model_path)
+    return root + '_int8' + ext
+
+
+# checkpoint to load for a float one : its int8 version with config.serve_int8 when there is one
+def model_file(model_path):
+    if config.serve_int8 and os.path.exists(int8_path(model_path)):
+        return int8_path(model_path)
+    return model_path
+
+
+# ---------------------------------------------------------------------------- #
+# stacks flat states (Game.state_flattener outputs) into the input tensor of one forward pass
+def flats_to_batch(flats):
+    x = torch.FloatTensor(np.stack(flats))
+    if config.net == 'resnet':
+        return x.view(-1, 3, config.H, config.L)
+    return x.unsqueeze(1)
+
+
+# =============================== CLASS: EvalRequest ================================ #
+# one leaf evaluation waiting in the queue of a BatchedEvaluator
+class EvalRequest:
+    def __init__(self, flat, model):
+        self.flat = flat
+        self.model = model
+        self.value = None
+        self.policy = None
+        self.error = None
+        # number of states of the forward pass it was run in
+        self.batch_size = None
+        self.done = threading.Event()
+
+# ============================================================================ #
+
+
+# =============================== CLASS: EvaluatorClient ================================ #
+# player given to the MCTS_NN of one search : all its evaluations use the model current when the search
+# started, so that a model swapped in the meantime (see model_reload.py) only affects the next searches
+class EvaluatorClient:
+    def __init__(self, evaluator, model):
+        self.evaluator = evaluator
+        self.model = model
+
+    def eval(self):
+        return self
+
+    def forward(self, flat):
+        return self.evaluator.forward(flat, self.model)
+
+    __call__ = forward
+
+    # size of the batch of the last evaluation of the calling thread
+    @property
+    def last_batch_size(self):
+        return self.evaluator.last_batch_size
+
+# ============================================================================ #
+
+
+# =============================== CLASS: BatchedEvaluator ================================ #
+# Drop-in replacement for the NN player of MCTS_NN : forward(flat) blocks the calling thread until its
+# state has been evaluated together with the states queued by the other threads.
+# A batch is run as soon as every registered client has a state in the queue (each search thread has
+# at most one pending evaluation), when max_batch states are queued, or after max_wait seconds.
+# The states queued for different models are run in separate batches, the oldest request first.
+class BatchedEvaluator:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, model, max_batch=None, max_wait=None):
+        if max_batch is None:
+            max_batch = config.inference_max_batch
+        if max_wait is None:
+            max_wait = config.inference_max_wait
+        self.model = model
+        self.model.eval()
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+
+        self.pending = []
+        self.clients = 0
+        self.cond = threading.Condition()
+        # size of the batch of the last evaluation, per calling thread
+        self.local = threading.local()
+
+        # statistics
+        self.batches = 0
+        self.evaluated = 0
+
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # ---------------------------------------------------------------------------- #
+    # MCTS_NN calls player.eval() before each evaluation
+    def eval(self):
+        return self
+
+    # ---------------------------------------------------------------------------- #
+    # a search thread registers for the time of its search, so that batches do not wait for it in vain.
+    # Yields the player of the search, bound to model (the current self.model by default)
+    @contextmanager
+    def client(self, model=None):
+        with self.cond:
+            self.clients += 1
+        try:
+            yield EvaluatorClient(self, self.model if model is None else model)
+        finally:
+            with self.cond:
+                self.clients -= 1
+                self.cond.notify_all()
+
+    # ---------------------------------------------------------------------------- #
+    # same output as the NN : (value of shape (1, 1), policy of shape (1, L))
+    def forward(self, flat, model=None):
+        req = EvalRequest(flat, self.model if model is None else model)
+        with self.cond:
+            self.pending.append(req)
+            self.cond.notify_all()
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        self.local.batch_size = req.batch_size
+        return req.value, req.policy
+
+    __call__ = forward
+
+    @property
+    def last_batch_size(self):
+        return getattr(self.local, 'batch_size', None)
+
+    # ---------------------------------------------------------------------------- #
+    def next_batch(self):
+        with self.cond:
+            while not self.pending:
+                self.cond.wait()
+
+            deadline = time.time() + self.max_wait
+            while len(self.pending) < min(self.max_batch, max(self.clients, 1)):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.cond.wait(remaining)
+
+            model = self.pending[0].model
+            batch = [req for req in self.pending if req.model is model][:self.max_batch]
+            self.pending = [req for req in self.pending if req not in batch]
+        return batch
+
+    # ---------------------------------------------------------------------------- #
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            try:
+                with torch.no_grad(), tracing.span('forward batch', 'nn', size=len(batch)):
+                    values, policies = batch[0].model.forward(flats_to_batch([req.flat for req in batch]))
+                for i, req in enumerate(batch):
+                    req.value = values[i:i + 1]
+                    req.policy = policies[i:i + 1]
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+
+            self.batches += 1
+            self.evaluated += len(batch)
+            for req in batch:
+                req.batch_size = len(batch)
+                req.done.set()
+
+    # ---------------------------------------------------------------------------- #
+    def mean_batch_size(self):
+        return self.evaluated / max(self.batches, 1)
+
+# ============================================================================ #
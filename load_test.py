@@ -0,0 +1,263 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             load_test.py
+# Description:      Load generator for the move server (api_server.py) : virtual users
+#                   play full games against it, and a JSON report of throughput,
+#                   latency percentiles, errors and sims per move is written
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Closed loop : --users virtual users each play games one after the other.
+# Open loop : new games arrive as a Poisson process of --rate games per second, whatever the server latency.
+#
+#   python load_test.py --start-server --users 8 --duration 60 --report load.json
+#   python load_test.py --url http://127.0.0.1:5000 --rate 2 --duration 60 --report load.json
+#
+# Human moves are random, weighted towards the center, or replayed from --openings (one move string per
+# line, columns 1 to 7 as on connect4.gamesolver.org) as long as they are legal.
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+from Game_bitboard import Game
+import config
+
+# weights of the human moves per column
+HUMAN_WEIGHTS = [1, 2, 3, 4, 3, 2, 1]
+
+
+# ---------------------------------------------------------------------------- #
+def post_json(url, payload, timeout):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode(),
+                                 headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def get_json(url, timeout=10):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+# =============================== CLASS: Recorder ================================ #
+# results of all the requests, shared by the virtual users
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = [] # (latency, status, response)
+        self.games = 0
+
+    def add(self, latency, status, response):
+        with self.lock:
+            self.requests.append((latency, status, response))
+
+    def game_done(self):
+        with self.lock:
+            self.games += 1
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# plays one game against the server, the human side moving at random (or from opening).
+# Stops at the end of the game, on an error, or at the deadline
+def play_game(url, recorder, rand, opening, deadline, timeout, game_id):
+    game = Game()
+    board = [[None] * config.H for _ in range(config.L)]
+    heights = [0] * config.L
+    ai_color = rand.choice(['yellow', 'red'])
+    session_id = 'load-{}'.format(game_id)
+
+    def play(col):
+        color = 'yellow' if game.player_turn == 1 else 'red'
+        move = [m for m in game.allowed_moves() if game.convert_move_to_col_index(m) == col][0]
+        game.takestep(move)
+        board[col][heights[col]] = color
+        heights[col] += 1
+
+    ply = 0
+    while not game.gameover()[0] and time.time() < deadline:
+        color = 'yellow' if game.player_turn == 1 else 'red'
+        cols = [game.convert_move_to_col_index(move) for move in game.allowed_moves()]
+
+        if color == ai_color:
+            start = time.time()
+            status, response = post_json(url + '/ai-move', {'board': board, 'currentPlayer': color,
+                                                          'sessionId': session_id}, timeout)
+            recorder.add(time.time() - start, status, response)
+            if status != 200:
+                break
+            col = response['column']
+            if col not in cols:
+                recorder.add(0, 'illegal', response)
+                break
+        elif ply < len(opening) and opening[ply] in cols:
+            col = opening[ply]
+        else:
+            col = rand.choices(cols, weights=[HUMAN_WEIGHTS[c] for c in cols])[0]
+
+        play(col)
+        ply += 1
+
+    if game.gameover()[0]:
+        recorder.game_done()
+
+
+# ---------------------------------------------------------------------------- #
+def closed_loop(url, recorder, users, deadline, openings, seed, timeout):
+    def user(index):
+        rand = random.Random(seed + index)
+        game_index = 0
+        while time.time() < deadline:
+            opening = rand.choice(openings) if openings else []
+            play_game(url, recorder, rand, opening, deadline, timeout, '{}-{}-{}'.format(seed, index, game_index))
+            game_index += 1
+
+    threads = [threading.Thread(target=user, args=(i,)) for i in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def open_loop(url, recorder, rate, deadline, openings, seed, timeout):
+    rand = random.Random(seed)
+    threads = []
+    game_index = 0
+    next_arrival = time.time() + rand.expovariate(rate)
+    while next_arrival < deadline:
+        time.sleep(max(0, next_arrival - time.time()))
+        game_rand = random.Random(rand.random())
+        opening = rand.choice(openings) if openings else []
+        thread = threading.Thread(target=play_game, args=(url, recorder, game_rand, opening, deadline, timeout,
+                                                          '{}-{}'.format(seed, game_index)))
+        thread.start()
+        threads.append(thread)
+        game_index += 1
+        next_arrival += rand.expovariate(rate)
+
+    for thread in threads:
+        thread.join()
+    return game_index
+
+
+# ---------------------------------------------------------------------------- #
+def summarize(recorder, elapsed):
+    requests = [r for r in recorder.requests if r[1] != 'illegal']
+    ok = [r for r in requests if r[1] == 200]
+    latencies = np.array([r[0] for r in ok]) * 1000
+    report = {
+        'requests': len(requests),
+        'ok': len(ok),
+        'rejected': sum(1 for r in requests if r[1] == 503),
+        'errors': sum(1 for r in requests if r[1] not in (200, 503)),
+        'illegalMoves': len(recorder.requests) - len(requests),
+        'games': recorder.games,
+        'elapsed': elapsed,
+        'throughput': len(ok) / elapsed,
+        'gamesPerSec': recorder.games / elapsed,
+    }
+    report['errorRate'] = (report['errors'] + report['rejected']) / max(len(requests), 1)
+    if len(ok):
+        report['latencyMs'] = {'mean': float(np.mean(latencies)), 'p50': float(np.percentile(latencies, 50)),
+                               'p90': float(np.percentile(latencies, 90)), 'p99': float(np.percentile(latencies, 99)),
+                               'max': float(np.max(latencies))}
+        for key in ['sims', 'effectiveSims', 'simBudget']:
+            values = [r[2][key] for r in ok if key in r[2]]
+            if values:
+                report['mean' + key[0].upper() + key[1:]] = float(np.mean(values))
+    return report
+
+
+# ---------------------------------------------------------------------------- #
+def start_server(port, model, workers, sims):
+    command = [sys.executable, 'api_server.py', '--port', str(port), '--workers', str(workers)]
+    if model is not None:
+        command += ['--model', model]
+    if sims is not None:
+        command += ['--sims', str(sims)]
+    server = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+    url = 'http://127.0.0.1:{}'.format(port)
+    for _ in range(600):
+        try:
+            get_json(url + '/health', timeout=1)
+            return server, url
+        except (urllib.error.URLError, ConnectionError):
+            if server.poll() is not None:
+                raise RuntimeError('the server exited with code {}'.format(server.returncode))
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError('the server did not start')
+
+
+# ---------------------------------------------------------------------------- #
+def launch(args):
+    openings = []
+    if args.openings:
+        with open(args.openings) as file:
+            openings = [[int(c) - 1 for c in line.strip()] for line in file if line.strip()]
+
+    server = None
+    url = args.url.rstrip('/')
+    if args.start_server:
+        server, url = start_server(args.port, args.model, args.workers, args.sims)
+
+    try:
+        recorder = Recorder()
+        start = time.time()
+        deadline = start + args.duration
+        if args.rate:
+            open_loop(url, recorder, args.rate, deadline, openings, args.seed, args.timeout)
+        else:
+            closed_loop(url, recorder, args.users, deadline, openings, args.seed, args.timeout)
+        elapsed = time.time() - start
+
+        report = summarize(recorder, elapsed)
+        report['config'] = {'url': url, 'users': None if args.rate else args.users, 'rate': args.rate,
+                            'duration': args.duration, 'seed': args.seed, 'openings': args.openings}
+        try:
+            report['server'] = get_json(url + '/metrics')
+        except (urllib.error.URLError, ConnectionError):
+            pass
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps({key: value for key, value in report.items() if key != 'server'}, indent=2))
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump(report, file, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Full games against the move server, with a JSON report')
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=4, help='closed loop : concurrent virtual users')
+    parser.add_argument('--rate', type=float, default=None, help='open loop : new games per second (Poisson)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--openings', default=None, help='file of move strings replayed by the human side')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=30, help='seconds per request')
+    parser.add_argument('--report', default=None, help='JSON report file')
+    parser.add_argument('--start-server', action='store_true', help='run api_server.py for the test')
+    parser.add_argument('--port', type=int, default=5055, help='port of the server started by --start-server')
+    parser.add_argument('--model', default=None, help='model of the server started by --start-server')
+    parser.add_argument('--workers', type=int, default=1, help='processes of the server started by --start-server')
+    parser.add_argument('--sims', type=int, default=None, help='sims per move of the server started by --start-server')
+    args = parser.parse_args()
+
+    launch(args)
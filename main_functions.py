@@ -12,7 +12,13 @@
 import numpy as np
 from MCTS_NN import MCTS_NN
 from MCTS import MCTS
-import random
+from search_stats import SearchStats
+import tracing
+import profiling
+import threads
+import precision
+import distributed_training
+import rng as rngs
 from ResNet import ResNet_Training, DenseNet_Training
 from Game_bitboard import Game
 import config
@@ -75,8 +81,10 @@ def load_or_create_neural_net():
 
 # ---------------------------------------------------------------------------- #
 # Neural Net training
-def improve_model_resnet(player, data, i):
+def improve_model_resnet(player, data, i, optimizer_state=None):
     #here i is the number of times NN has improved : it will be used for learning rate annealing
+    #optimizer_state : state of the optimizer of the previous training (momentum), None for a new optimizer.
+    #Returns the state of the optimizer after this training (resnet only), None unless config.carry_optimizer_state
 
     min_data=config.MINIBATCH* config.MINBATCHNUMBER
     max_data=config.MINIBATCH * config.MAXBATCHNUMBER
@@ -104,9 +112,14 @@ def improve_model_resnet(player, data, i):
         if j == k + 1:
             print('learning rate is now = ', lr_decay)
 
+        if config.net == 'resnet' and config.train_processes > 1 and not config.use_cuda:
+            optimizer_state, _ = distributed_training.train(player, X, lr_decay, optimizer_state)
+            return optimizer_state if config.carry_optimizer_state else None
+
         if config.net == 'resnet':
-            training = ResNet_Training(player,config.MINIBATCH,config.EPOCHS,lr_decay,X,X,1)
+            training = ResNet_Training(player,config.MINIBATCH,config.EPOCHS,lr_decay,X,X,1, optimizer_state)
             training.trainNet()
+            return training.optimizer.state_dict() if config.carry_optimizer_state else None
 
         if config.net == 'densenet':
             training = DenseNet_Training(player, config.MINIBATCH, config.EPOCHS, lr_decay, X, X, 1)
@@ -118,14 +131,23 @@ def improve_model_resnet(player, data, i):
         time.sleep(.1)
         raise ValueError
 
+    return optimizer_state
 
-# ---------------------------------------------------------------------------- #
-# play *one* game between two NN players but budget = number of sims
-def onevsonegame(player1, budget1, player2, budget2, whostarts, cpuct, tau, tau_zero, use_dirichlet, index):
 
-    #not sure if required but safety first!
-    random.seed()
-    np.random.seed()
+# ---------------------------------------------------------------------------- #
+# play *one* game between two NN players but budget = number of sims.
+# rng : RandomStreams of the game (see rng.py), new streams from the OS by default
+def onevsonegame(player1, budget1, player2, budget2, whostarts, cpuct, tau, tau_zero, use_dirichlet, index, rng=None):
+
+    if rng is None:
+        rng = rngs.RandomStreams()
+    threads.worker(index)
+    # nets of config.inference_precision (one copy when both players are the same net)
+    same = player2 is player1
+    player1 = precision.for_inference(player1)
+    player2 = player1 if same else precision.for_inference(player2)
+    tracing.start_worker('worker {}'.format(index))
+    game_start = tracing.now_us()
 
     new_data_for_the_game = np.zeros((3*config.L*config.H + config.L + 1))
 
@@ -141,6 +163,8 @@ def onevsonegame(player1, budget1, player2, budget2, whostarts, cpuct, tau, tau_
 
     gameover = 0
     turn = 0
+    # per-phase search statistics of the game (see search_stats.py)
+    stats = SearchStats() if config.search_stats else None
 
     while gameover == 0:
         turn = turn + 1
@@ -157,12 +181,15 @@ def onevsonegame(player1, budget1, player2, budget2, whostarts, cpuct, tau, tau_
         #init tree
         if turn == 1:
             game = Game()
-            tree = MCTS_NN(who_plays, use_dirichlet)
+            tree = MCTS_NN(who_plays, use_dirichlet, stats, rng)
             rootnode = tree.createNode(game.state)
             currentnode = rootnode
 
-        for sims in range(0, sim_number):
-            tree.simulate(currentnode, cpuct)
+        with tracing.span('search', 'game', turn=turn, player=player, sims=sim_number):
+            for sims in range(0, sim_number):
+                tree.simulate(currentnode, cpuct)
+        if stats is not None:
+            stats.end_move(currentnode)
 
         visits_after_all_simulations = []
         childmoves=[]
@@ -187,17 +214,17 @@ def onevsonegame(player1, budget1, player2, budget2, whostarts, cpuct, tau, tau_
 
         #then take a step
         if turn < tau_zero:
-            currentnode = np.random.choice(currentnode.children, p=probvisit)
+            currentnode = currentnode.children[rng.np.choice(len(currentnode.children), p=probvisit)]
         else:
-            max = np.random.choice(np.where(all_visits == np.max(all_visits))[0])
+            max = rng.np.choice(np.where(all_visits == np.max(all_visits))[0])
             currentnode = currentnode.children[max]
 
         # reinit tree for next turn
         game = Game(currentnode.state)
         if player=='player1':
-            tree = MCTS_NN(player2,use_dirichlet)
+            tree = MCTS_NN(player2,use_dirichlet, stats, rng)
         else:
-            tree = MCTS_NN(player1, use_dirichlet)
+            tree = MCTS_NN(player1, use_dirichlet, stats, rng)
 
         rootnode = tree.createNode(game.state)
         currentnode = rootnode
@@ -293,15 +320,21 @@ def onevsonegame(player1, budget1, player2, budget2, whostarts, cpuct, tau, tau_
 
     #save data of self play in a file indexed by the CPU used.
     mydata={'data' : [new_data_for_the_game, wp1,wp2, draw,winstart,winsecond, history_size]}
+    if stats is not None:
+        mydata['stats'] = stats.to_dict()
     filename = './data/createdata' + str(index) + '.txt'
     with open(filename, 'wb') as file:
         pickle.dump(mydata, file)
     file.close()
 
+    tracing.complete('game', 'game', game_start, whostarts=whostarts, winner=int(winner), moves=history_size)
+    tracing.flush()
+
 # ---------------------------------------------------------------------------- #
 # main self play function
 
-def self_play(player, self_play_loop_number, CPUs, sim_number, cpuct, tau, tau_zero, use_dirichlet):
+# seed : seed of the games in the deterministic mode (see rng.py), None for OS entropy
+def self_play(player, self_play_loop_number, CPUs, sim_number, cpuct, tau, tau_zero, use_dirichlet, seed=None):
     winp1 = 0
     winp2 = 0
     draws = 0
@@ -309,8 +342,9 @@ def self_play(player, self_play_loop_number, CPUs, sim_number, cpuct, tau, tau_z
     w_second_player = 0
 
     new_data = np.zeros((3*config.L * config.H + config.L + 1))
+    stats = SearchStats()
 
-    for _ in tqdm.tqdm(range(self_play_loop_number)):
+    for loop in tqdm.tqdm(range(self_play_loop_number)):
 
         #parallelize
         procs = []
@@ -321,24 +355,29 @@ def self_play(player, self_play_loop_number, CPUs, sim_number, cpuct, tau, tau_z
             else:
                 whostarts = 'player2'
 
-            proc = Process(target=onevsonegame,
+            proc = Process(target=profiling.target(onevsonegame),
                            args=(player, sim_number, player, sim_number,
-                                 whostarts, cpuct, tau, tau_zero, use_dirichlet, index,))
+                                 whostarts, cpuct, tau, tau_zero, use_dirichlet, index,
+                                 rngs.game_streams(seed, loop, index)))
             procs.append(proc)
 
-        for proc in procs:
-            proc.start()
+        with tracing.span('games', 'self-play', games=CPUs):
+            for proc in procs:
+                proc.start()
 
-        for proc in procs:
-            proc.join()
+            for proc in procs:
+                proc.join()
 
         #end of parallel self play games. Retrieve data :
+        collect_start = tracing.now_us()
         for index in range(CPUs):
             filename = './data/createdata' + str(index) + '.txt'
             with open(filename, 'rb') as file:
                 load_dic = pickle.load(file)
 
             get_data, wp1, wp2, draw, winstart, winsecond , history_size = load_dic['data']
+            if 'stats' in load_dic:
+                stats.merge(SearchStats.from_dict(load_dic['stats']))
 
             winp1 += wp1
             winp2 += wp2
@@ -348,6 +387,7 @@ def self_play(player, self_play_loop_number, CPUs, sim_number, cpuct, tau, tau_z
 
             new_data = np.vstack((new_data, get_data))
             file.close()
+        tracing.complete('collect results', 'self-play', collect_start)
 
     if w_player_start + w_second_player==0:
         ratio = 0
@@ -356,13 +396,22 @@ def self_play(player, self_play_loop_number, CPUs, sim_number, cpuct, tau, tau_z
 
     new_data = np.delete(new_data, 0, 0)
 
+    if config.search_stats:
+        print('')
+        print('--- Search statistics of the self-play workers ---')
+        print(stats.format_summary())
+
+    if config.profile_workers:
+        profiling.merge_profiles()
+        print('profiles of the workers merged into', os.path.join(config.profile_dir, 'report.txt'))
+
     return new_data, winp1, winp2, draws, ratio
 
 # ---------------------------------------------------------------------------- #
 # main tournament function between version1 NN and version 2 NN
 
 def play_v1_against_v2(current_player, best_player_so_far,
-                       loop_number, CPUs, sim_number, cpuct, tau, tau_zero, use_dirichlet):
+                       loop_number, CPUs, sim_number, cpuct, tau, tau_zero, use_dirichlet, seed=None):
     winp1 = 0
     winp2 = 0
     draws = 0
@@ -370,7 +419,7 @@ def play_v1_against_v2(current_player, best_player_so_far,
     w_second = 0
 
 
-    for _ in tqdm.tqdm(range(loop_number)):
+    for loop in tqdm.tqdm(range(loop_number)):
 
         procs = []
 
@@ -385,18 +434,21 @@ def play_v1_against_v2(current_player, best_player_so_far,
                     whostarts = 'player1'
 
             #here player 1 is the improved NN, player 2 the old NN
-            proc = Process(target=onevsonegame,
+            proc = Process(target=profiling.target(onevsonegame),
                            args=(current_player, sim_number, best_player_so_far, sim_number,
-                                 whostarts, cpuct, tau, tau_zero, use_dirichlet, index,))
+                                 whostarts, cpuct, tau, tau_zero, use_dirichlet, index,
+                                 rngs.game_streams(seed, loop, index)))
             procs.append(proc)
 
-        for proc in procs:
-            proc.start()
+        with tracing.span('games', 'gating', games=CPUs):
+            for proc in procs:
+                proc.start()
 
-        for proc in procs:
-            proc.join()
+            for proc in procs:
+                proc.join()
 
         #end of games.
+        collect_start = tracing.now_us()
         for index in range(CPUs):
             filename = './data/createdata' + str(index) + '.txt'
             with open(filename, 'rb') as file:
@@ -408,6 +460,7 @@ def play_v1_against_v2(current_player, best_player_so_far,
             winp1 += wp1
             winp2 += wp2
             draws += draw
+        tracing.complete('collect results', 'gating', collect_start)
 
 
 
@@ -431,7 +484,8 @@ def generate_self_play_data(best_player_so_far, sim_number, dataseen, i):
         local_data, winp1, winp2, draws, ratio = \
             self_play(best_player_so_far, config.selfplaygames // config.CPUS, config.CPUS,
                                      sim_number, config.CPUCT, config.tau_self_play,
-                                     config.tau_zero_self_play, config.dirichlet_for_self_play)
+                                     config.tau_zero_self_play, config.dirichlet_for_self_play,
+                                     rngs.stage_seed(i, rngs.SELF_PLAY))
         time.sleep(0.01)
         print('FYI, win ratio of first player was', int(ratio * 1000) / 10, '%')
         time.sleep(0.01)
@@ -448,7 +502,8 @@ def generate_self_play_data(best_player_so_far, sim_number, dataseen, i):
         use_this_data, winp1, winp2, draws, ratio = \
             self_play(best_player_so_far, config.selfplaygames // config.CPUS, config.CPUS,
                                      sim_number, config.CPUCT, config.tau_self_play,
-                                     config.tau_zero_self_play, config.dirichlet_for_self_play)
+                                     config.tau_zero_self_play, config.dirichlet_for_self_play,
+                                     rngs.stage_seed(i, rngs.SELF_PLAY))
         #not used but necessary
         prev_data_seen = np.copy(dataseen)
 
@@ -472,9 +527,14 @@ def UCT_simu(node, Cp):
 # -----------------------------------------------------------------------#
 # play *one* game between NN and pure MCTS
 
-def NN_against_mcts(player_NN, budget_NN, budget_MCTS, whostarts, c_uct, cpuct, tau, tau_zero, use_dirichlet, index):
-    random.seed()
-    np.random.seed()
+def NN_against_mcts(player_NN, budget_NN, budget_MCTS, whostarts, c_uct, cpuct, tau, tau_zero, use_dirichlet, index,
+                    rng=None):
+    if rng is None:
+        rng = rngs.RandomStreams()
+    threads.worker(index)
+    player_NN = precision.for_inference(player_NN)
+    tracing.start_worker('elo worker {}'.format(index))
+    game_start = tracing.now_us()
 
     if whostarts == 'player_nn':
         modulo = 1
@@ -503,19 +563,20 @@ def NN_against_mcts(player_NN, budget_NN, budget_MCTS, whostarts, c_uct, cpuct,
         if turn == 1:
             if player == 'player_nn':
                 game = Game()
-                tree = MCTS_NN(player_NN, use_dirichlet)
+                tree = MCTS_NN(player_NN, use_dirichlet, rng=rng)
                 rootnode = tree.createNode(game.state)
                 currentnode = rootnode
             else:
                 game = Game()
-                tree = MCTS()
+                tree = MCTS(rng=rng)
                 rootnode = tree.createNode(game.state)
                 currentnode = rootnode
 
         if player=='player_nn':
 
-            for sims in range(0, sim_number):
-                tree.simulate(currentnode, cpuct)
+            with tracing.span('search', 'game', turn=turn, player=player, sims=sim_number):
+                for sims in range(0, sim_number):
+                    tree.simulate(currentnode, cpuct)
 
             visits_after_all_simulations = []
 
@@ -527,34 +588,29 @@ def NN_against_mcts(player_NN, budget_NN, budget_MCTS, whostarts, c_uct, cpuct,
 
             # take a step
             if turn < tau_zero:
-                currentnode = np.random.choice(currentnode.children, p=probvisit)
+                currentnode = currentnode.children[rng.np.choice(len(currentnode.children), p=probvisit)]
             else:
-                max = np.random.choice(np.where(all_visits == np.max(all_visits))[0])
+                max = rng.np.choice(np.where(all_visits == np.max(all_visits))[0])
                 currentnode = currentnode.children[max]
 
             # reinit tree for next player : mcts
             game = Game(currentnode.state)
-            tree = MCTS()
+            tree = MCTS(rng=rng)
             rootnode = tree.createNode(game.state)
             currentnode = rootnode
             gameover = currentnode.isterminal()
 
         if player=='player_mcts':
-            for sims in range(0, sim_number):
-                tree.simulate(currentnode, UCT_simu, c_uct, config.use_counter_in_pure_mcts)
-
-            visits_after_all_simulations = []
-
-            for child in currentnode.children:
-                visits_after_all_simulations.append(child.N)
-
-            values = np.asarray(visits_after_all_simulations)
-            imax = np.random.choice(np.where(values == np.max(values))[0])
-            currentnode = currentnode.children[imax]
+            # stops as soon as the most visited child cannot be overtaken : same move as running all the sims,
+            # which keeps the precomputed ELO ratings of pure MCTS valid (forced moves are not taken early)
+            with tracing.span('search', 'game', turn=turn, player=player, sims=sim_number):
+                report = tree.search(currentnode, UCT_simu, c_uct, config.use_counter_in_pure_mcts,
+                                     max_sims=sim_number, stop_on_forced=False)
+            currentnode = report.best_child
 
             # reinit tree for next player : neural net
             game = Game(currentnode.state)
-            tree = MCTS_NN(player_NN, use_dirichlet)
+            tree = MCTS_NN(player_NN, use_dirichlet, rng=rng)
             rootnode = tree.createNode(game.state)
             currentnode = rootnode
             gameover = currentnode.isterminal()
@@ -591,13 +647,16 @@ def NN_against_mcts(player_NN, budget_NN, budget_MCTS, whostarts, c_uct, cpuct,
         pickle.dump(save_dic, file)
     file.close()
 
+    tracing.complete('game', 'elo', game_start, whostarts=whostarts, winner=int(winner))
+    tracing.flush()
+
 
 # ---------------------------------------------------------------------------- #
 # Use this as a checkpoint for later use to compute the elo rating
 # Here we play parallel games of NN against pure MCTS
 
 def winrate_against_mcts(player, sim_number, self_play_loop_number,
-                         CPUs, budget_mcts, cpuct, tau, tau_zero, use_dirichlet):
+                         CPUs, budget_mcts, cpuct, tau, tau_zero, use_dirichlet, seed=None):
     winp1 = 0
     winp2 = 0
     draws = 0
@@ -605,7 +664,7 @@ def winrate_against_mcts(player, sim_number, self_play_loop_number,
     w_nn_second=0
     c_uct = config.CPUCT
 
-    for _ in range(self_play_loop_number):
+    for loop in range(self_play_loop_number):
 
         procs = []
 
@@ -615,16 +674,18 @@ def winrate_against_mcts(player, sim_number, self_play_loop_number,
             else:
                 whostarts = 'player_mcts'
 
-            proc = Process(target=NN_against_mcts,
+            proc = Process(target=profiling.target(NN_against_mcts),
                            args=(player, sim_number, budget_mcts,
-                                 whostarts, c_uct, cpuct, tau, tau_zero, use_dirichlet, index,))
+                                 whostarts, c_uct, cpuct, tau, tau_zero, use_dirichlet, index,
+                                 rngs.game_streams(seed, loop, index)))
             procs.append(proc)
 
-        for proc in procs:
-            proc.start()
+        with tracing.span('games', 'elo', games=CPUs):
+            for proc in procs:
+                proc.start()
 
-        for proc in procs:
-            proc.join()
+            for proc in procs:
+                proc.join()
 
         # end of games
 
@@ -649,7 +710,7 @@ def winrate_against_mcts(player, sim_number, self_play_loop_number,
 
 
 #---------------------------------------------------------------------#
-def geteloratings(elos, best_player_so_far, improved, total_improved):
+def geteloratings(elos, best_player_so_far, improved, total_improved, seed=None):
 
     # increase slowly the strenght of the mcts we play against (otherwise you soon get 100% wins against 100 sims-mcts and elo cant be computed anymore
     # numbers from pre_compute_elo_ratings/draw_elo.py
@@ -686,7 +747,7 @@ def geteloratings(elos, best_player_so_far, improved, total_improved):
         winp1, winp2, draws, ratio_starter = \
             winrate_against_mcts\
                 (best_player_so_far,sim_number_a_mcts, loop_number_mcts,
-                 config.CPUS, budget_mcts, config.CPUCT, tau_agg, tau_zero,use_dirichlet)
+                 config.CPUS, budget_mcts, config.CPUCT, tau_agg, tau_zero,use_dirichlet, seed)
 
         print('NN wins by', 100*winp1/(winp1 + winp2 + draws), 'draw', 100*draws/(winp1 + winp2 + draws), 'lost', 100*winp2/(winp1 + winp2 + draws) )
         time.sleep(0.01)
@@ -0,0 +1,147 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             model_reload.py
+# Description:      Hot reload of the best model in serving processes : the checkpoint
+#                   is watched, loaded and warmed up in the background, then swapped in
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import hashlib
+import os
+import threading
+import time
+import numpy as np
+import torch
+from inference import load_model, flats_to_batch, model_file
+import config
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# torch.save through a temporary file and a rename, so that a process reading path never sees a partial file
+def save_model_atomic(model, path):
+    tmp_path = path + '.tmp'
+    torch.save(model.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+# ---------------------------------------------------------------------------- #
+# version of a checkpoint : beginning of the sha256 of the file
+def file_version(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()[:12]
+
+
+# ---------------------------------------------------------------------------- #
+# first forward passes are slow (allocations) : run them before the model serves
+def warm_up(model, batch_sizes=(1, 8)):
+    flat = np.zeros(3 * config.H * config.L)
+    with torch.no_grad():
+        for size in batch_sizes:
+            model.forward(flats_to_batch([flat] * size))
+
+
+# =============================== CLASS: ModelManager ================================ #
+# Holds the current model of a serving process. reload() loads the checkpoint in a background thread,
+# warms it up and only then swaps it in (self.model is replaced in one assignment) and calls the
+# on_swap callbacks with (model, version) ; until then the old model keeps serving. watch() reloads by
+# itself when the checkpoint file changes, once its size and mtime have been stable for one poll
+class ModelManager:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, path, poll_interval=None):
+        if poll_interval is None:
+            poll_interval = config.model_watch_interval
+        # the int8 version with config.serve_int8 (see quantize.py)
+        self.path = model_file(path)
+        self.poll_interval = poll_interval
+        self.callbacks = []
+        self.lock = threading.Lock()
+        self.reloading = False
+        self.last_error = None
+        self.reloads = 0
+
+        self.stat = self.file_stat()
+        self.model = load_model(self.path)
+        self.version = file_version(self.path)
+        self.loaded_at = time.time()
+        self.watcher = None
+
+    # ---------------------------------------------------------------------------- #
+    def file_stat(self):
+        try:
+            stat = os.stat(self.path)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    # ---------------------------------------------------------------------------- #
+    def on_swap(self, callback):
+        self.callbacks.append(callback)
+
+    # ---------------------------------------------------------------------------- #
+    # starts a background reload, returns False if one is already running
+    def reload(self):
+        with self.lock:
+            if self.reloading:
+                return False
+            self.reloading = True
+        thread = threading.Thread(target=self.load_and_swap)
+        thread.daemon = True
+        thread.start()
+        return True
+
+    # ---------------------------------------------------------------------------- #
+    def load_and_swap(self):
+        try:
+            stat = self.file_stat()
+            version = file_version(self.path)
+            model = load_model(self.path)
+            warm_up(model)
+        except Exception as e:
+            # e.g. the file is being written : keep serving the old model
+            self.last_error = str(e)
+            with self.lock:
+                self.reloading = False
+            return
+
+        with self.lock:
+            self.model = model
+            self.version = version
+            self.stat = stat
+            self.loaded_at = time.time()
+            self.last_error = None
+            self.reloads += 1
+            self.reloading = False
+        for callback in self.callbacks:
+            callback(model, version)
+
+    # ---------------------------------------------------------------------------- #
+    def watch(self):
+        if self.poll_interval is None or self.watcher is not None:
+            return
+        self.watcher = threading.Thread(target=self.watch_loop)
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def watch_loop(self):
+        previous = self.stat
+        while True:
+            time.sleep(self.poll_interval)
+            stat = self.file_stat()
+            if stat is not None and stat != self.stat and stat == previous and not self.reloading:
+                self.reload()
+            previous = stat
+
+    # ---------------------------------------------------------------------------- #
+    def info(self):
+        return {'version': self.version, 'loadedAt': self.loaded_at, 'reloading': self.reloading,
+                'reloads': self.reloads, 'lastError': self.last_error}
+
+# ============================================================================ #
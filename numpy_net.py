@@ -0,0 +1,181 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             numpy_net.py
+# Description:      Inference of a trained ResNet / ResNet3D with NumPy only (im2col convolutions),
+#                   for the processes that only play : no torch import at startup
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# export_model.py (which needs torch) freezes a trained net into best_model_resnet.npz : the batchnorms are folded
+# into the convolutions before them, the convolution weights are stored as im2col matrices. NumpyNet runs the
+# same graph as ResNet.forward in float32 and gives the same (value, policy), as numpy arrays : as_numpy() reads
+# the outputs of either backend.
+#
+# This module never imports torch. load_player() gives the NumPy net of a checkpoint when its export is up to date
+# (see artifacts.py), and only otherwise imports torch once to export it. The GUIs and viewers that just play use it,
+# and config.model_backend = 'numpy' makes inference.load_model use it too.
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+from contextlib import nullcontext
+import json
+import sys
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import artifacts
+# ============================================================================ #
+
+# nn.BatchNorm2d default, kept by ResNet and ResNet3D
+BN_EPS = 1e-5
+# input planes of each kind of net, and their shape in the network
+INPUTS = {'connect4': (3, 6, 7), 'connect4_3d': (12, 4, 4)}
+
+
+# ---------------------------------------------------------------------------- #
+# outputs of a torch net or of a NumpyNet as a numpy array
+def as_numpy(x):
+    if isinstance(x, np.ndarray):
+        return x
+    return x.detach().cpu().numpy()
+
+
+# torch.no_grad() when torch is loaded : scripts that may run either backend
+def no_grad():
+    torch = sys.modules.get('torch')
+    return torch.no_grad() if torch is not None else nullcontext()
+
+
+# ---------------------------------------------------------------------------- #
+# conv weight (out, in, kh, kw) followed by a batchnorm, as an im2col matrix (in * kh * kw, out) and a bias
+def fold(weight, bn_weight, bn_bias, running_mean, running_var):
+    scale = bn_weight / np.sqrt(running_var + BN_EPS)
+    matrix = (weight * scale[:, None, None, None]).reshape(weight.shape[0], -1).T
+    return np.ascontiguousarray(matrix, dtype=np.float32), (bn_bias - running_mean * scale).astype(np.float32)
+
+
+# frozen arrays of a net from its state_dict (numpy arrays) : kind is 'connect4' (ResNet) or 'connect4_3d' (ResNet3D),
+# padding the padding of its first convolution
+def freeze(state, kind, padding):
+    def conv_bn(conv, bn):
+        return fold(state[conv + '.weight'], state[bn + '.weight'], state[bn + '.bias'],
+                    state[bn + '.running_mean'], state[bn + '.running_var'])
+
+    def dense(name):
+        return (np.ascontiguousarray(state[name + '.weight'].T, dtype=np.float32),
+                state[name + '.bias'].astype(np.float32))
+
+    blocks = sorted({int(key.split('.')[1]) for key in state if key.startswith('layer1.')})
+    frozen = {}
+    frozen['conv1.w'], frozen['conv1.b'] = conv_bn('group1.conv1', 'group1.bn1')
+    for block in blocks:
+        prefix = 'layer1.{}.group1.'.format(block)
+        for conv in ['1', '2']:
+            frozen['block{}.conv{}.w'.format(block, conv)], frozen['block{}.conv{}.b'.format(block, conv)] = \
+                conv_bn(prefix + 'conv' + conv, prefix + 'bn' + conv)
+    frozen['policy.w'], frozen['policy.b'] = conv_bn('policy_entrance', 'bnpolicy')
+    frozen['value.w'], frozen['value.b'] = conv_bn('value_entrance', 'bnvalue')
+    hidden_policy = 'hidden_dense_pol.weight' in state
+    if hidden_policy:
+        frozen['policy_hidden.w'], frozen['policy_hidden.b'] = dense('hidden_dense_pol')
+        frozen['policy_fc.w'], frozen['policy_fc.b'] = dense('fcpol1')
+    else:
+        frozen['policy_fc.w'], frozen['policy_fc.b'] = dense('fcpol2')
+    frozen['value_hidden.w'], frozen['value_hidden.b'] = dense('hidden_dense_value')
+    frozen['value_fc.w'], frozen['value_fc.b'] = dense('fcval')
+
+    meta = {'kind': kind, 'blocks': len(blocks), 'padding': int(padding), 'hiddenPolicy': hidden_policy,
+            'kernel': list(state['group1.conv1.weight'].shape[2:]),
+            'blockKernel': list(state['layer1.0.group1.conv1.weight'].shape[2:]) if blocks else [3, 3]}
+    frozen['meta'] = np.array(json.dumps(meta))
+    return frozen
+
+
+def save(frozen, path):
+    with open(path, 'wb') as file:
+        np.savez(file, **frozen)
+
+
+# ---------------------------------------------------------------------------- #
+def relu(x):
+    return np.maximum(x, 0, out=x)
+
+
+# convolution of x (n, H, W, C) with an im2col matrix : (n, H', W', out)
+def conv2d(x, matrix, bias, kernel, padding):
+    if padding:
+        x = np.pad(x, ((0, 0), (padding, padding), (padding, padding), (0, 0)))
+    windows = sliding_window_view(x, tuple(kernel), axis=(1, 2))
+    n, height, width = windows.shape[:3]
+    return (windows.reshape(n * height * width, -1) @ matrix + bias).reshape(n, height, width, -1)
+
+
+# 1x1 convolution, then flattened in the (C, H, W) order of the dense layers of torch
+def head_entrance(x, matrix, bias):
+    n = x.shape[0]
+    out = relu(x.reshape(-1, x.shape[-1]) @ matrix + bias).reshape(n, x.shape[1], x.shape[2], -1)
+    return out.transpose(0, 3, 1, 2).reshape(n, -1)
+
+
+# =============================== CLASS: NumpyNet ================================ #
+# player for MCTS_NN / MCTS_NN3D or a BatchedEvaluator : forward(x) with x a flat state, a batch of flat
+# states or an array (n, planes, H, W), gives (value (n, 1), policy (n, moves)) in float32
+class NumpyNet:
+    # not converted by precision.for_inference
+    fixed_precision = True
+
+    def __init__(self, frozen):
+        self.w = {key: value for key, value in frozen.items() if key != 'meta'}
+        self.meta = json.loads(str(frozen['meta']))
+        self.planes = INPUTS[self.meta['kind']]
+
+    def eval(self):
+        return self
+
+    # ---------------------------------------------------------------------------- #
+    # (n, H, W, planes) input, as ResNet.forward / ResNet3D._convert_3d_to_input arrange it
+    def inputs(self, x):
+        x = np.asarray(x, dtype=np.float32)
+        if self.meta['kind'] == 'connect4_3d' and x.shape[-1] == 192:
+            # (n, player, x, y, z) -> planes player * 4 + z of (x, y)
+            x = x.reshape(-1, 3, 4, 4, 4).transpose(0, 1, 4, 2, 3).reshape(-1, *self.planes)
+        return x.reshape(-1, *self.planes).transpose(0, 2, 3, 1)
+
+    def forward(self, x):
+        w, meta = self.w, self.meta
+        x = relu(conv2d(self.inputs(x), w['conv1.w'], w['conv1.b'], meta['kernel'], meta['padding']))
+        for block in range(meta['blocks']):
+            name = 'block{}.conv'.format(block)
+            out = relu(conv2d(x, w[name + '1.w'], w[name + '1.b'], meta['blockKernel'], 1))
+            x = relu(conv2d(out, w[name + '2.w'], w[name + '2.b'], meta['blockKernel'], 1) + x)
+
+        policy = head_entrance(x, w['policy.w'], w['policy.b'])
+        if meta['hiddenPolicy']:
+            policy = relu(policy @ w['policy_hidden.w'] + w['policy_hidden.b'])
+        policy = policy @ w['policy_fc.w'] + w['policy_fc.b']
+        policy = np.exp(policy - policy.max(axis=1, keepdims=True))
+        policy /= policy.sum(axis=1, keepdims=True)
+
+        value = head_entrance(x, w['value.w'], w['value.b'])
+        value = relu(value @ w['value_hidden.w'] + w['value_hidden.b'])
+        value = np.tanh(value @ w['value_fc.w'] + w['value_fc.b'])
+        return value, policy
+
+    __call__ = forward
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+def load(path):
+    with np.load(path) as frozen:
+        return NumpyNet(dict(frozen))
+
+
+# NumPy net of the checkpoint model_path : its export when up to date, else exported first (this imports torch)
+def load_player(model_path='./best_model_resnet.pth'):
+    if not artifacts.is_fresh(model_path, 'numpy'):
+        import export_model
+        export_model.export(model_path, 'numpy')
+    return load(artifacts.artifact_path(model_path, 'numpy'))
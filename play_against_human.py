@@ -17,23 +17,31 @@
 # ================================= PREAMBLE ================================= #
 # Packages
 from MCTS_NN import Node, MCTS_NN
+from MCTS_parallel import RootParallelMCTS
 from Game_bitboard import Game
 import numpy as np
-from ResNet import ResNet
-import ResNet
+import numpy_net
 import time
-import torch.utils
+import config
 
 
-def onevsonehuman(budget, whostarts):
+# workers is the number of trees searched in parallel for each move of the computer (see MCTS_parallel.py),
+# by default config.root_parallel_workers
+def onevsonehuman(budget, whostarts, workers=None):
     if whostarts == 'computer':
         modulo = 1
     else:
         modulo = 0
 
     file_path_resnet = './best_model_resnet.pth'
-    best_player_so_far = ResNet.resnet18()
-    best_player_so_far.load_state_dict(torch.load(file_path_resnet))
+    # NumPy export of the model (see numpy_net.py)
+    best_player_so_far = numpy_net.load_player(file_path_resnet)
+
+    if workers is None:
+        workers = config.root_parallel_workers
+    parallel_search = None
+    if workers != 1:
+        parallel_search = RootParallelMCTS(best_player_so_far, workers=workers)
 
     game = Game()
     tree = MCTS_NN(best_player_so_far, use_dirichlet=False)
@@ -57,8 +65,13 @@ def onevsonehuman(budget, whostarts):
 
 
             print('===============IA playing================')
-            for sims in range(0, sim_number):
-                tree.simulate(currentnode, cpuct=1)
+            if parallel_search is not None:
+                result = parallel_search.search(currentnode.state, sim_number=sim_number, cpuct=1)
+                # the root of this tree is only expanded, to map the chosen column to a child below
+                tree.expand_all(currentnode)
+            else:
+                for sims in range(0, sim_number):
+                    tree.simulate(currentnode, cpuct=1)
 
             treefordisplay = MCTS_NN(best_player_so_far, False)
             rootnodedisplay = treefordisplay.createNode(game.state)
@@ -70,15 +83,21 @@ def onevsonehuman(budget, whostarts):
                 treefordisplay.eval_leaf(child)
             Qs = [int(100 * child.Q) / 100 for child in rootnodedisplay.children]
             print('NN thoughts', pchild, Qs)
-            visits_after_all_simulations = []
-
-            for child in currentnode.children:
-                visits_after_all_simulations.append(child.N)
-
-            print('result visits', visits_after_all_simulations)
-            time.sleep(0.5)
-            values = np.asarray(visits_after_all_simulations)
-            imax = np.random.choice(np.where(values == np.max(values))[0])
+            if parallel_search is not None:
+                visits_after_all_simulations = result['visits']
+                imax = result['cols'].index(result['col'])
+                print('result visits', visits_after_all_simulations, 'summed over', parallel_search.workers, 'trees')
+                time.sleep(0.5)
+            else:
+                visits_after_all_simulations = []
+
+                for child in currentnode.children:
+                    visits_after_all_simulations.append(child.N)
+
+                print('result visits', visits_after_all_simulations)
+                time.sleep(0.5)
+                values = np.asarray(visits_after_all_simulations)
+                imax = np.random.choice(np.where(values == np.max(values))[0])
             print('choice made', imax)
             currentnode = currentnode.children[imax]
 
@@ -102,6 +121,9 @@ def onevsonehuman(budget, whostarts):
 
         isterminal = currentnode.isterminal()
 
+    if parallel_search is not None:
+        parallel_search.close()
+
     game = Game(currentnode.state)
     gameover, winner = game.gameover()
 
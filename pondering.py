@@ -0,0 +1,82 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             pondering.py
+# Description:      Pondering : the engine keeps searching from the current position
+#                   while the human thinks, and the subtree of the move actually
+#                   played is kept as the new root
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import threading
+import config
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# returns the child of root reached by move, detached from the tree so that it becomes a new root
+# (back propagation stops at a node without parent). Returns None if that child was never created.
+# Works with the nodes of MCTS_NN (move is a bitboard int) and of MCTS_NN3D (move is a (x, y) tuple)
+def reuse_subtree(root, move):
+    if root is None:
+        return None
+    for child in root.children:
+        if child.move == move:
+            child.parent = None
+            return child
+    return None
+
+
+# =============================== CLASS: Ponderer ================================ #
+
+class Ponderer:
+    # ---------------------------------------------------------------------------- #
+    # simulate(node) runs one sim of the tree from node, e.g. lambda node: tree.simulate(node, cpuct).
+    # max_sims caps the pondering of one position (the tree grows in memory as long as the human thinks)
+    def __init__(self, simulate, max_sims=None):
+        if max_sims is None:
+            max_sims = config.ponder_max_sims
+        self.simulate = simulate
+        self.max_sims = max_sims
+        self.root = None
+        self.sims = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    # ---------------------------------------------------------------------------- #
+    # starts searching from root in a background thread
+    def start(self, root):
+        self.stop()
+        if root is None or root.isterminal():
+            return
+
+        self.root = root
+        self.sims = 0
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    # ---------------------------------------------------------------------------- #
+    def run(self):
+        while not self.stop_event.is_set() and self.sims < self.max_sims:
+            self.simulate(self.root)
+            self.sims += 1
+
+    # ---------------------------------------------------------------------------- #
+    # stops after the current sim and returns the number of sims done while pondering.
+    # The tree must not be touched by another thread before stop() has returned
+    def stop(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join()
+            self.thread = None
+        return self.sims
+
+    def is_running(self):
+        return self.thread is not None
+
+# ============================================================================ #
@@ -0,0 +1,308 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             position_suite.py
+# Description:      Test positions with known solutions (exact score and best moves),
+#                   grouped by phase and difficulty, and a runner measuring the move
+#                   accuracy, value error and time / nodes per position of engines
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# The suite (config.position_suite, one JSON record per line) is made of positions of random games, solved
+# with solver.py in the style of the test sets of http://blog.gamesolver.org :
+#   {"id": "middle-hard-0007", "moves": "4453...", "phase": "middle", "difficulty": "hard",
+#    "score": -3, "scores": [-5, -3, null, ...], "bestCols": [1], "nodes": 81234}
+# moves uses columns 1 to 7 (as on connect4.gamesolver.org), scores and bestCols columns 0 to 6. score is
+# the gamesolver score for the player to move (> 0 win, 0 draw, < 0 loss, see solver.py), nodes the
+# solver nodes needed for it, which sets the difficulty. Positions where the player to move wins at once
+# are left out.
+#
+# Engines : 'nn' (policy and value of the NN, batched forward passes), 'mcts_nn:SIMS' (searches of SIMS
+# sims run in parallel threads whose leaves are batched, see inference.py), 'mcts:SIMS' (pure MCTS with
+# rollouts) and 'solver'. The value of a search is the Q of its move, for the player to move ; the target
+# value of a position is the sign of its score.
+#
+#   python position_suite.py --engines nn,mcts_nn:100 --model ./best_model_resnet.pth
+#   python position_suite.py --engines mcts:1000 --phase endgame --limit 50 -o results.json
+#   python position_suite.py --generate 250 --seed 0      new suite (75 min on one core, mostly openings)
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+import config
+from Game_bitboard import Game
+from MCTS import MCTS
+from MCTS_NN import MCTS_NN
+from ResNet import resnet18
+from inference import BatchedEvaluator, load_model
+from positions import state_from_moves, evaluate_states
+from rng import RandomStreams
+import solver
+import main_functions
+
+# (phase, min and max stones on the board, min solver nodes of a medium and of a hard position). The node
+# thresholds split the random positions of each phase in about three thirds. Positions with fewer stones
+# take minutes to solve in python
+PHASES = [('opening', 14, 17, 5000, 50000), ('middle', 18, 25, 100, 3000), ('endgame', 26, 36, 10, 100)]
+DIFFICULTIES = ['easy', 'medium', 'hard']
+
+
+# ---------------------------------------------------------------------------- #
+def difficulty(phase, nodes):
+    medium, hard = [(row[3], row[4]) for row in PHASES if row[0] == phase][0]
+    return 'hard' if nodes >= hard else 'medium' if nodes >= medium else 'easy'
+
+
+# ---------------------------------------------------------------------------- #
+# moves string of a random game of `stones` moves, None when the game ends before or when the player to
+# move could then win at once
+def random_moves(rng, stones):
+    game = Game()
+    moves = ''
+    for _ in range(stones):
+        move = rng.py.choice(game.allowed_moves())
+        moves += str(game.convert_move_to_col_index(move) + 1)
+        game.takestep(move)
+        if game.gameover()[0]:
+            return None
+    if solver.can_win_next(*solver.from_state(game.state)[:2]):
+        return None
+    return moves
+
+
+# ---------------------------------------------------------------------------- #
+# solved record of a moves string
+def solve_record(moves, phase):
+    state = state_from_moves(moves)
+    search = solver.Solver()
+    score = search.solve(state)
+    nodes = search.nodes
+    scores = search.column_scores(state)
+    return {'moves': moves, 'phase': phase, 'difficulty': difficulty(phase, nodes), 'score': score, 'scores': scores,
+            'bestCols': solver.best_columns(scores), 'nodes': nodes}
+
+
+# ---------------------------------------------------------------------------- #
+# per_group positions per (phase, difficulty) from random games ; a group too rare in random games
+# is left short after max_games games of its phase
+def generate(per_group, seed=0, max_games=None, log=sys.stderr):
+    if max_games is None:
+        max_games = 40 * per_group * len(DIFFICULTIES)
+    rng = RandomStreams(seed)
+    records = []
+    seen = set()
+    for phase, low, high, _, _ in PHASES:
+        counts = {name: 0 for name in DIFFICULTIES}
+        start = time.time()
+        for _ in range(max_games):
+            if min(counts.values()) >= per_group:
+                break
+            moves = random_moves(rng, rng.py.randint(low, high))
+            if moves is None or moves in seen:
+                continue
+            seen.add(moves)
+            # the score alone first : the scores of the columns are only solved when the group needs one
+            search = solver.Solver()
+            search.solve(state_from_moves(moves))
+            if counts[difficulty(phase, search.nodes)] >= per_group:
+                continue
+            record = solve_record(moves, phase)
+            counts[record['difficulty']] += 1
+            record['id'] = '{}-{}-{:04d}'.format(phase, record['difficulty'], counts[record['difficulty']])
+            records.append(record)
+        print(phase, counts, round(time.time() - start), 's', file=log)
+    return records
+
+
+# ---------------------------------------------------------------------------- #
+def save_suite(records, path=None):
+    path = config.position_suite if path is None else path
+    with open(path, 'w') as file:
+        for record in records:
+            file.write(json.dumps(record) + '\n')
+
+
+def load_suite(path=None, phase=None, level=None, limit=None):
+    path = config.position_suite if path is None else path
+    records = []
+    counts = {}
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            group = (record['phase'], record['difficulty'])
+            if phase not in (None, record['phase']) or level not in (None, record['difficulty']):
+                continue
+            if limit is not None and counts.get(group, 0) >= limit:
+                continue
+            counts[group] = counts.get(group, 0) + 1
+            records.append(record)
+    return records
+
+
+# ---------------------------------------------------------------------------- #
+# Engines : records -> one {'col', 'value', 'nodes', 'seconds'} per record
+def run_nn(model, records, batch_size=256):
+    results = []
+    for first in range(0, len(records), batch_size):
+        chunk = records[first:first + batch_size]
+        states = [state_from_moves(record['moves']) for record in chunk]
+        start = time.perf_counter()
+        values, policies = evaluate_states(model, states)
+        seconds = (time.perf_counter() - start) / len(chunk)
+        for state, value, policy in zip(states, values, policies):
+            game = Game(state)
+            legal = [game.convert_move_to_col_index(move) for move in game.allowed_moves()]
+            results.append({'col': int(max(legal, key=lambda col: policy[col])), 'value': float(value),
+                            'nodes': 1, 'seconds': seconds})
+    return results
+
+
+# (col, value) of the move chosen by a search
+def search_move(state, report):
+    return Game(state).convert_move_to_col_index(report.best_child.move), float(report.best_child.Q)
+
+
+def run_mcts_nn(model, records, sims, parallel=8, seed=0):
+    evaluator = BatchedEvaluator(model)
+    results = [None] * len(records)
+    queue = list(range(len(records)))
+    lock = threading.Lock()
+
+    def worker():
+        with evaluator.client() as player:
+            while True:
+                with lock:
+                    if not queue:
+                        return
+                    i = queue.pop(0)
+                state = state_from_moves(records[i]['moves'])
+                start = time.perf_counter()
+                tree = MCTS_NN(player, use_dirichlet=False, rng=RandomStreams([seed, i]))
+                report = tree.search(tree.createNode(state), config.CPUCT, max_sims=sims, stop_on_forced=False)
+                col, value = search_move(state, report)
+                results[i] = {'col': col, 'value': value, 'nodes': report.sims,
+                              'seconds': time.perf_counter() - start}
+
+    threads = [threading.Thread(target=worker) for _ in range(min(parallel, len(records)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def run_mcts(records, sims, seed=0):
+    results = []
+    for i, record in enumerate(records):
+        state = state_from_moves(record['moves'])
+        start = time.perf_counter()
+        tree = MCTS(rng=RandomStreams([seed, i]))
+        report = tree.search(tree.createNode(state), main_functions.UCT_simu, config.CPUCT,
+                             config.use_counter_in_pure_mcts, max_sims=sims, stop_on_forced=False)
+        col, value = search_move(state, report)
+        results.append({'col': col, 'value': value, 'nodes': report.sims, 'seconds': time.perf_counter() - start})
+    return results
+
+
+def run_solver(records):
+    results = []
+    for record in records:
+        state = state_from_moves(record['moves'])
+        search = solver.Solver()
+        start = time.perf_counter()
+        scores = search.column_scores(state)
+        col = solver.best_columns(scores)[0]
+        results.append({'col': col, 'value': float(np.sign(scores[col])), 'nodes': search.nodes,
+                        'seconds': time.perf_counter() - start})
+    return results
+
+
+# ---------------------------------------------------------------------------- #
+# results of engine ('nn', 'mcts_nn:SIMS', 'mcts:SIMS' or 'solver') on records
+def run_engine(engine, records, model=None, parallel=8, seed=0):
+    name, _, sims = engine.partition(':')
+    if name == 'nn':
+        return run_nn(model, records)
+    if name == 'mcts_nn':
+        return run_mcts_nn(model, records, int(sims or config.SIM_NUMBER), parallel, seed)
+    if name == 'mcts':
+        return run_mcts(records, int(sims or config.sim_number_defense), seed)
+    if name == 'solver':
+        return run_solver(records)
+    raise ValueError('unknown engine {!r}, choose nn, mcts_nn:SIMS, mcts:SIMS or solver'.format(engine))
+
+
+# ---------------------------------------------------------------------------- #
+# accuracy, mean absolute value error, seconds and nodes per position, overall and per 'phase/difficulty'
+def score_results(records, results):
+    groups = {}
+    for record, result in zip(records, results):
+        for group in ['all', '{}/{}'.format(record['phase'], record['difficulty'])]:
+            groups.setdefault(group, []).append((record, result))
+
+    summary = {}
+    for group, pairs in groups.items():
+        summary[group] = {
+            'positions': len(pairs),
+            'accuracy': float(np.mean([result['col'] in record['bestCols'] for record, result in pairs])),
+            'valueError': float(np.mean([abs(result['value'] - np.sign(record['score'])) for record, result in pairs])),
+            'secondsPerPosition': float(np.mean([result['seconds'] for _, result in pairs])),
+            'nodesPerPosition': float(np.mean([result['nodes'] for _, result in pairs])),
+        }
+    return summary
+
+
+def format_summary(engine, summary):
+    lines = ['{}'.format(engine),
+             '  {:<18} {:>9} {:>9} {:>11} {:>12} {:>10}'.format('group', 'positions', 'accuracy', 'value err',
+                                                              'ms/position', 'nodes')]
+    for group in sorted(summary, key=lambda group: (group != 'all', group)):
+        row = summary[group]
+        lines.append('  {:<18} {:>9} {:>8.1f}% {:>11.3f} {:>12.2f} {:>10.0f}'.format(
+            group, row['positions'], 100 * row['accuracy'], row['valueError'], 1000 * row['secondsPerPosition'],
+            row['nodesPerPosition']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Accuracy and speed of engines on positions with known solutions')
+    parser.add_argument('--suite', default=config.position_suite)
+    parser.add_argument('--engines', default='nn', help='comma separated, among nn, mcts_nn:SIMS, mcts:SIMS, solver')
+    parser.add_argument('--model', default='./best_model_resnet.pth', help='untrained NN if the file does not exist')
+    parser.add_argument('--phase', default=None, choices=[row[0] for row in PHASES])
+    parser.add_argument('--difficulty', default=None, choices=DIFFICULTIES)
+    parser.add_argument('--limit', type=int, default=None, help='positions per group')
+    parser.add_argument('--parallel', type=int, default=8, help='concurrent mcts_nn searches (batched leaves)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help='JSON file of the summaries')
+    parser.add_argument('--generate', type=int, default=None, metavar='N',
+                        help='write a new suite of N positions per group instead')
+    args = parser.parse_args()
+
+    if args.generate is not None:
+        save_suite(generate(args.generate, args.seed), args.suite)
+        sys.exit(0)
+
+    if os.path.exists(args.model):
+        model = load_model(args.model)
+    else:
+        print('no model at', args.model, ': untrained NN', file=sys.stderr)
+        model = resnet18()
+        model.eval()
+
+    records = load_suite(args.suite, args.phase, args.difficulty, args.limit)
+    report = {}
+    for engine in args.engines.split(','):
+        start = time.time()
+        report[engine] = score_results(records, run_engine(engine, records, model, args.parallel, args.seed))
+        print(format_summary(engine, report[engine]))
+        print('  {} positions in {:.1f} s'.format(len(records), time.time() - start))
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
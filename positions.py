@@ -0,0 +1,185 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             positions.py
+# Description:      Positions given as move strings or bitboards, and their batched
+#                   analysis : NN value and policy, or a short MCTS_NN search
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import threading
+import numpy as np
+import torch
+from Game_bitboard import Game
+from MCTS_NN import MCTS_NN
+from inference import flats_to_batch, BatchedEvaluator
+import config
+from numpy_net import as_numpy
+# ============================================================================ #
+
+# bit of each entry of a flattened board (see Game.binarystatetoflatlist) : top row first, columns left to right
+FLAT_BITS = np.array([8 * col + row for row in range(config.H - 1, -1, -1) for col in range(config.L)], dtype=np.uint64)
+# bits of the cells of the board, and of one column
+BOARD_MASK = sum(((1 << config.H) - 1) << (8 * col) for col in range(config.L))
+COLUMN_MASK = (1 << config.H) - 1
+
+
+# ---------------------------------------------------------------------------- #
+# state reached by a move string, columns numbered from 1 as on http://connect4.gamesolver.org
+# (e.g. '4453' : yellow in the center column, red on top of it, ...)
+def state_from_moves(moves):
+    game = Game()
+    for i, char in enumerate(str(moves)):
+        if not char.isdigit() or not 1 <= int(char) <= config.L:
+            raise ValueError('invalid column {!r} at move {}'.format(char, i + 1))
+        if game.gameover()[0]:
+            raise ValueError('game is over before move {}'.format(i + 1))
+        col = int(char) - 1
+        legal = [move for move in game.allowed_moves() if game.convert_move_to_col_index(move) == col]
+        if not legal:
+            raise ValueError('column {} is full at move {}'.format(char, i + 1))
+        game.takestep(legal[0])
+    return game.state
+
+
+# ---------------------------------------------------------------------------- #
+# state from the bitboards of both players (bit 8 * col + row, row 0 at the bottom) ; the player to move
+# is yellow when both have the same number of pieces (a given player_turn must agree). The pieces must be on the board,
+# each on top of another one, and only the player who moved last may have four in a row
+def state_from_bitboards(yellow, red, player_turn=None):
+    yellow, red = int(yellow), int(red)
+    if yellow < 0 or red < 0 or (yellow | red) & ~BOARD_MASK:
+        raise ValueError('pieces outside the board')
+    if yellow & red:
+        raise ValueError('yellow and red share a cell')
+    for col in range(config.L):
+        column = ((yellow | red) >> (8 * col)) & COLUMN_MASK
+        # the pieces of a column fill it from the bottom : column + 1 is then a single bit
+        if column & (column + 1):
+            raise ValueError('floating piece in column {}'.format(col + 1))
+    pieces = bin(yellow).count('1') - bin(red).count('1')
+    if pieces not in (0, 1):
+        raise ValueError('yellow must have as many pieces as red, or one more')
+    to_move = 1 if pieces == 0 else -1
+    if player_turn is not None and player_turn not in (1, -1):
+        raise ValueError('turn must be 1 (yellow) or -1 (red)')
+    if player_turn is not None and player_turn != to_move:
+        raise ValueError('{} is to move with these pieces'.format('yellow' if to_move == 1 else 'red'))
+    game = Game()
+    if game.checkwin(yellow if to_move == 1 else red):
+        raise ValueError('the player to move already has four in a row')
+    return [yellow, red, to_move]
+
+
+# ---------------------------------------------------------------------------- #
+# state of a JSON record : {"moves": "4453"} or {"yellow": int, "red": int, "turn": 1 or -1 (optional)}
+def parse_position(record):
+    if 'moves' in record:
+        return state_from_moves(record['moves'])
+    if 'yellow' in record and 'red' in record:
+        return state_from_bitboards(record['yellow'], record['red'], record.get('turn'))
+    raise ValueError('a position needs "moves", or "yellow" and "red"')
+
+
+# ---------------------------------------------------------------------------- #
+# batched Game.state_flattener : array of shape (n, 3 * H * L)
+def flatten_states(states):
+    boards = np.array([[state[0], state[1]] for state in states], dtype=np.uint64)
+    turns = np.array([state[2] for state in states], dtype=np.int64)
+    yellow = ((boards[:, 0:1] >> FLAT_BITS) & np.uint64(1)).astype(np.int64)
+    red = ((boards[:, 1:2] >> FLAT_BITS) & np.uint64(1)).astype(np.int64)
+    player = np.repeat(turns[:, None], config.H * config.L, axis=1)
+    return np.hstack((yellow, red, player))
+
+
+# ---------------------------------------------------------------------------- #
+# NN value (for the player to move) and policy of many states in one forward pass
+def evaluate_states(model, states):
+    with torch.no_grad():
+        values, policies = model.forward(flats_to_batch(flatten_states(states)))
+    return as_numpy(values)[:, 0], as_numpy(policies)
+
+
+# ---------------------------------------------------------------------------- #
+# result of the NN for one state : value, policy, and the legal column with the highest policy
+def nn_result(state, value, policy):
+    game = Game(state)
+    legal = [game.convert_move_to_col_index(move) for move in game.allowed_moves()]
+    result = {'value': float(value), 'policy': [float(p) for p in policy]}
+    if legal and not game.gameover()[0]:
+        result['bestCol'] = int(max(legal, key=lambda col: policy[col]))
+    return result
+
+
+# ---------------------------------------------------------------------------- #
+# short MCTS_NN search from state : visits and Q-values (for the player to move) per column
+def search_result(player, state, sim_number, cpuct=config.CPUCT):
+    game = Game(state)
+    if game.gameover()[0]:
+        return {'terminal': True, 'winner': int(game.gameover()[1])}
+
+    tree = MCTS_NN(player, use_dirichlet=False)
+    rootnode = tree.createNode(state)
+    report = tree.search(rootnode, cpuct, max_sims=sim_number, stop_on_forced=False)
+
+    visits = [0] * config.L
+    q_values = [None] * config.L
+    for child in rootnode.children:
+        col = game.convert_move_to_col_index(child.move)
+        visits[col] = child.N
+        q_values[col] = float(child.Q)
+    return {'visits': visits, 'q': q_values, 'sims': report.sims,
+            'bestCol': int(game.convert_move_to_col_index(report.best_child.move))}
+
+
+# ---------------------------------------------------------------------------- #
+# analysis of a list of JSON records, results in the same order. With sim_number 0 the NN alone is used,
+# with one forward pass for all the records ; otherwise a search of sim_number sims is run per record, in
+# `parallel` threads whose leaf evaluations are batched by evaluator (a BatchedEvaluator, by default a new one
+# for model), as in position_suite.run_mcts_nn. The searches use model, through the evaluator.
+# A record that cannot be parsed gets {"error": ...}. The "id" of a record is copied to its result
+def analyze_records(model, records, sim_number=0, evaluator=None, parallel=8):
+    results = []
+    states = []
+    for record in records:
+        result = {} if record.get('id') is None else {'id': record['id']}
+        try:
+            states.append(parse_position(record))
+        except (ValueError, TypeError) as e:
+            result['error'] = str(e)
+            states.append(None)
+        results.append(result)
+
+    valid = [i for i, state in enumerate(states) if state is not None]
+    if not valid:
+        return results
+
+    if sim_number == 0:
+        values, policies = evaluate_states(model, [states[i] for i in valid])
+        for k, i in enumerate(valid):
+            results[i].update(nn_result(states[i], values[k], policies[k]))
+    else:
+        evaluator = evaluator if evaluator is not None else BatchedEvaluator(model)
+        queue = list(valid)
+        lock = threading.Lock()
+
+        def worker():
+            with evaluator.client(model) as player:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        i = queue.pop(0)
+                    results[i].update(search_result(player, states[i], sim_number))
+
+        workers = [threading.Thread(target=worker) for _ in range(min(parallel, len(valid)))]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    return results
+
+# ============================================================================ #
@@ -0,0 +1,77 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             precision.py
+# Description:      Opt-in reduced precision on the CPU : bfloat16 autocast for the training,
+#                   bfloat16 or float16 copies of the net for the MCTS evaluations
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Modes : 'float32' (default, nothing changes), 'bfloat16', 'float16'.
+#   config.train_precision      'bfloat16' runs the forward passes of ResNet_Training under CPU autocast
+#                               (the weights, the optimizer and the losses stay in float32)
+#   config.inference_precision  the self-play / tournament workers and the api server evaluate with a copy
+#                               of the net whose weights and activations are in that type
+# Check the accuracy and the speed of a mode against float32 before using it : python check_precision.py
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import copy
+import numpy as np
+import torch
+import torch.nn as nn
+import config
+# ============================================================================ #
+
+DTYPES = {'float32': torch.float32, 'bfloat16': torch.bfloat16, 'float16': torch.float16}
+
+
+# ---------------------------------------------------------------------------- #
+def check_mode(mode):
+    if mode not in DTYPES:
+        raise ValueError('precision {!r} is not one of {}'.format(mode, sorted(DTYPES)))
+    return mode
+
+
+# ---------------------------------------------------------------------------- #
+# context of the forward pass of a training step : bfloat16 autocast on the CPU, nothing otherwise
+def autocast(mode=None):
+    mode = check_mode(mode or config.train_precision)
+    return torch.autocast('cpu', dtype=torch.bfloat16, enabled=mode == 'bfloat16' and not config.use_cuda)
+
+
+# =============================== CLASS: ReducedPrecisionNet ================================ #
+# player for MCTS_NN or a BatchedEvaluator : a copy of the net in dtype, taking and giving back float32
+class ReducedPrecisionNet(nn.Module):
+    # not converted again by for_inference
+    fixed_precision = True
+
+    def __init__(self, net, mode):
+        super(ReducedPrecisionNet, self).__init__()
+        self.mode = check_mode(mode)
+        self.dtype = DTYPES[mode]
+        self.net = copy.deepcopy(net).cpu().to(self.dtype)
+        self.net.eval()
+
+    def forward(self, x):
+        if type(x) == np.ndarray:
+            x = torch.as_tensor(x, dtype=torch.float32).reshape(-1, 3, config.H, config.L)
+        value, policy = self.net(x.to(self.dtype))
+        return value.float(), policy.float()
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# net to evaluate with in the given mode (config.inference_precision by default) : net itself for float32
+def for_inference(net, mode=None):
+    mode = check_mode(mode or config.inference_precision)
+    if mode == 'float32' or getattr(net, 'fixed_precision', False):
+        return net
+    return ReducedPrecisionNet(net, mode)
+
+
+# bytes of the weights and buffers of a net
+def model_bytes(net):
+    return sum(t.numel() * t.element_size() for t in list(net.parameters()) + list(net.buffers()))
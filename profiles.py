@@ -0,0 +1,69 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             profiles.py
+# Description:      Named strength profiles of the move server : checkpoint, sim
+#                   budget, move temperature, or moves from the NN policy alone
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import numpy as np
+import config
+# ============================================================================ #
+
+
+# =============================== CLASS: StrengthProfile ================================ #
+
+class StrengthProfile:
+    # ---------------------------------------------------------------------------- #
+    # model is a key of config.serving_models. With policy_only (or sims 0) the move is drawn from the NN
+    # policy, otherwise from the visits of a search of `sims` sims. temperature 0 plays the best move,
+    # temperature t > 0 draws a move with probability proportional to visits ** (1 / t) (or policy ** (1 / t))
+    def __init__(self, name, sims, temperature=0, policy_only=False, model='best'):
+        if sims < 0 or temperature < 0:
+            raise ValueError('profile {} : sims and temperature must be positive'.format(name))
+        self.name = name
+        self.sims = 0 if policy_only else int(sims)
+        self.temperature = float(temperature)
+        self.policy_only = self.sims == 0
+        self.model = model
+
+    def to_dict(self):
+        return {'sims': self.sims, 'temperature': self.temperature, 'policyOnly': self.policy_only,
+                'model': self.model}
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# profiles of a dict {name: {'sims': ..., 'temperature': ..., 'policy_only': ..., 'model': ...}}
+# (config.strength_profiles by default), checking that their models exist
+def load_profiles(profiles=None, models=None):
+    if profiles is None:
+        profiles = config.strength_profiles
+    if models is None:
+        models = config.serving_models
+
+    loaded = {}
+    for name, options in profiles.items():
+        profile = StrengthProfile(name, **options)
+        if profile.model not in models:
+            raise ValueError('profile {} : unknown model {}'.format(name, profile.model))
+        loaded[name] = profile
+    return loaded
+
+
+# ---------------------------------------------------------------------------- #
+# index of the move drawn from weights (visits or policy of the legal moves) at temperature
+def choose_index(weights, temperature):
+    weights = np.asarray(weights, dtype=float)
+    if temperature == 0 or np.sum(weights) <= 0:
+        return int(np.random.choice(np.where(weights == np.max(weights))[0]))
+    # scale before the power to avoid overflows at low temperature
+    probs = (weights / np.max(weights)) ** (1 / temperature)
+    return int(np.random.choice(len(weights), p=probs / np.sum(probs)))
+
+# ============================================================================ #
@@ -0,0 +1,213 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             profiling.py
+# Description:      Profiles of the short lived self-play / tournament worker processes :
+#                   each worker runs under cProfile or a sampling profiler, then the
+#                   per-worker profiles are merged into one report and collapsed stacks
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Modes (config.profile_workers) :
+#   'cprofile'  deterministic, every call is counted (slows the searches down, calls to tiny functions
+#               such as bitcounter or PUCT are over-weighted). One worker_<pid>_<n>.pstats per worker
+#   'sampling'  the stack of the worker is sampled every profile_sample_interval s of CPU time (SIGPROF,
+#               Unix only), with a small overhead. One worker_<pid>_<n>.collapsed per worker
+#
+# Workers are started with Process(target=profiling.target(onevsonegame), ...) : without profiling the
+# target is the function itself. merge_profiles(directory) writes
+#   report.txt        top functions by cumulative time (cprofile) or by samples (sampling)
+#   merged.collapsed  'frame;frame;frame count' lines for flamegraph.pl or speedscope
+#
+#   python profiling.py --mode sampling --games 8 --sims 100     profiled self-play round
+#   python profiling.py --report ./profiles                      merge existing profiles
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import argparse
+import cProfile
+import functools
+import glob
+import io
+import os
+import pstats
+import signal
+import time
+from collections import Counter
+import config
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# 'Game_bitboard.py:bitcounter' for a frame of the sampled stacks
+def frame_name(filename, name):
+    return '{}:{}'.format(os.path.basename(filename), name)
+
+
+def output_path(directory, extension):
+    return os.path.join(directory, 'worker_{}_{}.{}'.format(os.getpid(), int(time.time() * 1e6), extension))
+
+
+# =============================== CLASS: StackSampler ================================ #
+# Counts the stacks of the main thread, sampled by a SIGPROF timer (CPU time of the process)
+class StackSampler:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, interval=None):
+        self.interval = config.profile_sample_interval if interval is None else interval
+        self.stacks = Counter()
+        self.previous_handler = None
+
+    # the stack stops at run_profiled : the frames of the parent process copied by the fork are left out
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None and frame.f_code is not run_profiled.__code__:
+            stack.append(frame_name(frame.f_code.co_filename, frame.f_code.co_name))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    # ---------------------------------------------------------------------------- #
+    def start(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler)
+
+    def dump(self, path):
+        with open(path, 'w') as file:
+            for stack, count in self.stacks.items():
+                file.write('{} {}\n'.format(stack, count))
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# runs func(*args) under the profiler of mode and writes the profile of this process to directory
+def run_profiled(func, mode, directory, *args):
+    os.makedirs(directory, exist_ok=True)
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(func, *args)
+        finally:
+            profiler.dump_stats(output_path(directory, 'pstats'))
+    elif mode == 'sampling':
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            return func(*args)
+        finally:
+            sampler.stop()
+            sampler.dump(output_path(directory, 'collapsed'))
+    raise ValueError('unknown profiling mode {}'.format(mode))
+
+
+# ---------------------------------------------------------------------------- #
+# target of a worker Process : func itself, or func under the profiler when config.profile_workers is set
+def target(func, mode=None, directory=None):
+    mode = config.profile_workers if mode is None else mode
+    if not mode:
+        return func
+    directory = config.profile_dir if directory is None else directory
+    return functools.partial(run_profiled, func, mode, directory)
+
+
+# ---------------------------------------------------------------------------- #
+# removes the profiles of a previous run
+def clear_profiles(directory=None):
+    directory = config.profile_dir if directory is None else directory
+    for pattern in ['worker_*.pstats', 'worker_*.collapsed', 'report.txt', 'merged.collapsed']:
+        for path in glob.glob(os.path.join(directory, pattern)):
+            os.remove(path)
+
+
+# ---------------------------------------------------------------------------- #
+# stack counts of collapsed stack files, summed
+def read_collapsed(paths):
+    stacks = Counter()
+    for path in paths:
+        with open(path) as file:
+            for line in file:
+                stack, _, count = line.rstrip('\n').rpartition(' ')
+                if stack:
+                    stacks[stack] += int(count)
+    return stacks
+
+
+# ---------------------------------------------------------------------------- #
+# (function, self samples, cumulative samples) sorted by cumulative samples. A function appearing
+# several times in a stack (recursion) is counted once in its cumulative samples
+def sample_table(stacks):
+    own = Counter()
+    cumulative = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for name in set(frames):
+            cumulative[name] += count
+    return [(name, own[name], cumulative[name]) for name, _ in cumulative.most_common()]
+
+
+# ---------------------------------------------------------------------------- #
+# merges the worker profiles of directory, writes report.txt and returns the report. cProfile does not
+# record stacks : merged.collapsed is only written from sampling profiles
+def merge_profiles(directory=None, top=30):
+    directory = config.profile_dir if directory is None else directory
+    pstats_files = sorted(glob.glob(os.path.join(directory, 'worker_*.pstats')))
+    collapsed_files = sorted(glob.glob(os.path.join(directory, 'worker_*.collapsed')))
+    lines = []
+
+    if pstats_files:
+        out = io.StringIO()
+        stats = pstats.Stats(*pstats_files, stream=out)
+        lines.append('cProfile of {} workers, {:.2f} s of profiled time'.format(len(pstats_files), stats.total_tt))
+        stats.sort_stats('cumulative').print_stats(top)
+        lines.append(out.getvalue())
+
+    if collapsed_files:
+        stacks = read_collapsed(collapsed_files)
+        total = sum(stacks.values())
+        with open(os.path.join(directory, 'merged.collapsed'), 'w') as file:
+            for stack, count in stacks.most_common():
+                file.write('{} {}\n'.format(stack, count))
+        lines.append('sampling profile of {} workers, {} samples'.format(len(collapsed_files), total))
+        lines.append('{:>8} {:>8} {:>8} {:>8}  function'.format('self', 'self %', 'cumul', 'cumul %'))
+        for name, own, cumulative in sample_table(stacks)[:top]:
+            lines.append('{:>8} {:>7.1f}% {:>8} {:>7.1f}%  {}'.format(
+                own, 100 * own / total, cumulative, 100 * cumulative / total, name))
+
+    report = '\n'.join(lines)
+    with open(os.path.join(directory, 'report.txt'), 'w') as file:
+        file.write(report + '\n')
+    return report
+
+
+# ---------------------------------------------------------------------------- #
+# one profiled self-play round of `games` games with the best model (or an untrained one)
+def profile_self_play(mode, games, sims, directory):
+    from main_functions import load_or_create_neural_net, self_play
+    config.profile_workers = mode
+    config.profile_dir = directory
+    config.SIM_NUMBER = config.sim_number_defense = sims
+    clear_profiles(directory)
+    player = load_or_create_neural_net()
+    player.eval()
+    self_play(player, 1, games, sims, config.CPUCT, config.tau_self_play, config.tau_zero_self_play,
+              config.dirichlet_for_self_play)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profiles of the self-play workers, merged into one report')
+    parser.add_argument('--mode', choices=['cprofile', 'sampling'], default='sampling')
+    parser.add_argument('--games', type=int, default=config.CPUS, help='parallel self-play games (workers)')
+    parser.add_argument('--sims', type=int, default=config.SIM_NUMBER, help='sims per move')
+    parser.add_argument('--dir', default=config.profile_dir, help='directory of the worker profiles')
+    parser.add_argument('--report', default=None, metavar='DIR', help='only merge the profiles of DIR')
+    parser.add_argument('--top', type=int, default=30, help='functions in the report')
+    args = parser.parse_args()
+
+    if args.report is None:
+        profile_self_play(args.mode, args.games, args.sims, args.dir)
+    print(merge_profiles(args.report or args.dir, args.top))
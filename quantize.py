@@ -0,0 +1,202 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             quantize.py
+# Description:      Int8 quantization of the resnet for serving and play on the CPU : calibration
+#                   on replay positions, int8 checkpoint saved next to the float one, report
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Modes :
+#   static   convolutions and dense layers in int8 (FX graph mode), the scales of the activations are
+#            calibrated on replay positions
+#   dynamic  dense layers only, activations quantized on the fly (no calibration)
+# The int8 net takes and gives back float32 like the resnet, (value, policy) = net.forward(x). It is saved as
+# best_model_resnet_int8.pth next to best_model_resnet.pth (int8_path) ; inference.load_model recognizes the file, so
+# MCTS_NN players, api_server.py (--model or config.serve_int8) and the GUIs (config.serve_int8) can use it.
+# With config.serve_int8, Main.py writes a new one, calibrated on its replay data, each time the best model changes.
+#
+#   python quantize.py                                            quantize best_model_resnet.pth, report
+#   python quantize.py --replay checkpoints/run-0003-end.pth      calibrated on the replay data of a run checkpoint
+#   python quantize.py --games 8 --sims 100                       with a head-to-head match against the float model
+#
+# torch.ao.quantization is deprecated in favour of torchao, which is not a dependency here : its warnings are muted.
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import argparse
+import copy
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import torch
+import torch.nn as nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+import config
+import checkpoint
+import main_functions
+from ResNet import resnet18
+from inference import load_model, flats_to_batch, int8_path
+from check_precision import suite_flats, evaluate, inference_ms
+# ============================================================================ #
+
+MODES = ['static', 'dynamic']
+
+
+# ---------------------------------------------------------------------------- #
+# int8 version of a copy of a float resnet, before calibration in the static mode
+def int8_graph(net, mode, engine=None):
+    engine = engine or config.quantized_engine
+    net = copy.deepcopy(net).cpu()
+    net.eval()
+    torch.backends.quantized.engine = engine
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if mode == 'dynamic':
+            return quantize_dynamic(net, {nn.Linear}, dtype=torch.qint8)
+        example = (flats_to_batch([np.zeros(3 * config.H * config.L)]),)
+        return prepare_fx(net, get_default_qconfig_mapping(engine), example)
+
+
+# =============================== CLASS: QuantizedNet ================================ #
+# player for MCTS_NN or a BatchedEvaluator : the int8 net, taking and giving back float32
+class QuantizedNet(nn.Module):
+    # not converted again by precision.for_inference
+    fixed_precision = True
+
+    def __init__(self, net, mode, engine=None):
+        super(QuantizedNet, self).__init__()
+        self.net = net
+        self.mode = mode
+        self.engine = engine or config.quantized_engine
+        self.net.eval()
+
+    def forward(self, x):
+        if type(x) == np.ndarray:
+            x = torch.as_tensor(x, dtype=torch.float32).reshape(-1, 3, config.H, config.L)
+        return self.net(x)
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# int8 net of a float resnet, calibrated with the flat states (rows of Game.state_flattener) for the static mode
+def quantize(net, flats=None, mode=None):
+    mode = mode or config.quantize_mode
+    if mode not in MODES:
+        raise ValueError('quantization {!r} is not one of {}'.format(mode, MODES))
+    graph = int8_graph(net, mode)
+    if mode == 'static':
+        if flats is None or len(flats) == 0:
+            raise ValueError('the static quantization needs calibration positions')
+        with torch.no_grad():
+            for first in range(0, len(flats), 256):
+                graph(flats_to_batch(flats[first:first + 256]))
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            graph = convert_fx(graph)
+    return QuantizedNet(graph, mode, config.quantized_engine)
+
+
+# ---------------------------------------------------------------------------- #
+# int8 checkpoint, written atomically like the float one (serving processes may reload it at any time)
+def save_quantized(net, path):
+    tmp_path = path + '.tmp'
+    torch.save({'quantization': net.mode, 'engine': net.engine, 'model': net.net.state_dict()}, tmp_path)
+    os.replace(tmp_path, path)
+
+
+# net of an int8 checkpoint (see inference.load_model) : the same graph, then its saved weights and scales
+def load_quantized(checkpoint):
+    graph = int8_graph(resnet18(), checkpoint['quantization'], checkpoint['engine'])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        if checkpoint['quantization'] == 'static':
+            graph = convert_fx(graph)
+        graph.load_state_dict(checkpoint['model'])
+    return QuantizedNet(graph, checkpoint['quantization'], checkpoint['engine'])
+
+
+# calibration rows of replay data (rows of self play : flat state, pi, z)
+def calibration_flats(data, rows=None, seed=0):
+    rows = rows or config.quantize_calibration_rows
+    data = data[np.any(data != 0, axis=1)]
+    picked = np.random.RandomState(seed).choice(data.shape[0], min(rows, data.shape[0]), replace=False)
+    return data[picked, :3 * config.H * config.L]
+
+
+def file_bytes(path):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+# ---------------------------------------------------------------------------- #
+# latency, size and accuracy of the int8 net against the float one, and optionally a match between them
+# (games played as in the gating of Main.py, the int8 net being player 1)
+def report(model, int8, flats, float_path=None, games=0, sim_number=None, seed=0):
+    values, policies = evaluate(model, flats)
+    int8_values, int8_policies = evaluate(int8, flats)
+    result = {'mode': int8.mode, 'positions': len(flats),
+              'policyMaxError': float(np.abs(int8_policies - policies).max()),
+              'valueMaxError': float(np.abs(int8_values - values).max()),
+              'bestMoveAgreement': float(np.mean(int8_policies.argmax(1) == policies.argmax(1))),
+              'floatMs': inference_ms(model, flats), 'int8Ms': inference_ms(int8, flats)}
+    if float_path is not None:
+        result['floatBytes'], result['int8Bytes'] = file_bytes(float_path), file_bytes(int8_path(float_path))
+
+    if games > 0:
+        sim_number = sim_number or config.sim_number_tournaments
+        cpus = min(games, config.CPUS)
+        win_int8, win_float, draws, _ = main_functions.play_v1_against_v2(
+            int8, model, -(-games // cpus), cpus, sim_number, config.CPUCT, config.tau_pv,
+            config.tau_zero_eval_new_nn, False, seed)
+        result['match'] = {'games': win_int8 + win_float + draws, 'int8Wins': win_int8, 'floatWins': win_float,
+                           'draws': draws, 'int8Score': (win_int8 + 0.5 * draws) / max(win_int8 + win_float + draws, 1)}
+    return result
+
+
+def format_report(result):
+    lines = ['{} int8 on {} positions : policy max error {:.4f}, value max error {:.4f}, best move agreement {:.1%}'
+             .format(result['mode'], result['positions'], result['policyMaxError'], result['valueMaxError'],
+                     result['bestMoveAgreement'])]
+    for size in sorted(result['floatMs']):
+        lines.append('  batch {:>3d} : {:.2f} ms float, {:.2f} ms int8 ({:.2f}x)'.format(
+            size, result['floatMs'][size], result['int8Ms'][size], result['floatMs'][size] / result['int8Ms'][size]))
+    if result.get('int8Bytes'):
+        lines.append('  size : {:.2f} MB float, {:.2f} MB int8'.format(result['floatBytes'] / 1e6,
+                                                                     result['int8Bytes'] / 1e6))
+    if 'match' in result:
+        match = result['match']
+        lines.append('  match : int8 {int8Wins} - {floatWins} float, {draws} draws (int8 score {int8Score:.1%})'
+                     .format(**match))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Int8 version of the best model, saved next to it')
+    parser.add_argument('--model', default='./best_model_resnet.pth')
+    parser.add_argument('--mode', default=config.quantize_mode, choices=MODES)
+    parser.add_argument('--replay', default=None, metavar='CHECKPOINT',
+                        help='calibrate on the replay data of a run checkpoint (default : the position suite)')
+    parser.add_argument('--rows', type=int, default=config.quantize_calibration_rows, help='calibration positions')
+    parser.add_argument('--games', type=int, default=0, help='head-to-head games against the float model')
+    parser.add_argument('--sims', type=int, default=None, help='sims per move of these games')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        sys.exit('no model at {}'.format(args.model))
+    model = load_model(args.model, 'float32', 'torch')
+    if args.replay:
+        flats = calibration_flats(checkpoint.load_checkpoint(args.replay)['dataseen'], args.rows)
+    else:
+        flats = suite_flats()
+        flats = flats[np.random.RandomState(0).permutation(len(flats))[:args.rows]]
+
+    start = time.time()
+    int8 = quantize(model, flats, args.mode)
+    save_quantized(int8, int8_path(args.model))
+    print('saved {} ({:.1f} s)'.format(int8_path(args.model), time.time() - start))
+    print(format_report(report(model, int8, flats, args.model, args.games, args.sims)))
@@ -0,0 +1,89 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             rng.py
+# Description:      Explicit random streams for the searches and the self-play workers,
+#                   and the deterministic mode where config.seed fixes an iteration
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# A RandomStreams holds a numpy Generator (.np : dirichlet noise, move sampling, batched rollouts) and a
+# random.Random (.py : tie breaks and rollouts of the searches), both drawn from one SeedSequence.
+# Every game gets its own streams, created once and passed to its trees (MCTS_NN, MCTS), instead of
+# reseeding the global generators from the OS in the search loops.
+#
+# With config.seed = None (default) the streams are seeded from OS entropy, as before. With an int,
+# the streams of the worker `index` in round `r` of the stage `stage` of iteration `i` derive from
+# (config.seed, i, stage, r, index) : a seed then fixes the games of an iteration whatever the
+# number of processes and the order in which they run.
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import random
+import numpy as np
+import config
+# ============================================================================ #
+
+# stages of an iteration, keys of the derived seeds
+SELF_PLAY = 0
+GATING = 1
+ELO = 2
+TRAINING = 3
+
+
+# =============================== CLASS: RandomStreams ================================ #
+
+class RandomStreams:
+    # ---------------------------------------------------------------------------- #
+    # seed : None (OS entropy), an int, a list of ints or a numpy SeedSequence
+    def __init__(self, seed=None):
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence = seed
+        self.np = np.random.default_rng(seed)
+        self.py = random.Random(int(seed.generate_state(1, np.uint64)[0]))
+
+    # ---------------------------------------------------------------------------- #
+    # independent streams, e.g. one per tree of a root parallel search
+    def spawn(self, n):
+        return [RandomStreams(child) for child in self.seed_sequence.spawn(n)]
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# int seed derived from seed and keys, None if seed is None
+def derive_seed(seed, *keys):
+    if seed is None:
+        return None
+    return int(np.random.SeedSequence([seed] + [int(key) for key in keys]).generate_state(1)[0])
+
+
+# ---------------------------------------------------------------------------- #
+# streams of one game : seed is the seed of the stage (see stage_seed), None for OS entropy
+def game_streams(seed, round_index, index):
+    if seed is None:
+        return RandomStreams()
+    return RandomStreams([seed, round_index, index])
+
+
+# seed of a stage of iteration i in the deterministic mode, None otherwise
+def stage_seed(i, stage):
+    return derive_seed(config.seed, i, stage)
+
+
+# ---------------------------------------------------------------------------- #
+# global generators of the main process for iteration i (sampling of the training set, shuffles of the
+# data loaders, NN initialisation) : seeded from config.seed, or from the OS without deterministic mode
+def seed_globals(i):
+    seed = stage_seed(i, TRAINING)
+    if seed is None:
+        random.seed()
+        np.random.seed()
+        return
+    random.seed(seed)
+    np.random.seed(seed % (1 << 32))
+    # (imported here : the searches also run in processes without torch, see numpy_net.py)
+    import torch
+    torch.manual_seed(seed)
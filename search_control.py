@@ -0,0 +1,126 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             search_control.py
+# Description:      Anytime search controller : runs MCTS sims within a node
+#                   and/or wall-clock budget, and stops early when the move is known
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import numpy as np
+from Game_bitboard import Game
+import time
+# ============================================================================ #
+
+# Stop reasons reported by run_search :
+# 'terminal'     the root is a terminal state, nothing to search
+# 'single_move'  only one legal move
+# 'forced_win'   the player to move wins immediately
+# 'forced_block' the opponent threatens to win and exactly one move counters it
+# 'decided'      the most visited child can no longer be overtaken with the remaining budget
+# 'sim_budget'   max_sims sims done
+# 'time_budget'  max_time seconds elapsed
+
+
+# =============================== CLASS: SearchReport ================================ #
+
+class SearchReport:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, sims, elapsed, stop_reason, best_child):
+        self.sims = sims
+        self.elapsed = elapsed
+        self.stop_reason = stop_reason
+        self.best_child = best_child # child of the root to play, None for a terminal root
+
+    def __repr__(self):
+        return 'SearchReport(sims={}, elapsed={:.3f}s, stop_reason={})'.format(self.sims, self.elapsed, self.stop_reason)
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# most visited child, ties broken at random (with the numpy Generator rng, or the global numpy generator)
+def most_visited_child(rootnode, rng=None):
+    if rng is None:
+        rng = np.random
+    visits = np.asarray([child.N for child in rootnode.children])
+    imax = rng.choice(np.where(visits == np.max(visits))[0])
+    return rootnode.children[imax]
+
+
+# ---------------------------------------------------------------------------- #
+# returns (stop_reason, child) if the move at the root is forced, else (None, None)
+def forced_child(rootnode):
+    if len(rootnode.children) == 1:
+        return 'single_move', rootnode.children[0]
+
+    game = Game(rootnode.state)
+    can_win, winningmoves, can_lose, losingmoves = game.iscritical()
+
+    if can_win:
+        for child in rootnode.children:
+            if child.move in winningmoves:
+                return 'forced_win', child
+
+    if can_lose and len(losingmoves) == 1:
+        for child in rootnode.children:
+            if child.move == losingmoves[0]:
+                return 'forced_block', child
+
+    return None, None
+
+
+# ---------------------------------------------------------------------------- #
+# calls simulate() (one sim from rootnode) until the budget is spent or the move is known.
+# max_sims is a node budget, max_time a wall-clock budget in seconds ; at least one must be given.
+# visits_per_sim is the largest number of visits one sim can add to a child of the root.
+# If stop_on_forced is False only the budget and 'decided' rules are used, which never change
+# the most visited child with respect to running the whole budget.
+def run_search(simulate, rootnode, max_sims=None, max_time=None, visits_per_sim=1, stop_on_forced=True, rng=None):
+    if max_sims is None and max_time is None:
+        raise ValueError('run_search needs max_sims or max_time')
+
+    start = time.time()
+    deadline = None if max_time is None else start + max_time
+
+    if rootnode.isterminal():
+        return SearchReport(0, 0.0, 'terminal', None)
+
+    sims = 0
+    stop_reason = None
+
+    while True:
+        simulate()
+        sims += 1
+        now = time.time()
+
+        # the root is expanded after the first sim : check for a forced move once
+        if sims == 1 and stop_on_forced:
+            stop_reason, child = forced_child(rootnode)
+            if stop_reason is not None:
+                return SearchReport(sims, now - start, stop_reason, child)
+
+        if max_sims is not None and sims >= max_sims:
+            stop_reason = 'sim_budget'
+            break
+        if deadline is not None and now >= deadline:
+            stop_reason = 'time_budget'
+            break
+
+        # remaining sims we can still afford : for a time budget, estimated from the rate so far
+        remaining = np.inf
+        if max_sims is not None:
+            remaining = max_sims - sims
+        if deadline is not None:
+            remaining = min(remaining, (deadline - now) * sims / max(now - start, 1e-9))
+
+        if len(rootnode.children) > 1:
+            visits = sorted([child.N for child in rootnode.children], reverse=True)
+            if visits[0] - visits[1] > remaining * visits_per_sim:
+                stop_reason = 'decided'
+                break
+
+    return SearchReport(sims, time.time() - start, stop_reason, most_visited_child(rootnode, rng))
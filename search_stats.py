@@ -0,0 +1,128 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             search_stats.py
+# Description:      Per-phase instrumentation of MCTS_NN sims : calls and time spent in
+#                   selection, expansion, leaf evaluation and backfill, tree statistics
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# phases of one sim, in order (MCTS_NN.selection, expand_all, eval_leaf, backFill)
+PHASES = ('selection', 'expand', 'eval', 'backfill')
+
+
+# ---------------------------------------------------------------------------- #
+# number of nodes of the tree below root (root included)
+def count_nodes(root):
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack += node.children
+    return count
+
+
+# =============================== CLASS: SearchStats ================================ #
+# Counters filled by MCTS_NN.simulate when the tree has stats (config.search_stats, or given to MCTS_NN).
+# Without stats simulate runs the plain path and costs nothing more. One SearchStats per tree : searches
+# in other threads or processes are combined with merge() (to_dict() / from_dict() to send them around)
+class SearchStats:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self):
+        self.calls = {phase: 0 for phase in PHASES}
+        self.seconds = {phase: 0. for phase in PHASES}
+        self.sims = 0
+        self.depth_total = 0 # plies from the search root to the selected leaf, summed over sims
+        self.max_depth = 0
+        self.terminal_leaves = 0
+        self.nodes_created = 0
+        self.nn_calls = 0
+        self.batch_sizes = {} # size of the NN forward passes : count
+        self.moves = 0
+        self.tree_nodes_total = 0 # tree size at the end of each move, summed over moves
+        self.max_tree_nodes = 0
+
+    # ---------------------------------------------------------------------------- #
+    def add_time(self, phase, seconds):
+        self.calls[phase] += 1
+        self.seconds[phase] += seconds
+
+    def record_batch(self, size):
+        self.nn_calls += 1
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+
+    # ---------------------------------------------------------------------------- #
+    # call once the sims of a move are done, with the root of the search
+    def end_move(self, root):
+        nodes = count_nodes(root)
+        self.moves += 1
+        self.tree_nodes_total += nodes
+        self.max_tree_nodes = max(self.max_tree_nodes, nodes)
+
+    # ---------------------------------------------------------------------------- #
+    def merge(self, other):
+        for phase in PHASES:
+            self.calls[phase] += other.calls[phase]
+            self.seconds[phase] += other.seconds[phase]
+        for size, count in other.batch_sizes.items():
+            self.batch_sizes[size] = self.batch_sizes.get(size, 0) + count
+        self.max_depth = max(self.max_depth, other.max_depth)
+        self.max_tree_nodes = max(self.max_tree_nodes, other.max_tree_nodes)
+        for name in ['sims', 'depth_total', 'terminal_leaves', 'nodes_created', 'nn_calls', 'moves',
+                     'tree_nodes_total']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        return self
+
+    # ---------------------------------------------------------------------------- #
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.__dict__.update(data)
+        return stats
+
+    # ---------------------------------------------------------------------------- #
+    def summary(self):
+        total = sum(self.seconds.values())
+        phases = {}
+        for phase in PHASES:
+            phases[phase] = {'calls': self.calls[phase], 'totalMs': self.seconds[phase] * 1000,
+                             'meanUs': self.seconds[phase] * 1e6 / max(self.calls[phase], 1),
+                             'share': self.seconds[phase] / total if total else 0.}
+        batches = sum(self.batch_sizes.values())
+        return {
+            'sims': self.sims,
+            'simsPerSec': self.sims / total if total else 0.,
+            'phases': phases,
+            'meanDepth': self.depth_total / max(self.sims, 1),
+            'maxDepth': self.max_depth,
+            'terminalLeaves': self.terminal_leaves,
+            'nodesCreated': self.nodes_created,
+            'nnCalls': self.nn_calls,
+            'meanBatchSize': sum(size * count for size, count in self.batch_sizes.items()) / max(batches, 1),
+            'batchSizes': {str(size): count for size, count in sorted(self.batch_sizes.items())},
+            'moves': self.moves,
+            'meanTreeNodes': self.tree_nodes_total / max(self.moves, 1),
+            'maxTreeNodes': self.max_tree_nodes,
+        }
+
+    # ---------------------------------------------------------------------------- #
+    # table printed at the end of a self-play run
+    def format_summary(self):
+        summary = self.summary()
+        lines = ['{:<10} {:>10} {:>12} {:>10} {:>7}'.format('phase', 'calls', 'total ms', 'mean us', 'share')]
+        for phase, row in summary['phases'].items():
+            lines.append('{:<10} {:>10} {:>12.1f} {:>10.1f} {:>6.1f}%'.format(
+                phase, row['calls'], row['totalMs'], row['meanUs'], 100 * row['share']))
+        lines.append('sims {} ({:.0f}/s), mean depth {:.1f} (max {}), nodes created {}, NN calls {} '
+                     '(mean batch {:.1f}), mean tree {:.0f} nodes over {} moves'.format(
+                         summary['sims'], summary['simsPerSec'], summary['meanDepth'], summary['maxDepth'],
+                         summary['nodesCreated'], summary['nnCalls'], summary['meanBatchSize'],
+                         summary['meanTreeNodes'], summary['moves']))
+        return '\n'.join(lines)
+
+# ============================================================================ #
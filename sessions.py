@@ -0,0 +1,111 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             sessions.py
+# Description:      Search trees kept between the requests of a game session, so
+#                   that the next search starts from the subtree already explored
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+from collections import OrderedDict
+import threading
+import time
+import config
+from search_stats import count_nodes
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# node of the tree with the given state, searched down to depth plies below root (None if not found).
+# A session stores the tree after the AI move : the next request is one human move below it
+def find_state(root, state, depth=2):
+    level = [root]
+    for _ in range(depth + 1):
+        for node in level:
+            if list(node.state) == list(state):
+                return node
+        level = [child for node in level for child in node.children]
+    return None
+
+
+# =============================== CLASS: SessionStore ================================ #
+# Trees of the game sessions, evicted when idle for more than ttl seconds, and least recently used
+# first when all trees together have more than max_nodes nodes.
+# take() removes the tree from the store for the time of the search, so that two concurrent requests
+# of the same session never search the same tree : the second one starts from a new tree
+class SessionStore:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self, ttl=None, max_nodes=None):
+        if ttl is None:
+            ttl = config.session_ttl
+        if max_nodes is None:
+            max_nodes = config.session_max_nodes
+        self.ttl = ttl
+        self.max_nodes = max_nodes
+        self.lock = threading.Lock()
+        self.trees = OrderedDict() # session id -> [root, nodes, last use], least recently used first
+        self.nodes = 0
+
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    # ---------------------------------------------------------------------------- #
+    # returns the node of the session tree for state, detached from the tree, or None
+    def take(self, session_id, state):
+        with self.lock:
+            self.evict()
+            entry = self.trees.pop(session_id, None)
+            node = None
+            if entry is not None:
+                self.nodes -= entry[1]
+                node = find_state(entry[0], state)
+            if node is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                node.parent = None
+            return node
+
+    # ---------------------------------------------------------------------------- #
+    # stores root as the tree of the session
+    def put(self, session_id, root):
+        nodes = count_nodes(root)
+        with self.lock:
+            entry = self.trees.pop(session_id, None)
+            if entry is not None:
+                self.nodes -= entry[1]
+            self.trees[session_id] = [root, nodes, time.time()]
+            self.nodes += nodes
+            self.evict()
+
+    # ---------------------------------------------------------------------------- #
+    def discard(self, session_id):
+        with self.lock:
+            entry = self.trees.pop(session_id, None)
+            if entry is not None:
+                self.nodes -= entry[1]
+
+    # ---------------------------------------------------------------------------- #
+    # caller holds the lock
+    def evict(self):
+        now = time.time()
+        while self.trees:
+            session_id, (root, nodes, last_use) = next(iter(self.trees.items()))
+            if now - last_use <= self.ttl and self.nodes <= self.max_nodes:
+                break
+            del self.trees[session_id]
+            self.nodes -= nodes
+            self.evicted += 1
+
+    # ---------------------------------------------------------------------------- #
+    def summary(self):
+        with self.lock:
+            return {'sessions': len(self.trees), 'nodes': self.nodes, 'hits': self.hits,
+                    'misses': self.misses, 'evicted': self.evicted}
+
+# ============================================================================ #
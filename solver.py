@@ -0,0 +1,191 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             solver.py
+# Description:      Exact Connect 4 solver : negamax with alpha-beta pruning, a
+#                   transposition table and a null window search of the score
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Port of the solver of http://blog.gamesolver.org to the bitboards of Game_bitboard.py (bit 8 * col + row).
+# A position is (current, mask) : the stones of the player to move, and all the stones.
+#
+# Scores are those of connect4.gamesolver.org, for the player to move : 0 for a draw, 22 - n when the player
+# to move wins with his n-th stone (the sooner, the higher), and n - 22 when he loses to the n-th stone
+# of the opponent. Positions of the opening take minutes in python : the solver is meant for middle game
+# and endgame positions (see position_suite.py).
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import config
+# ============================================================================ #
+
+H = config.H
+L = config.L
+SIZE = H * L
+BOTTOM = sum(1 << (8 * col) for col in range(L))
+BOARD = BOTTOM * ((1 << H) - 1)
+MIN_SCORE = -(SIZE // 2) + 3
+MAX_SCORE = (SIZE + 1) // 2 - 3
+# center columns first : better moves are tried first and alpha-beta cuts more
+COLUMN_ORDER = sorted(range(L), key=lambda col: abs(col - L // 2))
+COLUMN_MASKS = [((1 << H) - 1) << (8 * col) for col in range(L)]
+# the table is cleared when it reaches this size
+TABLE_SIZE = 1 << 22
+
+
+# ---------------------------------------------------------------------------- #
+# cells where position would have 4 in a row (empty or not)
+def winning_cells(position, mask):
+    # vertical
+    cells = (position << 1) & (position << 2) & (position << 3)
+    # horizontal (8) and both diagonals (7, 9)
+    for shift in (8, 7, 9):
+        pair = (position << shift) & (position << 2 * shift)
+        cells |= pair & (position << 3 * shift)
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> 2 * shift)
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> 3 * shift)
+    return cells & (BOARD ^ mask)
+
+
+# ---------------------------------------------------------------------------- #
+# (current, mask, moves played) of a Game state
+def from_state(state):
+    yellow, red, player_turn = int(state[0]), int(state[1]), state[2]
+    mask = yellow | red
+    return (yellow if player_turn == 1 else red), mask, bin(mask).count('1')
+
+
+def playable(mask):
+    return (mask + BOTTOM) & BOARD
+
+
+def can_win_next(current, mask):
+    return winning_cells(current, mask) & playable(mask) != 0
+
+
+# ---------------------------------------------------------------------------- #
+# playable cells that do not give the opponent an immediate win
+def non_losing_moves(current, mask):
+    possible = playable(mask)
+    opponent_win = winning_cells(current ^ mask, mask)
+    forced = possible & opponent_win
+    if forced:
+        # two threats of the opponent : every move loses
+        if forced & (forced - 1):
+            return 0
+        possible = forced
+    # and do not play under a cell where the opponent would win
+    return possible & ~(opponent_win >> 1)
+
+
+# =============================== CLASS: Solver ================================ #
+# The transposition table is kept between calls : solving the children of a position reuses the work
+class Solver:
+    # ---------------------------------------------------------------------------- #
+    def __init__(self):
+        self.table = {}
+        self.nodes = 0
+
+    # ---------------------------------------------------------------------------- #
+    # score within [alpha, beta] : exact when inside, otherwise a bound. The player to move cannot win
+    # immediately (checked by the caller)
+    def negamax(self, current, mask, moves, alpha, beta):
+        self.nodes += 1
+        candidates = non_losing_moves(current, mask)
+        if candidates == 0:
+            return -((SIZE - moves) // 2)
+        if moves >= SIZE - 2:
+            return 0
+
+        # the opponent cannot win at his next move
+        lower = -((SIZE - 2 - moves) // 2)
+        if alpha < lower:
+            alpha = lower
+            if alpha >= beta:
+                return alpha
+
+        # we cannot win at our next move, and the table may hold a better upper bound
+        upper = (SIZE - 1 - moves) // 2
+        key = current + mask
+        bound = self.table.get(key)
+        if bound is not None:
+            upper = bound + MIN_SCORE - 1
+        if beta > upper:
+            beta = upper
+            if alpha >= beta:
+                return beta
+
+        # moves creating the most threats first, center first on ties
+        ordered = []
+        for col in COLUMN_ORDER:
+            move = candidates & COLUMN_MASKS[col]
+            if move:
+                ordered.append((-bin(winning_cells(current | move, mask)).count('1'), len(ordered), move))
+        ordered.sort()
+
+        for _, _, move in ordered:
+            score = -self.negamax(current ^ mask, mask | move, moves + 1, -beta, -alpha)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+
+        if len(self.table) >= TABLE_SIZE:
+            self.table.clear()
+        self.table[key] = alpha - MIN_SCORE + 1
+        return alpha
+
+    # ---------------------------------------------------------------------------- #
+    # exact score of a position which is not over, for the player to move
+    def solve_position(self, current, mask, moves):
+        if can_win_next(current, mask):
+            return (SIZE + 1 - moves) // 2
+        low = -((SIZE - moves) // 2)
+        high = (SIZE + 1 - moves) // 2
+        # null window searches, first around 0 then towards the score
+        while low < high:
+            mid = low + (high - low) // 2
+            if mid <= 0 and int(low / 2) < mid:
+                mid = int(low / 2)
+            elif mid >= 0 and int(high / 2) > mid:
+                mid = int(high / 2)
+            score = self.negamax(current, mask, moves, mid, mid + 1)
+            if score <= mid:
+                high = score
+            else:
+                low = score
+        return low
+
+    def solve(self, state):
+        return self.solve_position(*from_state(state))
+
+    # ---------------------------------------------------------------------------- #
+    # score of every column for the player to move (None for a full column), from the same scale as solve
+    def column_scores(self, state):
+        current, mask, moves = from_state(state)
+        wins = winning_cells(current, mask)
+        scores = [None] * L
+        for col in range(L):
+            move = playable(mask) & COLUMN_MASKS[col]
+            if not move:
+                continue
+            if wins & move:
+                scores[col] = (SIZE + 1 - moves) // 2
+            elif moves + 1 == SIZE:
+                scores[col] = 0
+            else:
+                scores[col] = -self.solve_position(current ^ mask, mask | move, moves + 1)
+        return scores
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# columns of the highest score
+def best_columns(scores):
+    best = max(score for score in scores if score is not None)
+    return [col for col, score in enumerate(scores) if score == best]
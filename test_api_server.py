@@ -0,0 +1,455 @@
+#  ================ Test for the move server =================== #
+# Name:             test_api_server.py
+# Description:      Tests of the batched evaluator and of the api server routes, with an untrained NN
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import os
+import tempfile
+import threading
+import time
+import torch
+import config
+from Game_bitboard import Game
+from ResNet import resnet18
+from inference import BatchedEvaluator
+from MCTS_NN import MCTS_NN
+from sessions import SessionStore
+from search_stats import count_nodes
+from model_reload import ModelManager, save_model_atomic
+from admission import AdmissionController, Overloaded
+from profiles import StrengthProfile, load_profiles, choose_index
+from positions import state_from_moves, state_from_bitboards, flatten_states, analyze_records
+from werkzeug.serving import make_server
+import api_server
+import load_test
+
+
+def make_model_file():
+    model = resnet18()
+    path = os.path.join(tempfile.mkdtemp(), 'model.pth')
+    torch.save(model.state_dict(), path)
+    return path
+
+
+def empty_board():
+    return [[None] * 6 for _ in range(7)]
+
+
+def test_batched_evaluator():
+    """Concurrent forwards are batched and give the same outputs as the NN"""
+    model = resnet18()
+    model.eval()
+    evaluator = BatchedEvaluator(model, max_batch=8, max_wait=1)
+
+    game = Game()
+    states = []
+    for col in range(7):
+        game = Game()
+        game.takestep([m for m in game.allowed_moves() if game.convert_move_to_col_index(m) == col][0])
+        states.append(game.state_flattener(game.state))
+
+    results = [None] * len(states)
+
+    def worker(i):
+        with evaluator.client():
+            results[i] = evaluator.forward(states[i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(states))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with torch.no_grad():
+        for i, flat in enumerate(states):
+            value, policy = model.forward(flat)
+            assert results[i][0].shape == (1, 1) and results[i][1].shape == (1, 7)
+            assert torch.allclose(results[i][0], value, atol=1e-5)
+            assert torch.allclose(results[i][1], policy, atol=1e-5)
+
+    assert evaluator.batches < len(states)
+    print("✓ batched evaluator, mean batch size", evaluator.mean_batch_size())
+
+
+def test_ai_move_route():
+    """Response shape of /ai-move, errors, and latency metrics"""
+    app = api_server.create_app(make_model_file(), sim_number=20)
+    client = app.test_client()
+
+    board = empty_board()
+    board[3][0] = 'yellow'
+    responses = [None] * 4
+
+    def worker(i):
+        responses[i] = client.post('/ai-move', json={'board': board, 'currentPlayer': 'red'})
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(responses))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for response in responses:
+        assert response.status_code == 200
+        data = response.get_json()
+        assert 0 <= data['column'] < 7
+        assert -1 <= data['evaluation'] <= 1
+        assert data['sims'] <= 20
+
+    assert client.post('/ai-move', json={'board': board, 'currentPlayer': 'blue'}).status_code == 400
+    assert client.post('/ai-move', json={'board': board[:3], 'currentPlayer': 'red'}).status_code == 400
+
+    metrics = client.get('/metrics').get_json()
+    assert metrics['requests'] == 4 and metrics['errors'] == 0
+    assert 0 < metrics['p50Ms'] <= metrics['p99Ms']
+    assert client.get('/health').get_json()['status'] == 'healthy'
+    print("✓ ai-move route", metrics)
+
+
+def test_ai_move_root_parallel():
+    """With config.root_parallel_workers, /ai-move requests without a session use the root parallel search"""
+    workers, config.root_parallel_workers = config.root_parallel_workers, 2
+    try:
+        app = api_server.create_app(make_model_file(), sim_number=10)
+    finally:
+        config.root_parallel_workers = workers
+    client = app.test_client()
+    try:
+        data = client.post('/ai-move', json={'board': empty_board(), 'currentPlayer': 'yellow'}).get_json()
+        assert 0 <= data['column'] < 7 and data['sims'] == 20 and data['effectiveSims'] == 2 * 9
+        # a session keeps its single tree
+        data = client.post('/ai-move', json={'board': empty_board(), 'currentPlayer': 'yellow',
+                                             'sessionId': 'a'}).get_json()
+        assert data['sims'] == 10
+    finally:
+        app.extensions['parallel'].close()
+    print("✓ ai-move root parallel")
+
+
+def test_session_store():
+    """Subtree lookup one human move below the stored tree, TTL and node budget eviction"""
+    model = resnet18()
+    model.eval()
+    tree = MCTS_NN(model, use_dirichlet=False)
+    rootnode = tree.createNode(Game().state)
+    for _ in range(30):
+        tree.simulate(rootnode, 1)
+
+    store = SessionStore(ttl=60, max_nodes=10 ** 6)
+    store.put('a', rootnode)
+    assert store.summary()['nodes'] == count_nodes(rootnode)
+
+    child = max(rootnode.children, key=lambda c: c.N)
+    node = store.take('a', child.state)
+    assert node is child and node.parent is None and node.N > 0
+    assert store.summary() == {'sessions': 0, 'nodes': 0, 'hits': 1, 'misses': 0, 'evicted': 0}
+    assert store.take('a', child.state) is None
+
+    # node budget : the least recently used tree goes first
+    store = SessionStore(ttl=60, max_nodes=count_nodes(rootnode) + 1)
+    store.put('a', rootnode)
+    store.put('b', tree.createNode(Game().state))
+    assert store.summary()['sessions'] == 2
+    store.put('c', tree.createNode(Game().state))
+    assert store.take('a', rootnode.state) is None
+    assert store.summary()['evicted'] == 1
+
+    # TTL
+    store = SessionStore(ttl=0, max_nodes=10 ** 6)
+    store.put('a', rootnode)
+    assert store.take('a', rootnode.state) is None
+    print("✓ session store")
+
+
+def test_ai_move_sessions():
+    """The second request of a session starts from the subtree of the moves played"""
+    app = api_server.create_app(make_model_file(), sim_number=50)
+    client = app.test_client()
+
+    board = empty_board()
+    board[3][0] = 'yellow'
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'red', 'sessionId': 'g1'}).get_json()
+    assert data['reusedVisits'] == 0 and data['effectiveSims'] == data['sims']
+
+    # AI move, then the human plays in column 3 again
+    board[data['column']][1 if data['column'] == 3 else 0] = 'red'
+    board[3][board[3].index(None)] = 'yellow'
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'red', 'sessionId': 'g1'}).get_json()
+    assert data['reusedVisits'] > 0
+    assert data['effectiveSims'] == data['reusedVisits'] + data['sims']
+
+    client.post('/end-session', json={'sessionId': 'g1'})
+    metrics = client.get('/metrics').get_json()
+    assert metrics['sessions']['sessions'] == 0 and metrics['sessions']['hits'] == 1
+    assert metrics['meanEffectiveSims'] > metrics['meanSims']
+    print("✓ ai-move sessions", metrics['meanSims'], metrics['meanEffectiveSims'])
+
+
+def test_positions():
+    """Move strings, bitboards, batched flattener and batched analysis"""
+    state = state_from_moves('4453')
+    assert state == [(1 << 24) | (1 << 32), (1 << 25) | (1 << 16), 1]
+    assert state_from_bitboards(state[0], state[1]) == state
+    assert state_from_bitboards(1 << 24, 0) == [1 << 24, 0, -1]
+    # outside the board (row 6, column 8), floating, overlapping
+    for yellow, red in [(1 << 6, 0), (1 << 56, 0), (-1, 0), (1 << 25, 0), (1 << 24, 1 << 26), (1, 1)]:
+        try:
+            state_from_bitboards(yellow, red)
+            assert False
+        except ValueError:
+            pass
+    # turn out of {1, -1} or against the pieces, both players winning, the player to move winning
+    yellow_four, red_four = 0b1111, 0b1111 << 8
+    assert state_from_bitboards(yellow_four, 0b111 << 8) == [yellow_four, 0b111 << 8, -1]
+    assert state_from_bitboards(0b111 | 1 << 16, red_four, 1) == [0b111 | 1 << 16, red_four, 1]
+    for yellow, red, turn in [(0, 0, 5), (0, 0, -1), (1 << 24, 0, 1), (yellow_four, red_four, None),
+                              (yellow_four | 1 << 16, red_four, None), (yellow_four, 0b111 << 8 | 1 << 16, None)]:
+        try:
+            state_from_bitboards(yellow, red, turn)
+            assert False
+        except ValueError:
+            pass
+    for bad in ['48', '4444444', 'x']:
+        try:
+            state_from_moves(bad)
+            assert False
+        except ValueError:
+            pass
+
+    states = [state_from_moves(moves) for moves in ['', '4', '4453', '1122334']]
+    flat = flatten_states(states)
+    for i, state in enumerate(states):
+        assert (flat[i] == Game(state).state_flattener(state)).all()
+
+    model = resnet18()
+    model.eval()
+    records = [{'id': 1, 'moves': '44'}, {'moves': '9'}, {'yellow': 1, 'red': 1 << 8}, {'moves': '1122334'}]
+    results = analyze_records(model, records)
+    assert results[0]['id'] == 1 and len(results[0]['policy']) == 7
+    with torch.no_grad():
+        value, _ = model.forward(flatten_states([state_from_moves('44')])[0])
+    assert abs(results[0]['value'] - value.item()) < 1e-5
+    assert 'error' in results[1]
+    assert 'bestCol' in results[2]
+    assert 'bestCol' not in results[3]
+
+    results = analyze_records(model, records, sim_number=10)
+    assert sum(results[0]['visits']) == 9 and results[0]['sims'] == 10
+    assert results[3] == {'terminal': True, 'winner': 1}
+    print("✓ positions")
+
+
+def test_analyze_route():
+    """Bulk analysis through the server"""
+    app = api_server.create_app(make_model_file(), sim_number=20)
+    client = app.test_client()
+
+    positions = [{'id': i, 'moves': '4' * (i % 6)} for i in range(100)]
+    data = client.post('/analyze', json={'positions': positions}).get_json()
+    assert [result['id'] for result in data['results']] == list(range(100))
+    data = client.post('/analyze', json={'positions': positions[:8], 'sims': 10}).get_json()
+    assert all(result['sims'] == 10 for result in data['results'])
+    # the searches of the positions are batched together
+    assert app.extensions['evaluator'].mean_batch_size() > 1
+    assert client.post('/analyze', json={'positions': [{'yellow': 1 << 25, 'red': 0}]}).status_code == 400
+    assert client.post('/analyze', json={'positions': [{'yellow': 1 << 6, 'red': 0}]}).status_code == 400
+    assert client.post('/analyze', json={'positions': positions, 'sims': 1000}).status_code == 400
+    assert client.post('/analyze', json={'positions': 'x'}).status_code == 400
+    print("✓ analyze route")
+
+
+def test_admission_controller():
+    """Sims cut with the queue depth and the sim cost, policy only floor, rejection"""
+    control = AdmissionController(100, min_sims=45, soft_in_flight=2, max_in_flight=5, target_latency=1.0, ewma=0.5)
+    tickets = [control.admit() for _ in range(5)]
+    assert [ticket.sims for ticket in tickets] == [100, 100, 66, 50, 0]
+    try:
+        control.admit()
+        assert False
+    except Overloaded as e:
+        assert e.retry_after >= 1
+    assert control.summary()['rejected'] == 1 and control.summary()['policyOnly'] == 1
+
+    for ticket in tickets:
+        ticket.release()
+    assert control.summary()['inFlight'] == 0
+
+    # 101 sims took 2 s : the full budget would take twice the target latency
+    ticket = control.admit()
+    ticket.release(2.0, 100)
+    assert control.admit().sims == 50
+    print("✓ admission controller")
+
+
+def test_ai_move_admission():
+    """Granted budget in the response, policy only moves and 503 when overloaded"""
+    app = api_server.create_app(make_model_file(), sim_number=20)
+    client = app.test_client()
+    board = empty_board()
+
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow'}).get_json()
+    assert data['simBudget'] == 20
+
+    # with all the in flight requests but one taken, the budget is below min_sims
+    control = app.extensions['admission']
+    control.min_sims = 10
+    held = [control.admit() for _ in range(control.max_in_flight - 1)]
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow'}).get_json()
+    assert data['simBudget'] == 0 and data['sims'] == 0 and 0 <= data['column'] < 7
+
+    held.append(control.admit())
+    response = client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow'})
+    assert response.status_code == 503 and int(response.headers['Retry-After']) >= 1
+    for ticket in held:
+        ticket.release()
+    print("✓ ai-move admission", client.get('/metrics').get_json()['admission'])
+
+
+def test_load_test():
+    """Short closed loop load test against a server in a thread"""
+    app = api_server.create_app(make_model_file(), sim_number=10)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{}'.format(server.server_port)
+
+    try:
+        recorder = load_test.Recorder()
+        start = time.time()
+        load_test.closed_loop(url, recorder, 2, start + 3, [[3, 3]], 0, 10)
+        report = load_test.summarize(recorder, time.time() - start)
+    finally:
+        server.shutdown()
+
+    assert report['requests'] > 0 and report['ok'] == report['requests']
+    assert report['errorRate'] == 0 and report['illegalMoves'] == 0
+    assert report['latencyMs']['p50'] <= report['latencyMs']['p99']
+    assert report['meanSimBudget'] == 10
+    print("✓ load test", report['requests'], 'requests', report['games'], 'games')
+
+
+def wait_for(condition, timeout=20):
+    start = time.time()
+    while not condition():
+        assert time.time() - start < timeout
+        time.sleep(0.02)
+
+
+def test_model_reload():
+    """Background reload on request and on file change, searches keep the model they started with"""
+    path = make_model_file()
+    manager = ModelManager(path, poll_interval=0.05)
+    evaluator = BatchedEvaluator(manager.model)
+    manager.on_swap(lambda model, version: setattr(evaluator, 'model', model))
+    old_model, old_version = manager.model, manager.version
+
+    flat = Game().state_flattener(Game().state)
+    with evaluator.client() as player:
+        save_model_atomic(resnet18(), path)
+        assert manager.reload()
+        wait_for(lambda: manager.reloads == 1)
+        assert manager.version != old_version and evaluator.model is manager.model
+        # the running search still uses the old model
+        assert player.model is old_model
+        with torch.no_grad():
+            assert torch.allclose(player.forward(flat)[0], old_model.forward(flat)[0])
+
+    with evaluator.client() as player:
+        assert player.model is manager.model
+
+    # the watcher picks up a new file
+    manager.watch()
+    version = manager.version
+    save_model_atomic(resnet18(), path)
+    wait_for(lambda: manager.reloads == 2)
+    assert manager.version != version
+    print("✓ model reload")
+
+
+def test_reload_route():
+    """Model version on /health, reload through the API"""
+    app = api_server.create_app(make_model_file(), sim_number=10)
+    client = app.test_client()
+    version = client.get('/health').get_json()['modelVersion']
+
+    save_model_atomic(resnet18(), app.extensions['models']['best'].path)
+    assert client.post('/reload').status_code == 202
+    wait_for(lambda: client.get('/health').get_json()['modelVersion'] != version)
+    data = client.post('/ai-move', json={'board': empty_board(), 'currentPlayer': 'yellow'}).get_json()
+    assert 0 <= data['column'] < 7
+    print("✓ reload route")
+
+
+
+def test_profiles():
+    """Profile validation and moves drawn at temperature"""
+    profiles = load_profiles({'easy': {'sims': 0, 'temperature': 1.0}, 'hard': {'sims': 100}}, {'best': 'x'})
+    assert profiles['easy'].policy_only and not profiles['hard'].policy_only
+    assert StrengthProfile('p', 50, policy_only=True).sims == 0
+    try:
+        load_profiles({'old': {'sims': 10, 'model': 'old'}}, {'best': 'x'})
+        assert False
+    except ValueError:
+        pass
+
+    assert choose_index([1, 5, 2], 0) == 1
+    draws = [choose_index([1, 3], 1.0) for _ in range(2000)]
+    assert 0.65 < sum(draws) / len(draws) < 0.85
+    assert all(choose_index([1, 3], 0.01) == 1 for _ in range(100))
+    print("✓ profiles")
+
+
+def test_profile_routes():
+    """Named profiles on /ai-move, two checkpoints behind the same batched evaluator"""
+    paths = {'best': make_model_file(), 'old': make_model_file()}
+    profiles = {'easy': {'sims': 0, 'temperature': 1.0}, 'normal': {'sims': 20},
+                'retro': {'sims': 10, 'model': 'old'}}
+    app = api_server.create_app(model_paths=paths, profiles=profiles)
+    client = app.test_client()
+    board = empty_board()
+
+    listed = client.get('/profiles').get_json()
+    assert listed['default'] == 'normal' and listed['profiles']['retro']['model'] == 'old'
+    assert set(app.extensions['models']) == {'best', 'old'}
+
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow', 'profile': 'easy'}).get_json()
+    assert data['profile'] == 'easy' and data['sims'] == 0 and 0 <= data['column'] < 7
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow'}).get_json()
+    assert data['profile'] == 'normal' and data['simBudget'] == 20
+    data = client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow', 'profile': 'retro',
+                                         'sessionId': 'g'}).get_json()
+    assert data['simBudget'] == 10
+    assert client.post('/ai-move', json={'board': board, 'currentPlayer': 'yellow',
+                                         'profile': 'x'}).status_code == 400
+
+    # sessions are kept per model
+    assert app.extensions['sessions'].summary()['sessions'] == 1
+    client.post('/end-session', json={'sessionId': 'g'})
+    assert app.extensions['sessions'].summary()['sessions'] == 0
+
+    metrics = client.get('/metrics').get_json()
+    assert metrics['profiles'] == {'easy': 1, 'normal': 1, 'retro': 1}
+    assert set(client.get('/health').get_json()['models']) == {'best', 'old'}
+    assert client.post('/reload', json={'model': 'x'}).status_code == 400
+    print("✓ profile routes")
+
+
+if __name__ == '__main__':
+    test_batched_evaluator()
+    test_ai_move_route()
+    test_ai_move_root_parallel()
+    test_session_store()
+    test_ai_move_sessions()
+    test_positions()
+    test_analyze_route()
+    test_admission_controller()
+    test_ai_move_admission()
+    test_load_test()
+    test_model_reload()
+    test_reload_route()
+    test_profiles()
+    test_profile_routes()
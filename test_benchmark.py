@@ -0,0 +1,38 @@
+#  ================ Test for the benchmark suite =================== #
+# Name:             test_benchmark.py
+# Description:      Quick run of the cheap benchmark scenarios and baseline comparison
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import benchmark
+
+
+def test_benchmark_run():
+    """Quick scenarios give positive rates, and the report keeps its environment"""
+    report = benchmark.run(['game', 'mcts', 'resnet'], quick=True, repeats=1)
+    assert set(report['results']) == {'game', 'mcts', 'resnet'}
+    assert report['environment']['quick'] and report['environment']['seed'] == 0
+    assert all(value > 0 for metrics in report['results'].values() for value in metrics.values())
+    assert 'batch64_ms' in report['results']['resnet']
+    print("✓ benchmark run")
+
+
+def test_benchmark_compare():
+    """Slowdowns past the threshold are regressions, for rates and latencies"""
+    baseline = {'results': {'mcts': {'sims_per_sec': 1000.}, 'resnet': {'batch1_ms': 1., 'batch8_ms': 4.},
+                            'self_play': {'games_per_hour': 100., 'sims': 50}}}
+    report = {'results': {'mcts': {'sims_per_sec': 850.}, 'resnet': {'batch1_ms': 1.5, 'batch8_ms': 4.2},
+                          'self_play': {'games_per_hour': 70., 'sims': 10}, 'training': {'samples_per_sec': 1.}}}
+    regressions = benchmark.compare(report, baseline, threshold=0.2)
+    assert [(name, metric) for name, metric, *_ in regressions] == [('resnet', 'batch1_ms'),
+                                                                   ('self_play', 'games_per_hour')]
+    assert abs(regressions[0][4] + 1 / 3) < 1e-9
+    assert benchmark.compare(report, baseline, threshold=0.5) == []
+    print("✓ benchmark compare")
+
+
+if __name__ == '__main__':
+    test_benchmark_run()
+    test_benchmark_compare()
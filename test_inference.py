@@ -0,0 +1,176 @@
+#  ================ Test of the served nets =================== #
+# Name:             test_inference.py
+# Description:      Tests of the int8 nets, exported artifacts and NumPy nets loaded for serving and play,
+#                   with an untrained NN
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import torch
+import config
+from Game_bitboard import Game
+from ResNet import resnet18
+from inference import BatchedEvaluator, load_model, int8_path
+from MCTS_NN import MCTS_NN
+from model_reload import ModelManager, save_model_atomic
+from positions import state_from_moves, flatten_states
+import quantize
+import export_model
+import numpy_net
+
+
+def make_model_file():
+    model = resnet18()
+    path = os.path.join(tempfile.mkdtemp(), 'model.pth')
+    torch.save(model.state_dict(), path)
+    return path
+
+
+def test_quantized_model():
+    """Int8 nets close to the float one, saved next to it and loaded for serving and searches"""
+    path = make_model_file()
+    model = load_model(path, 'float32')
+    flats = flatten_states([state_from_moves(moves) for moves in ['', '4', '44', '4433', '1234567', '7766554']])
+    x = torch.FloatTensor(np.array(flats, dtype=np.float32)).view(-1, 3, 6, 7)
+    with torch.no_grad():
+        values, policies = model.forward(x)
+        for mode in quantize.MODES:
+            int8 = quantize.quantize(model, flats, mode)
+            int8_values, int8_policies = int8.forward(x)
+            assert int8_values.dtype == torch.float32 and int8_policies.shape == policies.shape
+            assert (int8_policies - policies).abs().max() < 0.05 and (int8_values - values).abs().max() < 0.05
+
+            quantize.save_quantized(int8, int8_path(path))
+            loaded = load_model(int8_path(path))
+            assert isinstance(loaded, quantize.QuantizedNet) and loaded.mode == mode
+            assert torch.equal(loaded.forward(x)[1], int8_policies)
+    assert os.path.getsize(int8_path(path)) < os.path.getsize(path)
+
+    serve_int8, config.serve_int8 = config.serve_int8, True
+    try:
+        manager = ModelManager(path)
+        assert manager.path == int8_path(path) and isinstance(manager.model, quantize.QuantizedNet)
+    finally:
+        config.serve_int8 = serve_int8
+
+    tree = MCTS_NN(manager.model, use_dirichlet=False)
+    root = tree.createNode(Game().state)
+    for _ in range(20):
+        tree.simulate(root, 1)
+    assert root.N == 20
+
+    try:
+        quantize.quantize(model, None, 'static')
+        assert False
+    except ValueError:
+        pass
+    print("✓ quantized model")
+
+
+
+def test_exported_model():
+    """TorchScript artifact cached next to the checkpoint, used while fresh and exported again when stale"""
+    path = make_model_file()
+    model = load_model(path, 'float32', 'torch')
+    x = torch.rand(5, 3, 6, 7).round()
+
+    net = load_model(path, backend='torchscript')
+    assert isinstance(net, export_model.TorchScriptNet) and export_model.is_fresh(path, 'torchscript')
+    with torch.no_grad():
+        assert all(torch.allclose(a, b, atol=1e-5) for a, b in zip(net.forward(x), model.forward(x)))
+        flat = Game().state_flattener(Game().state)
+        assert torch.allclose(net.forward(flat)[1], model.forward(flat)[1], atol=1e-5)
+
+    # a new checkpoint makes the artifact stale
+    save_model_atomic(resnet18(), path)
+    assert not export_model.is_fresh(path, 'torchscript')
+    model = load_model(path, 'float32', 'torch')
+    backend, config.model_backend = config.model_backend, 'torchscript'
+    try:
+        manager = ModelManager(path)
+    finally:
+        config.model_backend = backend
+    assert export_model.is_fresh(path, 'torchscript')
+    with torch.no_grad():
+        assert torch.allclose(manager.model.forward(x)[1], model.forward(x)[1], atol=1e-5)
+        evaluator = BatchedEvaluator(manager.model)
+        with evaluator.client() as player:
+            tree = MCTS_NN(player, use_dirichlet=False)
+            root = tree.createNode(Game().state)
+            for _ in range(10):
+                tree.simulate(root, 1)
+    assert root.N == 10
+    assert evaluator.batches > 0 and evaluator.evaluated > 0
+
+    if importlib.util.find_spec('onnx') is None:
+        try:
+            export_model.export(path, 'onnx')
+            assert False
+        except ImportError:
+            pass
+    print("✓ exported model")
+
+
+
+def test_numpy_net():
+    """NumPy nets equal to the ResNet and the ResNet3D, exported once and loaded without torch"""
+    torch.manual_seed(0)
+    model = resnet18()
+    for module in model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2)
+    path = os.path.join(tempfile.mkdtemp(), 'model.pth')
+    torch.save(model.state_dict(), path)
+    model.eval()
+
+    net = numpy_net.load_player(path)
+    assert export_model.is_fresh(path, 'numpy')
+    flats = flatten_states([state_from_moves(moves) for moves in ['', '4', '4433', '1234567']])
+    with torch.no_grad():
+        values, policies = model.forward(torch.FloatTensor(np.array(flats, dtype=np.float32)).view(-1, 3, 6, 7))
+        value, policy = model.forward(flats[3])
+    np_values, np_policies = net.forward(flats)
+    assert np_values.dtype == np_policies.dtype == np.float32 and np_policies.shape == (4, 7)
+    assert np.allclose(np_values, values.numpy(), atol=1e-5) and np.allclose(np_policies, policies.numpy(), atol=1e-5)
+    assert np.allclose(net.forward(flats[3])[1], policy.numpy(), atol=1e-5)
+    assert isinstance(load_model(path, backend='numpy'), numpy_net.NumpyNet)
+
+    tree = MCTS_NN(net, use_dirichlet=False)
+    root = tree.createNode(Game().state)
+    for _ in range(20):
+        tree.simulate(root, 1)
+    assert root.N == 20
+
+    # a process that only plays does not import torch
+    code = ('import sys, numpy_net, MCTS_NN, MCTS_parallel; numpy_net.load_player({!r}); '
+            'assert "torch" not in sys.modules'.format(path))
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    from ResNet3D import resnet18_3d
+    from Game3D import Game3D
+    model3d = resnet18_3d()
+    model3d.eval()
+    export_model.export_numpy(model3d, os.path.join(os.path.dirname(path), 'model3d.npz'))
+    net3d = numpy_net.load(os.path.join(os.path.dirname(path), 'model3d.npz'))
+    game = Game3D()
+    game.make_move(*game.allowed_moves()[5])
+    state = np.asarray(game.get_state_vector(), dtype=np.float32)
+    with torch.no_grad():
+        value3d, policy3d = model3d.forward(state)
+    np_value3d, np_policy3d = net3d.forward(state)
+    assert np.allclose(np_value3d, value3d.numpy(), atol=1e-5) and np.allclose(np_policy3d, policy3d.numpy(), atol=1e-5)
+    print("✓ numpy net")
+
+
+if __name__ == '__main__':
+    test_quantized_model()
+    test_exported_model()
+    test_numpy_net()
@@ -0,0 +1,101 @@
+#  ================ Test for vectorized rollouts =================== #
+# Name:             test_rollout.py
+# Description:      Checks the uint64 batch rollouts against Game_bitboard
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import random
+import numpy as np
+from Game_bitboard import Game
+from Rollout_bitboard import BatchRollout, checkwin_batch, column_heights
+from MCTS import MCTS
+from main_functions import UCT_simu
+
+
+def random_states(number, seed=0):
+    """Random (possibly terminal) positions reached by random play"""
+    rand = random.Random(seed)
+    states = []
+    for _ in range(number):
+        game = Game()
+        for _ in range(rand.randint(0, 41)):
+            if game.gameover()[0]:
+                break
+            moves = game.allowed_moves()
+            game.takestep(moves[rand.randrange(len(moves))])
+        states.append(list(game.state))
+    return states
+
+
+def test_checkwin_batch_matches_game():
+    """The vectorized win check must agree with Game.checkwin"""
+    states = random_states(500)
+    game = Game()
+    for color in (0, 1):
+        boards = np.array([s[color] for s in states], dtype=np.uint64)
+        expected = np.array([game.checkwin(s[color]) != 0 for s in states])
+        assert np.array_equal(checkwin_batch(boards), expected)
+    print("✓ checkwin_batch agrees with Game.checkwin on 1000 boards")
+
+
+def test_column_heights():
+    """Heights are the number of tokens in each column"""
+    states = random_states(200, seed=1)
+    full = np.array([s[0] | s[1] for s in states], dtype=np.uint64)
+    heights = column_heights(full)
+    for state, h in zip(states, heights):
+        fullboard = state[0] | state[1]
+        expected = [bin((fullboard >> (8 * col)) & 63).count('1') for col in range(7)]
+        assert list(h) == expected
+    print("✓ column heights are correct")
+
+
+def test_batch_rollout_results():
+    """Rollouts end on legal final positions and return the right winner for terminal states"""
+    states = random_states(300, seed=2)
+    rollout = BatchRollout(np.random.default_rng(0))
+
+    for usecounter in (False, True):
+        winners = rollout.play([s[0] for s in states], [s[1] for s in states], [s[2] for s in states], usecounter)
+        assert winners.shape == (300,)
+        assert set(np.unique(winners)).issubset({-1, 0, 1})
+
+        for state, winner in zip(states, winners):
+            gameover, true_winner = Game(state).gameover()
+            if gameover:
+                assert winner == true_winner
+    print("✓ batch rollouts return valid winners")
+
+
+def test_batch_rollout_takes_the_win():
+    """With usecounter, a playout takes an immediate win"""
+    # yellow has three in the bottom row (columns 0, 1, 2), red has three tokens in column 6 : yellow to play
+    yellow = 1 | (1 << 8) | (1 << 16)
+    red = (1 << 48) | (1 << 49) | (1 << 50)
+    rollout = BatchRollout(np.random.default_rng(1))
+    winners = rollout.play(np.full(100, yellow), np.full(100, red), np.ones(100), usecounter=True)
+    assert np.all(winners == 1)
+    print("✓ counter rollouts take the win")
+
+
+def test_mcts_with_batch_rollouts():
+    """Pure MCTS runs with many playouts per leaf and with all children rolled out at once"""
+    for rollouts_per_leaf, rollout_all_children in ((16, False), (8, True)):
+        tree = MCTS(rollouts_per_leaf=rollouts_per_leaf, rollout_all_children=rollout_all_children)
+        rootnode = tree.createNode(Game().state)
+        for _ in range(20):
+            tree.simulate(rootnode, UCT_simu, 1, False)
+        assert len(rootnode.children) == 7
+        assert rootnode.N == sum(child.N for child in rootnode.children)
+        assert all(-1 <= child.Q <= 1 for child in rootnode.children)
+    print("✓ MCTS works with vectorized rollouts")
+
+
+if __name__ == '__main__':
+    test_checkwin_batch_matches_game()
+    test_column_heights()
+    test_batch_rollout_results()
+    test_batch_rollout_takes_the_win()
+    test_mcts_with_batch_rollouts()
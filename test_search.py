@@ -0,0 +1,303 @@
+#  ================ Test for the MCTS search drivers =================== #
+# Name:             test_search.py
+# Description:      Tests of root parallel search and search helpers, with an untrained NN
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+from Game_bitboard import Game
+from MCTS import MCTS
+from MCTS_NN import MCTS_NN
+from MCTS_parallel import RootParallelMCTS, merge_root_statistics
+from pondering import Ponderer, reuse_subtree
+from search_stats import SearchStats, PHASES, count_nodes
+from human_vs_ai_gui import HumanVsAIGUI
+from inference import BatchedEvaluator
+from rng import RandomStreams, game_streams, stage_seed, derive_seed
+from ResNet import resnet18
+from main_functions import UCT_simu, onevsonegame
+import os
+import pickle
+import threading
+import numpy as np
+import config
+
+
+def test_merge_root_statistics():
+    """Visits and rewards are summed per column over the trees"""
+    stats_a = {2: [10, 5.0], 3: [30, -6.0]}
+    stats_b = {2: [20, 1.0], 3: [5, 1.0], 4: [1, 0.5]}
+    merged = merge_root_statistics([stats_a, stats_b])
+
+    assert merged['cols'] == [2, 3, 4]
+    assert merged['visits'] == [30, 35, 1]
+    assert abs(merged['q_values'][0] - 0.2) < 1e-9
+    assert abs(merged['q_values'][1] + 0.142857) < 1e-5
+    assert merged['col'] == 3
+    print("✓ root statistics merged")
+
+
+def test_root_parallel_search():
+    """Two worker trees searching the same root"""
+    model = resnet18()
+    model.eval()
+    state = Game().state
+
+    search = RootParallelMCTS(model, workers=2)
+    try:
+        result = search.search(state, sim_number=20, cpuct=1)
+        assert result['cols'] == list(range(7))
+        assert result['sims'] == 40
+        # each tree visits the children of the root 19 times (first sim expands the root)
+        assert sum(result['visits']) == 2 * 19
+        assert result['col'] in result['cols']
+    finally:
+        search.close()
+
+    single = RootParallelMCTS(model, workers=1)
+    result = single.search(state, sim_number=20, cpuct=1)
+    assert sum(result['visits']) == 19
+    print("✓ root parallel search")
+
+
+def test_search_budgets():
+    """Node and wall-clock budgets, with early termination when decided"""
+    model = resnet18()
+    model.eval()
+
+    tree = MCTS_NN(model, use_dirichlet=False)
+    rootnode = tree.createNode(Game().state)
+    report = tree.search(rootnode, cpuct=1, max_sims=50)
+    assert report.stop_reason in ('sim_budget', 'decided')
+    assert report.sims <= 50
+    assert report.best_child in rootnode.children
+    if report.stop_reason == 'decided':
+        visits = sorted([child.N for child in rootnode.children], reverse=True)
+        assert visits[0] - visits[1] > 50 - report.sims
+
+    tree = MCTS()
+    rootnode = tree.createNode(Game().state)
+    report = tree.search(rootnode, UCT_simu, 1, False, max_time=0.2)
+    assert report.stop_reason in ('time_budget', 'decided')
+    assert report.elapsed < 1
+    print("✓ search budgets", report)
+
+
+def test_search_forced_moves():
+    """Forced moves stop the search after one sim"""
+    # yellow has three in the bottom row (columns 0, 1, 2) : yellow to play wins in column 3
+    yellow = 1 | (1 << 8) | (1 << 16)
+    red = (1 << 9) | (1 << 17) | (1 << 48)
+    tree = MCTS()
+    rootnode = tree.createNode([yellow, red, 1])
+    report = tree.search(rootnode, UCT_simu, 1, False, max_sims=1000)
+    assert report.stop_reason == 'forced_win'
+    assert report.sims == 1
+    assert report.best_child.move == 1 << 24
+
+    # yellow also in column 4, red to play : the only move that does not lose is column 3
+    yellow |= 1 << 32
+    rootnode = tree.createNode([yellow, red, -1])
+    report = tree.search(rootnode, UCT_simu, 1, False, max_sims=1000)
+    assert report.stop_reason == 'forced_block'
+    assert report.best_child.move == 1 << 24
+
+    # without stop_on_forced the whole budget decides
+    rootnode = tree.createNode([yellow, red, -1])
+    report = tree.search(rootnode, UCT_simu, 1, False, max_sims=30, stop_on_forced=False)
+    assert report.stop_reason in ('sim_budget', 'decided')
+
+    # terminal root
+    rootnode = tree.createNode([yellow | (1 << 24), red | (1 << 40), -1])
+    report = tree.search(rootnode, UCT_simu, 1, False, max_sims=10)
+    assert report.stop_reason == 'terminal' and report.sims == 0
+    print("✓ forced moves")
+
+
+def test_pondering():
+    """Background search from the current root, then the played subtree is kept"""
+    model = resnet18()
+    model.eval()
+
+    tree = MCTS_NN(model, use_dirichlet=False)
+    rootnode = tree.createNode(Game().state)
+    ponderer = Ponderer(lambda node: tree.simulate(node, 1), max_sims=30)
+    ponderer.start(rootnode)
+    ponderer.thread.join()
+    assert ponderer.stop() == 30
+    assert rootnode.N == 30
+
+    child = max(rootnode.children, key=lambda c: c.N)
+    visits = child.N
+    newroot = reuse_subtree(rootnode, child.move)
+    assert newroot is child and newroot.parent is None and newroot.N == visits
+
+    # sims from the new root no longer reach the old one
+    report = tree.search(newroot, cpuct=1, max_sims=10, stop_on_forced=False)
+    assert newroot.N == visits + report.sims
+    assert rootnode.N == 30
+
+    # a move never expanded has no subtree
+    assert reuse_subtree(tree.createNode(Game().state), 1) is None
+    assert reuse_subtree(None, 1) is None
+
+    # stop interrupts an unbounded ponder
+    ponderer = Ponderer(lambda node: tree.simulate(node, 1), max_sims=10 ** 9)
+    ponderer.start(newroot)
+    sims = ponderer.stop()
+    assert not ponderer.is_running()
+    assert newroot.N == visits + report.sims + sims
+    print("✓ pondering", sims, "sims before stop")
+
+
+class CountingPlayer:
+    # NN player counting its evaluations
+    def __init__(self):
+        self.net = resnet18()
+        self.net.eval()
+        self.calls = 0
+
+    def eval(self):
+        return self
+
+    def forward(self, x):
+        self.calls += 1
+        return self.net.forward(x)
+
+
+class NoWidget:
+    # Tk root and labels of a GUI run without a display
+    def after(self, delay, callback):
+        callback()
+
+    def config(self, **options):
+        pass
+
+
+def test_gui_pondering_after_reload():
+    """The GUI ponders with the reloaded model, in a new tree"""
+    old, new = CountingPlayer(), CountingPlayer()
+    gui = HumanVsAIGUI.__new__(HumanVsAIGUI)
+    gui.root = gui.status_label = NoWidget()
+    gui.game, gui.model, gui.new_model = Game(), old, None
+    gui.ponder, gui.parallel_workers, gui.game_active = True, 1, True
+    gui.tree = gui.search_root = gui.ponderer = gui.parallel_search = None
+
+    max_sims, config.ponder_max_sims = config.ponder_max_sims, 20
+    try:
+        gui.start_pondering()
+        gui.ponderer.thread.join()
+        gui.stop_pondering()
+        assert old.calls > 0 and gui.search_root.N == 20
+
+        gui.model_swapped(new, 'v2')
+        gui.use_new_model()
+        calls = old.calls
+        gui.start_pondering()
+        gui.ponderer.thread.join()
+        gui.stop_pondering()
+    finally:
+        config.ponder_max_sims = max_sims
+    assert old.calls == calls and new.calls > 0
+    assert gui.tree.player is new and gui.search_root.N == 20
+    print("✓ gui pondering after reload")
+
+
+def test_search_stats():
+    """Per-phase counters of instrumented sims, merged across trees"""
+    model = resnet18()
+    model.eval()
+
+    plain = MCTS_NN(model, use_dirichlet=False)
+    assert plain.stats is None
+
+    stats = SearchStats()
+    tree = MCTS_NN(model, use_dirichlet=False, stats=stats)
+    rootnode = tree.createNode(Game().state)
+    for _ in range(50):
+        tree.simulate(rootnode, 1)
+    stats.end_move(rootnode)
+
+    assert stats.sims == 50 and rootnode.N == 50
+    assert stats.calls['selection'] == stats.calls['eval'] == stats.calls['backfill'] == 50
+    assert stats.nn_calls + stats.terminal_leaves == 50 and stats.calls['expand'] == stats.nn_calls
+    assert stats.nodes_created == count_nodes(rootnode) - 1 == stats.max_tree_nodes - 1
+    assert 1 <= stats.max_depth and stats.depth_total >= 49
+    assert all(stats.seconds[phase] > 0 for phase in PHASES)
+
+    merged = SearchStats().merge(SearchStats.from_dict(stats.to_dict())).merge(stats)
+    summary = merged.summary()
+    assert summary['sims'] == 100 and summary['moves'] == 2 and summary['meanBatchSize'] == 1
+    assert abs(sum(row['share'] for row in summary['phases'].values()) - 1) < 1e-9
+    assert 'selection' in merged.format_summary()
+
+    # searches batched together : the size of the forward passes comes from the evaluator
+    evaluator = BatchedEvaluator(model)
+    batched = SearchStats()
+    lock = threading.Lock()
+
+    def search():
+        with evaluator.client() as player:
+            stats = SearchStats()
+            tree = MCTS_NN(player, use_dirichlet=False, stats=stats)
+            rootnode = tree.createNode(Game().state)
+            for _ in range(20):
+                tree.simulate(rootnode, 1)
+        with lock:
+            batched.merge(stats)
+
+    searches = [threading.Thread(target=search) for _ in range(4)]
+    for thread in searches:
+        thread.start()
+    for thread in searches:
+        thread.join()
+    assert 1 < batched.summary()['meanBatchSize'] <= 4 and max(batched.batch_sizes) <= 4
+    print("✓ search stats")
+
+
+def test_seeded_streams():
+    """Same streams, same searches and games ; no seed, streams from the OS"""
+    model = resnet18()
+    model.eval()
+
+    def visits(streams):
+        tree = MCTS_NN(model, use_dirichlet=True, rng=streams)
+        rootnode = tree.createNode(Game().state)
+        for _ in range(60):
+            tree.simulate(rootnode, 1)
+        return [child.N for child in rootnode.children]
+
+    assert visits(RandomStreams(7)) == visits(RandomStreams(7))
+    assert game_streams(None, 0, 0).seed_sequence.entropy != game_streams(None, 0, 0).seed_sequence.entropy
+    assert game_streams(3, 0, 1).seed_sequence.entropy == game_streams(3, 0, 1).seed_sequence.entropy
+    assert derive_seed(None, 1, 2) is None and derive_seed(5, 1, 2) == derive_seed(5, 1, 2) != derive_seed(5, 2, 1)
+    saved_seed = config.seed
+    config.seed = None
+    assert stage_seed(0, 0) is None
+    config.seed = saved_seed
+
+    saved = config.SIM_NUMBER, config.sim_number_defense
+    config.SIM_NUMBER = config.sim_number_defense = 10
+    games = []
+    try:
+        for _ in range(2):
+            onevsonegame(model, 10, model, 10, 'player1', 1, 1, 30, True, '_test', RandomStreams([1, 2, 3]))
+            with open('./data/createdata_test.txt', 'rb') as file:
+                games.append(pickle.load(file)['data'][0])
+    finally:
+        config.SIM_NUMBER, config.sim_number_defense = saved
+        os.remove('./data/createdata_test.txt')
+    assert np.array_equal(games[0], games[1])
+    print("✓ seeded streams")
+
+
+if __name__ == '__main__':
+    test_merge_root_statistics()
+    test_root_parallel_search()
+    test_search_budgets()
+    test_search_forced_moves()
+    test_pondering()
+    test_gui_pondering_after_reload()
+    test_search_stats()
+    test_seeded_streams()
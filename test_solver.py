@@ -0,0 +1,123 @@
+#  ================ Test for the solver and the position suite =================== #
+# Name:             test_solver.py
+# Description:      Tests of the exact solver against a full minimax, and of the
+#                   position suite runner with an untrained NN
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import os
+import random
+import tempfile
+from functools import lru_cache
+from Game_bitboard import Game
+from ResNet import resnet18
+from positions import state_from_moves
+from rng import RandomStreams
+import position_suite
+import solver
+
+
+# full minimax with the same scores as the solver
+@lru_cache(maxsize=None)
+def minimax(yellow, red, turn):
+    game = Game([yellow, red, turn])
+    moves = bin(yellow | red).count('1')
+    best = None
+    for move in game.allowed_moves():
+        state = game.nextstate(move)
+        over, winner = Game(state).gameover()
+        if over:
+            score = (solver.SIZE + 1 - moves) // 2 if winner != 0 else 0
+        else:
+            score = -minimax(*state)
+        best = score if best is None else max(best, score)
+    return best
+
+
+def random_endgame(rand, stones):
+    while True:
+        game = Game()
+        for _ in range(stones):
+            game.takestep(rand.choice(game.allowed_moves()))
+            if game.gameover()[0]:
+                break
+        else:
+            return game.state
+
+
+def test_solver():
+    """Solver scores equal to a full minimax, for positions and for each of their columns"""
+    rand = random.Random(0)
+    immediate_wins = 0
+    for _ in range(10):
+        state = random_endgame(rand, rand.randint(33, 37))
+        score = minimax(*state)
+        assert solver.Solver().solve(state) == score
+
+        game = Game(state)
+        scores = solver.Solver().column_scores(state)
+        for move in game.allowed_moves():
+            child = game.nextstate(move)
+            over, winner = Game(child).gameover()
+            expected = -minimax(*child) if not over else (score if winner != 0 else 0)
+            assert scores[game.convert_move_to_col_index(move)] == expected
+        assert max(score for score in scores if score is not None) == score
+        assert all(scores[col] == score for col in solver.best_columns(scores))
+        immediate_wins += solver.can_win_next(*solver.from_state(state)[:2])
+    assert immediate_wins > 0
+    print("✓ solver")
+
+
+def test_position_suite():
+    """Records solved, saved and filtered, and engines scored against them"""
+    rng = RandomStreams(1)
+    records = []
+    while len(records) < 3:
+        moves = position_suite.random_moves(rng, 20)
+        if moves is None:
+            continue
+        record = position_suite.solve_record(moves, 'middle')
+        record['id'] = 'middle-{}'.format(len(records))
+        assert record['scores'][record['bestCols'][0]] == record['score']
+        records.append(record)
+
+    path = os.path.join(tempfile.mkdtemp(), 'suite.jsonl')
+    position_suite.save_suite(records, path)
+    assert position_suite.load_suite(path) == records
+    assert len(position_suite.load_suite(path, phase='middle', limit=1)) == len({r['difficulty'] for r in records})
+    assert position_suite.load_suite(path, phase='opening') == []
+
+    model = resnet18()
+    model.eval()
+    for engine in ['solver', 'nn', 'mcts_nn:10', 'mcts:20']:
+        results = position_suite.run_engine(engine, records, model, parallel=2)
+        summary = position_suite.score_results(records, results)
+        assert summary['all']['positions'] == 3
+        assert sum(row['positions'] for group, row in summary.items() if group != 'all') == 3
+        if engine == 'solver':
+            assert summary['all']['accuracy'] == 1 and summary['all']['valueError'] == 0
+        assert engine in position_suite.format_summary(engine, summary)
+    print("✓ position suite")
+
+
+def test_suite_file():
+    """The shipped suite covers every phase and difficulty, with consistent solutions"""
+    records = position_suite.load_suite()
+    groups = {(record['phase'], record['difficulty']) for record in records}
+    assert groups == {(row[0], level) for row in position_suite.PHASES for level in position_suite.DIFFICULTIES}
+    assert len({record['moves'] for record in records}) == len(records)
+    for record in records:
+        assert max(score for score in record['scores'] if score is not None) == record['score']
+        assert record['difficulty'] == position_suite.difficulty(record['phase'], record['nodes'])
+    # endgames are quick to solve again
+    for record in [record for record in records if record['phase'] == 'endgame'][:20]:
+        assert solver.Solver().solve(state_from_moves(record['moves'])) == record['score']
+    print("✓ suite file", len(records), "positions")
+
+
+if __name__ == '__main__':
+    test_solver()
+    test_position_suite()
+    test_suite_file()
@@ -0,0 +1,274 @@
+#  ================ Test for the training tools =================== #
+# Name:             test_training.py
+# Description:      Tests of the tools around the training loop (tracing), with an untrained NN
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+import json
+import os
+import tempfile
+import time
+from multiprocessing import Process
+import numpy as np
+import torch
+import config
+import tracing
+import profiling
+import checkpoint
+import threads
+import distributed_training
+import precision
+import check_precision
+from ResNet import resnet18, ResNet_Training
+
+
+def traced_worker(index):
+    tracing.start_worker('worker {}'.format(index))
+    with tracing.span('game', 'self-play', index=index):
+        pass
+    tracing.flush()
+
+
+def busy_worker(seconds):
+    start = time.process_time()
+    while time.process_time() - start < seconds:
+        sum(range(1000))
+
+
+def test_tracing():
+    """Spans of the main process and of forked workers merged into one Chrome trace"""
+    trace_dir = tempfile.mkdtemp()
+    assert tracing.span('off') is tracing.NO_SPAN
+
+    use_cuda, config.use_cuda = config.use_cuda, False
+    tracing.start(trace_dir)
+    try:
+        with tracing.span('self-play', 'main'):
+            procs = [Process(target=traced_worker, args=(i,)) for i in range(2)]
+            for proc in procs:
+                proc.start()
+            for proc in procs:
+                proc.join()
+
+        data = np.random.rand(2 * config.MINIBATCH, 3 * config.H * config.L + config.L + 1)
+        ResNet_Training(resnet18(), config.MINIBATCH, 1, 0.01, data, data, 0).trainNet()
+        tracing.flush()
+        path = tracing.merge()
+    finally:
+        tracing.enabled = False
+        config.use_cuda = use_cuda
+
+    with open(path) as file:
+        events = json.load(file)['traceEvents']
+    names = {event['args']['name'] for event in events if event['ph'] == 'M'}
+    assert names == {'main', 'worker 0', 'worker 1'}
+    games = [event for event in events if event['name'] == 'game']
+    assert len(games) == 2 and len({event['pid'] for event in games}) == 2
+    main_span = [event for event in events if event['name'] == 'self-play'][0]
+    assert all(main_span['ts'] <= game['ts'] <= main_span['ts'] + main_span['dur'] for game in games)
+    assert len([event for event in events if event['name'] == 'train step']) == 2
+    assert [event['name'] for event in events if event['ph'] == 'C'] == ['train loss'] * 2
+    assert len(os.listdir(trace_dir)) == 4
+    print("✓ tracing")
+
+
+
+def test_profiling():
+    """Worker profiles of both modes merged into one report with collapsed stacks"""
+    directory = tempfile.mkdtemp()
+    assert profiling.target(busy_worker, mode=None) is busy_worker
+
+    for mode in ['cprofile', 'sampling']:
+        procs = [Process(target=profiling.target(busy_worker, mode, directory), args=(0.2,)) for _ in range(2)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+
+    report = profiling.merge_profiles(directory)
+    assert 'cProfile of 2 workers' in report and 'sampling profile of 2 workers' in report
+    assert 'busy_worker' in report
+
+    stacks = profiling.read_collapsed([os.path.join(directory, 'merged.collapsed')])
+    assert all(stack.startswith('test_training.py:busy_worker') for stack in stacks)
+    table = profiling.sample_table(stacks)
+    assert table[0][0] == 'test_training.py:busy_worker' and table[0][2] == sum(stacks.values())
+
+    profiling.clear_profiles(directory)
+    assert os.listdir(directory) == []
+    print("✓ profiling")
+
+
+def test_run_checkpoint():
+    """Atomic run checkpoints : order, pruning, random generators and optimizer momentum"""
+    directory = tempfile.mkdtemp()
+    model = resnet18()
+    data = np.random.rand(2 * config.MINIBATCH, 3 * config.H * config.L + config.L + 1)
+
+    use_cuda, config.use_cuda = config.use_cuda, False
+    try:
+        first = ResNet_Training(model, config.MINIBATCH, 1, 0.01, data, data, 0)
+        first.trainNet()
+        optimizer_state = first.optimizer.state_dict()
+
+        # by default every training starts with a new optimizer, as without checkpoints
+        weights = []
+        for state in [None, optimizer_state]:
+            torch.manual_seed(1)
+            copy = resnet18()
+            copy.load_state_dict(model.state_dict())
+            ResNet_Training(copy, config.MINIBATCH, 1, 0.005, data, data, 0, state).trainNet()
+            weights.append(copy.state_dict())
+        assert all(torch.equal(weights[0][key], weights[1][key]) for key in weights[0])
+
+        carry, config.carry_optimizer_state = config.carry_optimizer_state, True
+        try:
+            second = ResNet_Training(model, config.MINIBATCH, 1, 0.005, data, data, 0, optimizer_state)
+            second.trainNet()
+        finally:
+            config.carry_optimizer_state = carry
+    finally:
+        config.use_cuda = use_cuda
+    assert all(group['lr'] == 0.005 for group in second.optimizer.param_groups)
+    assert all('momentum_buffer' in state for state in second.optimizer.state_dict()['state'].values())
+
+    state = {'model': model.state_dict(), 'optimizer': optimizer_state, 'elos': [0, 120], 'total_improved': 1,
+             'getbreak': 0, 'dataseen': data}
+    for iteration, stage in [(0, checkpoint.SELF_PLAY), (0, checkpoint.END), (1, checkpoint.SELF_PLAY)]:
+        path = checkpoint.save_checkpoint(state, iteration, stage, directory, keep=2)
+    assert [os.path.basename(path) for path in checkpoint.list_checkpoints(directory)] == \
+        ['run_00000_end.pt', 'run_00001_selfplay.pt']
+    assert checkpoint.latest_checkpoint(directory) == path
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+    draw = np.random.rand()
+    loaded = checkpoint.load_checkpoint(path)
+    assert np.random.rand() == draw
+    assert loaded['iteration'] == 1 and loaded['stage'] == checkpoint.SELF_PLAY and loaded['elos'] == [0, 120]
+    assert np.array_equal(loaded['dataseen'], data)
+    assert all(torch.equal(loaded['model'][key], value) for key, value in model.state_dict().items())
+    print("✓ run checkpoints")
+
+
+def test_training_tensors():
+    """Training set converted once to float32 tensors, seeded minibatches reproducible"""
+    data = np.random.rand(3 * config.MINIBATCH + 5, 3 * config.H * config.L + config.L + 1)
+    weights = []
+    use_cuda, config.use_cuda = config.use_cuda, False
+    try:
+        for _ in range(2):
+            torch.manual_seed(0)
+            model = resnet18()
+            training = ResNet_Training(model, config.MINIBATCH, 2, 0.01, data, None, 0)
+            training.trainNet()
+            weights.append(model.state_dict())
+    finally:
+        config.use_cuda = use_cuda
+
+    assert training.inputs.dtype == training.probas.dtype == training.reward.dtype == torch.float32
+    assert training.inputs.shape == (data.shape[0], 3, config.H, config.L) and training.inputs.is_contiguous()
+    assert torch.equal(training.inputs[4].flatten(), torch.as_tensor(data[4, :3 * config.H * config.L], dtype=torch.float32))
+    assert training.probas.shape == (data.shape[0], config.L) and training.reward.shape == (data.shape[0], 1)
+    assert float(training.reward[7]) == np.float32(data[7, -1])
+    assert all(torch.equal(weights[0][key], weights[1][key]) for key in weights[0])
+    print("✓ training tensors")
+
+
+def test_thread_budgets():
+    """Budgets of each phase from the config or the machine, restored after a phase, pinning only on demand"""
+    saved = (config.threads_self_play, config.threads_training, config.threads_serving, config.pin_workers,
+             torch.get_num_threads())
+    try:
+        config.threads_self_play = config.threads_training = config.threads_serving = None
+        cores = len(threads.available_cores())
+        assert threads.budget('self_play') == 1
+        assert threads.budget('training') == cores
+        assert threads.budget('serving') == max(1, cores // config.api_workers)
+
+        config.threads_training = 3
+        torch.set_num_threads(1)
+        with threads.phase('training'):
+            assert torch.get_num_threads() == 3
+        assert torch.get_num_threads() == 1
+
+        config.pin_workers = False
+        assert not threads.pin(0)
+        if hasattr(os, 'sched_setaffinity'):
+            affinity = os.sched_getaffinity(0)
+            config.pin_workers = True
+            try:
+                assert threads.pin(0) and len(os.sched_getaffinity(0)) == 1
+            finally:
+                os.sched_setaffinity(0, affinity)
+    finally:
+        (config.threads_self_play, config.threads_training, config.threads_serving, config.pin_workers,
+         threads_count) = saved
+        torch.set_num_threads(threads_count)
+    print("✓ thread budgets")
+
+
+def test_distributed_training():
+    """Two gloo processes train the player in place and give back an optimizer state it can resume with"""
+    data = np.random.rand(2 * 3 * config.MINIBATCH + 1, 3 * config.H * config.L + config.L + 1)
+    epochs, config.EPOCHS = config.EPOCHS, 1
+    try:
+        torch.manual_seed(0)
+        model = resnet18()
+        before = {key: value.clone() for key, value in model.state_dict().items()}
+        optimizer_state, samples_per_sec = distributed_training.train(model, data, 0.01, processes=2)
+        assert samples_per_sec > 0
+        assert model.state_dict().keys() == before.keys()
+        assert any(not torch.equal(before[key], model.state_dict()[key]) for key in before)
+        assert len(optimizer_state['state']) == len(list(model.parameters()))
+
+        use_cuda, config.use_cuda = config.use_cuda, False
+        try:
+            ResNet_Training(model, config.MINIBATCH, 1, 0.01, data, None, 0, optimizer_state).trainNet()
+        finally:
+            config.use_cuda = use_cuda
+
+        try:
+            distributed_training.train(model, data[:config.MINIBATCH], 0.01, processes=2)
+            assert False
+        except ValueError:
+            pass
+    finally:
+        config.EPOCHS = epochs
+    print("✓ distributed training")
+
+
+def test_precision_modes():
+    """Reduced precision nets close to float32 in the MCTS and the guard, bfloat16 autocast training"""
+    torch.manual_seed(0)
+    model = resnet18()
+    model.eval()
+    assert precision.for_inference(model, 'float32') is model
+    flats = check_precision.suite_flats(limit=2)
+    for mode in ['bfloat16', 'float16']:
+        net = precision.for_inference(model, mode)
+        assert precision.model_bytes(net) < 0.51 * precision.model_bytes(model)
+        assert next(model.parameters()).dtype == torch.float32
+        value, policy = net.forward(flats[0])
+        assert value.dtype == policy.dtype == torch.float32 and policy.shape == (1, config.L)
+        result = check_precision.compare(model, flats, mode)
+        assert result['ok'] and result['positions'] == len(flats)
+    try:
+        precision.for_inference(model, 'int4')
+        assert False
+    except ValueError:
+        pass
+
+    assert check_precision.training_samples_per_sec('bfloat16', batches=2) > 0
+    print("✓ precision modes")
+
+
+if __name__ == '__main__':
+    test_tracing()
+    test_profiling()
+    test_run_checkpoint()
+    test_training_tensors()
+    test_thread_budgets()
+    test_distributed_training()
+    test_precision_modes()
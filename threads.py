@@ -0,0 +1,85 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             threads.py
+# Description:      Intra-op thread budgets of torch for each phase of a run (self-play
+#                   workers, training, serving), and core affinity of the workers
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Budgets (config.threads_self_play, threads_training, threads_serving), None for the default of the machine :
+#   self_play   1 thread per worker process : the workers already fill the cores (config.CPUS of them)
+#   training    every core available to the process, for the single learner
+#   serving     the cores shared out between the config.api_workers server processes
+#
+# Main.py runs its self-play, gating and Elo stages with the self-play budget (the workers are forked from a
+# process with a single thread) and the training with the training budget. A worker calls worker(index)
+# first : with config.pin_workers it is also pinned to one core (Linux only, elsewhere the OS places it).
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+from contextlib import contextmanager
+import os
+import sys
+import config
+# ============================================================================ #
+
+PHASES = ['self_play', 'training', 'serving']
+
+
+# ---------------------------------------------------------------------------- #
+# cores this process may run on (its affinity where the OS tells it, e.g. in a container)
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+# ---------------------------------------------------------------------------- #
+# threads of a phase : the config value, or the default of the machine when it is None
+def budget(phase):
+    value = {'self_play': config.threads_self_play, 'training': config.threads_training,
+             'serving': config.threads_serving}[phase]
+    if value is None:
+        cores = len(available_cores())
+        value = {'self_play': 1, 'training': cores, 'serving': cores // max(config.api_workers, 1)}[phase]
+    return max(1, int(value))
+
+
+# ---------------------------------------------------------------------------- #
+# sets the budget of phase, returns the previous thread count. Only once torch is loaded : a process playing
+# with numpy_net.py does not import it (None is returned)
+def use(phase):
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return None
+    previous = torch.get_num_threads()
+    torch.set_num_threads(budget(phase))
+    return previous
+
+
+@contextmanager
+def phase(name):
+    previous = use(name)
+    try:
+        yield
+    finally:
+        if previous is not None:
+            sys.modules['torch'].set_num_threads(previous)
+
+
+# ---------------------------------------------------------------------------- #
+# pins this process to one of the available cores, chosen by index (an int). False when it is not done
+def pin(index):
+    if not config.pin_workers or not hasattr(os, 'sched_setaffinity') or not isinstance(index, int):
+        return False
+    cores = available_cores()
+    os.sched_setaffinity(0, {cores[index % len(cores)]})
+    return True
+
+
+# first call of a self-play / tournament worker process
+def worker(index):
+    use('self_play')
+    pin(index)
@@ -0,0 +1,168 @@
+#  ================ AlphaZero algorithm for Connect 4 game =================== #
+# Name:             tracing.py
+# Description:      Timeline of a training run as Chrome trace events : spans recorded
+#                   by the main process and by every worker, merged into one JSON file
+# Authors:          Jean-Philippe Bruneton & Adèle Douin & Vincent Reverdy
+# Date:             2018
+# License:          BSD 3-Clause License
+# ============================================================================ #
+
+# Usage (Main.py does it when config.trace is set) :
+#
+#   tracing.start('./traces')                  in the main process
+#   tracing.start_worker('worker 3')           first thing in a multiprocessing.Process target
+#   with tracing.span('game', 'self-play', whostarts='player1'): ...
+#   tracing.flush()                            end of the worker (or of an iteration in the main process)
+#   tracing.merge()                            -> ./traces/trace.json
+#
+# trace.json opens in chrome://tracing or https://ui.perfetto.dev. Each process writes its own file
+# trace_<pid>_<time>_<n>.json so that workers never share a file ; timestamps are wall-clock so that the
+# processes line up. When tracing is off, span() returns a shared no-op context.
+
+
+# ================================= PREAMBLE ================================= #
+# Packages
+import glob
+import json
+import os
+import threading
+import time
+# ============================================================================ #
+
+enabled = False
+detailed = False # spans of every NN forward of the searches (large traces)
+directory = None
+events = []
+label = None
+flushes = 0
+
+
+# ---------------------------------------------------------------------------- #
+def now_us():
+    return time.time() * 1e6
+
+
+def thread_id():
+    return threading.get_ident() % (1 << 31)
+
+
+# =============================== CLASS: Span ================================ #
+# complete event ('X') recorded when the with block exits
+class Span:
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = now_us()
+        return self
+
+    def __exit__(self, *exc):
+        event = {'name': self.name, 'cat': self.cat, 'ph': 'X', 'ts': self.start, 'dur': now_us() - self.start,
+                 'pid': os.getpid(), 'tid': thread_id()}
+        if self.args:
+            event['args'] = self.args
+        events.append(event)
+        return False
+
+
+class NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NO_SPAN = NoSpan()
+
+# ============================================================================ #
+
+
+# ---------------------------------------------------------------------------- #
+# enables tracing in this process and the processes it forks. Old trace files of trace_dir are removed
+def start(trace_dir, detail=False, name='main'):
+    global enabled, detailed, directory
+    os.makedirs(trace_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(trace_dir, 'trace_*.json')):
+        os.remove(path)
+    enabled = True
+    detailed = detail
+    directory = trace_dir
+    start_worker(name)
+
+
+# ---------------------------------------------------------------------------- #
+# a forked worker drops the events inherited from its parent and names its process in the timeline
+def start_worker(name):
+    global label
+    if not enabled:
+        return
+    del events[:]
+    label = name
+
+
+# ---------------------------------------------------------------------------- #
+def span(name, cat='', **args):
+    if not enabled:
+        return NO_SPAN
+    return Span(name, cat, args)
+
+
+# span of the detailed level (config.trace_nn)
+def detail_span(name, cat='', **args):
+    if not detailed:
+        return NO_SPAN
+    return Span(name, cat, args)
+
+
+# span from start (now_us() taken earlier) to now, for blocks too long for a with statement
+def complete(name, cat, start, **args):
+    if enabled:
+        events.append({'name': name, 'cat': cat, 'ph': 'X', 'ts': start, 'dur': now_us() - start,
+                       'pid': os.getpid(), 'tid': thread_id(), 'args': args})
+
+
+def instant(name, cat='', **args):
+    if enabled:
+        events.append({'name': name, 'cat': cat, 'ph': 'i', 's': 'p', 'ts': now_us(), 'pid': os.getpid(),
+                       'tid': thread_id(), 'args': args})
+
+
+# values plotted as a graph (e.g. the training loss)
+def counter(name, **values):
+    if enabled:
+        events.append({'name': name, 'ph': 'C', 'ts': now_us(), 'pid': os.getpid(), 'args': values})
+
+
+# ---------------------------------------------------------------------------- #
+# writes the events recorded since the last flush to a file of this process
+def flush():
+    global flushes
+    if not enabled or not events:
+        return None
+    # each file carries the name of its process
+    metadata = [{'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0, 'args': {'name': label}}]
+    path = os.path.join(directory, 'trace_{}_{}_{}.json'.format(os.getpid(), int(time.time() * 1e6), flushes))
+    with open(path, 'w') as file:
+        json.dump(metadata + events, file)
+    flushes += 1
+    del events[:]
+    return path
+
+
+# ---------------------------------------------------------------------------- #
+# all the trace files of trace_dir (the directory of start() by default) as one Chrome trace
+def merge(trace_dir=None, output=None):
+    if trace_dir is None:
+        trace_dir = directory
+    if output is None:
+        output = os.path.join(trace_dir, 'trace.json')
+    merged = []
+    for path in sorted(glob.glob(os.path.join(trace_dir, 'trace_*.json'))):
+        with open(path) as file:
+            merged += json.load(file)
+    with open(output, 'w') as file:
+        json.dump({'traceEvents': merged, 'displayTimeUnit': 'ms'}, file)
+    return output